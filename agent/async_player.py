@@ -0,0 +1,208 @@
+"""
+Players whose decisions run on a bounded thread pool instead of poke-env's
+event loop, so encoding and inference for one battle never stall the
+websocket traffic of the others. Decisions that take longer than
+decision_timeout (or fail) fall back to fallback_move().
+"""
+
+import abc
+import asyncio
+import logging
+import time
+import torch
+import torch.nn as nn
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Optional
+
+from poke_env.environment.battle import Battle
+from poke_env.player import Player
+from poke_env.player.battle_order import BattleOrder
+
+from agent.model import DATA_PATH, get_encoder
+from agent.model.feature_encoder import ENCODING_FEATURES
+from agent.model.timestep_encoder import TimestepEncoder
+from agent.model.sparse import SparseFeaturizer
+from agent.tracing import span
+from agent.vector_env import ACTION_SPACE_SIZE, best_order
+
+
+class AsyncPlayer(Player):
+    """
+    A decision is split in three:
+
+        prepare(battle)         on the loop, copies what decide needs out of the battle
+        decide(inputs)          on `executor` (by default `max_workers` threads,
+                                torch releases the GIL while it computes)
+        to_order(battle, out)   on the loop, turns the output into an order
+
+    decide() never sees the battle, which poke-env keeps updating once a
+    decision timed out and the fallback was sent. A timed out decision that
+    did not start yet is dropped. One that is running can not be stopped,
+    so past `max_pending` unfinished decisions new ones fall back right away
+    instead of queuing behind them.
+
+    An executor shared by several players bounds the decision work of all
+    of them.
+    """
+
+    def __init__(
+        self,
+        *args,
+        executor: Optional[Executor] = None,
+        max_workers: int = 4,
+        max_pending: Optional[int] = None,
+        decision_timeout: float = 5.0,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.executor = executor or ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'{self.username}-decide')
+        self.max_pending = max_pending or 4 * max_workers
+        self.decision_timeout = decision_timeout
+
+        self.pending = 0                                        # submitted and not finished, only changed on the loop
+        self.decisions = 0
+        self.fallbacks = 0
+        self.decision_time = 0.0
+
+    @abc.abstractmethod
+    def prepare(self, battle: Battle) -> Any:
+        pass
+
+    @abc.abstractmethod
+    def decide(self, inputs: Any) -> Any:
+        pass
+
+    def to_order(self, battle: Battle, output: Any) -> BattleOrder:
+        return output
+
+    def fallback_move(self, battle: Battle) -> BattleOrder:
+        return self.choose_random_move(battle)
+
+    def choose_move(self, battle: Battle):
+        return self._choose_move(battle)
+
+    async def _choose_move(self, battle: Battle) -> BattleOrder:
+        start = time.perf_counter()
+
+        if self.pending >= self.max_pending:
+            self.logger.warning('%d decisions still running, using the fallback move for %s', self.pending, battle.battle_tag)
+            order = self._fallback(battle)
+        else:
+            order = await self._decide_order(battle)
+
+        self.decisions += 1
+        self.decision_time += time.perf_counter() - start
+        return order
+
+    async def _decide_order(self, battle: Battle) -> BattleOrder:
+        loop = asyncio.get_running_loop()
+        try:
+            decision = self.executor.submit(self._decide, battle.battle_tag, self.prepare(battle))
+        except Exception:
+            self.logger.exception('Decision for %s failed, using the fallback move', battle.battle_tag)
+            return self._fallback(battle)
+
+        self.pending += 1
+        decision.add_done_callback(lambda _: loop.call_soon_threadsafe(self._decision_done))
+
+        try:
+            # cancelling the wrapper on timeout cancels the decision if it did not start
+            output = await asyncio.wait_for(asyncio.wrap_future(decision), self.decision_timeout)
+            return self.to_order(battle, output)
+        except asyncio.TimeoutError:
+            self.logger.warning('Decision for %s timed out after %.1fs, using the fallback move', battle.battle_tag, self.decision_timeout)
+        except Exception:
+            self.logger.exception('Decision for %s failed, using the fallback move', battle.battle_tag)
+        return self._fallback(battle)
+
+    def _decide(self, battle_tag: str, inputs: Any) -> Any:
+        with span('decide', battle_tag):
+            return self.decide(inputs)
+
+    def _decision_done(self):
+        self.pending -= 1
+
+    def _fallback(self, battle: Battle) -> BattleOrder:
+        self.fallbacks += 1
+        return self.fallback_move(battle)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class PolicyNetwork(nn.Module):
+    """
+    A TimestepEncoder of its own and a head over its encoding, so the
+    learnable embeddings are saved, copied and loaded (state_dict) together
+    with the head.
+    """
+
+    def __init__(self, encoder: Optional[TimestepEncoder] = None, head: Optional[nn.Module] = None):
+        super(PolicyNetwork, self).__init__()
+        self.encoder = encoder if encoder is not None else TimestepEncoder(DATA_PATH)
+        self.head = head if head is not None else nn.Linear(ENCODING_FEATURES, ACTION_SPACE_SIZE)
+
+    def forward(self, encoding: torch.Tensor) -> torch.Tensor:
+        return self.head(encoding)
+
+
+class PolicyPlayer(AsyncPlayer):
+    """
+    Plays the legal action with the highest logit of `policy`. The battle is
+    featurized on the loop and encoded with forward_sparse() on the workers,
+    which keeps no state, so one encoder can be shared by every thread.
+
+    A PolicyNetwork encodes with its own encoder, other policies with
+    `encoder` (the process' shared one by default).
+    """
+
+    def __init__(self, policy: nn.Module, *args, encoder=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.policy = policy
+        if encoder is None:
+            encoder = policy.encoder if isinstance(policy, PolicyNetwork) else get_encoder()
+        self.encoder = encoder
+        self.featurizer = SparseFeaturizer(self.encoder.lookup)
+
+    def prepare(self, battle: Battle):
+        with span('featurize'):
+            return self.featurizer.featurize_batch([battle])
+
+    def decide(self, features):
+        with torch.no_grad():
+            encoding = self.encoder.forward_sparse(features).float()
+            with span('policy'):
+                return self.policy(encoding)[0].numpy()
+
+    def to_order(self, battle: Battle, logits) -> BattleOrder:
+        return best_order(self, logits, battle)
+
+
+def policy_player(state_dict: Optional[dict] = None, *args, **kwargs) -> PolicyPlayer:
+    """
+    PolicyPlayer of a new PolicyNetwork loaded from `state_dict` (random
+    weights if None). The network holds the memory-mapped lookup and can
+    not be pickled, functools.partial(policy_player, state_dict) can.
+    """
+    network = PolicyNetwork()
+    if state_dict is not None:
+        network.load_state_dict(state_dict)
+    return PolicyPlayer(network, *args, **kwargs)
+
+
+if __name__ == '__main__':
+    from poke_env import RandomPlayer
+    from agent.teams import team_1, team_2
+
+    player = PolicyPlayer(
+        PolicyNetwork(),
+        battle_format='gen9ou', team=team_1, max_concurrent_battles=16, decision_timeout=2.0, log_level=logging.WARNING,
+    )
+    random_player = RandomPlayer(battle_format='gen9ou', team=team_2, max_concurrent_battles=16)
+
+    n_battles = 16
+    asyncio.run(player.battle_against(random_player, n_battles=n_battles))
+
+    print(f'won {player.n_won_battles} / {n_battles}, {player.decisions} decisions, '
+          f'{player.fallbacks} fallbacks, {1000 * player.decision_time / max(player.decisions, 1):.1f} ms per decision')
+    player.close()
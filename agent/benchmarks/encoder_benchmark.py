@@ -0,0 +1,177 @@
+"""
+Micro-benchmarks for the TimestepEncoder on offline fixture battles.
+
+    python -m agent.benchmarks.encoder_benchmark --batch-size 32 --json results.json
+
+Reports encodes/sec for single, batched and incremental encoding, the latency
+of each section of the encoding and the number of allocations per encode.
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+import torch
+from pathlib import Path
+from typing import Callable, Dict
+from torch.profiler import profile, ProfilerActivity
+
+from agent.benchmarks.fixtures import SCENARIOS, make_battle, make_battles
+from agent.model.timestep_encoder import TimestepEncoder
+from agent.model.feature_encoder import features_to_tensors, pokemon_rows, SPECIES_FEATURES, ENCODING_FEATURES
+from agent.model.featurizer import flatten_pokemon, BATTLE_FEATURES
+
+
+DATA_PATH = Path(__file__).parents[2] / 'data'
+
+
+def measure(fn: Callable, iterations: int, warmup: int = 5) -> float:
+    """Mean seconds per call."""
+    for _ in range(warmup):
+        fn()
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def count_allocations(fn: Callable) -> Dict[str, int]:
+    """Tensor allocations (torch profiler) and python / numpy allocations (tracemalloc) of one call."""
+    fn()
+
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        fn()
+    tensors = sum(1 for event in prof.events() if event.cpu_memory_usage > 0)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    fn()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    python = sum(max(stat.count_diff, 0) for stat in after.compare_to(before, 'filename'))
+
+    return {'tensor_allocations': tensors, 'python_allocations': python}
+
+
+def throughput(model: TimestepEncoder, batch_size: int, iterations: int) -> Dict[str, float]:
+    battles = make_battles(batch_size)
+    results = {}
+
+    with torch.no_grad():
+        for name in SCENARIOS:
+            battle = make_battle(name)
+            results[f'single/{name}'] = 1 / measure(lambda: model(battle), iterations)
+
+        results['batch'] = batch_size / measure(lambda: model.forward_batch(battles), iterations)
+
+        out = torch.empty((batch_size, ENCODING_FEATURES))
+        results['batch_out'] = batch_size / measure(lambda: model.forward_batch(battles, out=out), iterations)
+
+        model.incremental = True
+        results['incremental'] = batch_size / measure(lambda: model.forward_batch(battles), iterations)
+        model.incremental = False
+
+    results['batch_grad'] = batch_size / measure(lambda: model.forward_batch(battles), iterations)
+    return results
+
+
+def section_latency(model: TimestepEncoder, batch_size: int, iterations: int) -> Dict[str, float]:
+    """Mean milliseconds per batch spent in each section of the encoding."""
+    featurizer, encoder = model.featurizer, model.encoder
+    battles = make_battles(batch_size)
+
+    features = featurizer.featurize_batch(battles)
+    species_ids, ability_ids, item_ids, move_ids, pokemon_features, battle_features = features_to_tensors(features)
+    out = torch.empty((batch_size, ENCODING_FEATURES))
+    rows = pokemon_rows(out)
+
+    pokemon = [poke for battle in battles for poke in featurizer.battle_pokemon(battle)]
+    pokemon_out = flatten_pokemon(features)
+
+    def species():
+        rows[..., :SPECIES_FEATURES] = encoder.species_table()[species_ids]
+
+    def individual():
+        encoder._write_individual(
+            rows,
+            encoder.ability_embeddings(ability_ids),
+            encoder.item_embeddings(item_ids),
+            encoder.move_embeddings(move_ids),
+        )
+
+    sections = {
+        'featurize_pokemon': lambda: featurizer.featurize_pokemon(pokemon, out=pokemon_out),
+        'featurize_battle_state': lambda: featurizer.featurize_battle_state(battles, out=features.battle_features),
+        'species': species,
+        'individual': individual,
+        'battle_state': lambda: out[:, -BATTLE_FEATURES:].copy_(battle_features),
+    }
+
+    with torch.no_grad():
+        encoder.species_table()
+        return {name: 1000 * measure(fn, iterations) for name, fn in sections.items()}
+
+
+def allocations(model: TimestepEncoder, batch_size: int) -> Dict[str, Dict[str, int]]:
+    battles = make_battles(batch_size)
+
+    with torch.no_grad():
+        out = torch.empty((batch_size, ENCODING_FEATURES))
+        results = {
+            'batch': count_allocations(lambda: model.forward_batch(battles)),
+            'batch_out': count_allocations(lambda: model.forward_batch(battles, out=out)),
+        }
+
+        model.incremental = True
+        results['incremental'] = count_allocations(lambda: model.forward_batch(battles))
+        model.incremental = False
+
+    return results
+
+
+def run(data: str, batch_size: int, iterations: int, precision: str = 'float32') -> dict:
+    torch.manual_seed(0)
+    model = TimestepEncoder(data)
+    if precision != 'float32':
+        model.reduce_precision(getattr(torch, precision))
+
+    return {
+        'config': {'batch_size': batch_size, 'iterations': iterations, 'precision': precision, 'threads': torch.get_num_threads()},
+        'encodes_per_sec': throughput(model, batch_size, iterations),
+        'section_latency_ms': section_latency(model, batch_size, iterations),
+        'allocations': allocations(model, batch_size),
+    }
+
+
+def print_results(results: dict):
+    print(f"config: {results['config']}")
+
+    print('\nencodes/sec')
+    for name, value in results['encodes_per_sec'].items():
+        print(f'  {name:<24} {value:>12,.0f}')
+
+    print(f"\nsection latency (ms / batch of {results['config']['batch_size']})")
+    for name, value in results['section_latency_ms'].items():
+        print(f'  {name:<24} {value:>12.3f}')
+
+    print('\nallocations / encode')
+    for name, counts in results['allocations'].items():
+        print(f"  {name:<24} {counts['tensor_allocations']:>6} tensors {counts['python_allocations']:>6} python")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='TimestepEncoder micro-benchmarks')
+    parser.add_argument('--data', default=str(DATA_PATH))
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--precision', default='float32', choices=['float32', 'bfloat16', 'int8'])
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    results = run(args.data, args.batch_size, args.iterations, args.precision)
+    print_results(results)
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
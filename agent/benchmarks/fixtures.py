@@ -0,0 +1,213 @@
+"""
+Offline poke-env battles for benchmarks, built from recorded showdown protocol
+messages and requests so no showdown server is needed.
+"""
+
+import logging
+from typing import Dict, List, Optional
+from poke_env.environment.battle import Battle
+
+
+PLAYER = 'bench-player'
+OPPONENT = 'bench-opponent'
+
+logger = logging.getLogger('benchmark-fixtures')
+logger.setLevel(logging.CRITICAL)
+
+
+# species, max hp, moves, ability, item, tera type
+TEAM = [
+    ('Rillaboom', 341, ['grassyglide', 'woodhammer', 'knockoff', 'fakeout'], 'grassysurge', 'assaultvest', 'Grass'),
+    ('Cloyster', 241, ['iciclespear', 'rockblast', 'iceshard', 'shellsmash'], 'skilllink', 'focussash', 'Ice'),
+    ('Corviknight', 399, ['defog', 'bravebird', 'roost', 'uturn'], 'pressure', 'leftovers', 'Flying'),
+    ('Dragonite', 323, ['extremespeed', 'earthquake', 'roost', 'dragondance'], 'multiscale', 'heavydutyboots', 'Normal'),
+    ('Deoxys-Speed', 261, ['spikes', 'taunt', 'psychoboost', 'knockoff'], 'pressure', 'focussash', 'Psychic'),
+    ('Ninetales-Alola', 257, ['auroraveil', 'blizzard', 'moonblast', 'encore'], 'snowwarning', 'lightclay', 'Ice'),
+]
+
+
+def make_request(hp: Optional[Dict[str, str]] = None, active: str = 'Rillaboom', rqid: int = 1, can_tera: bool = True) -> dict:
+    """Showdown request for TEAM, `hp` overrides the condition (ex. '0 fnt') of some members."""
+    hp = hp or {}
+    active_moves = next(moves for species, _, moves, _, _, _ in TEAM if species == active)
+
+    return {
+        'active': [{
+            'moves': [
+                {'move': move, 'id': move, 'pp': 16, 'maxpp': 16, 'target': 'normal', 'disabled': False}
+                for move in active_moves
+            ],
+            **({'canTerastallize': 'Grass'} if can_tera else {}),
+        }],
+        'side': {
+            'name': PLAYER,
+            'id': 'p1',
+            'pokemon': [
+                {
+                    'ident': f'p1: {species}',
+                    'details': f'{species}, L100',
+                    'condition': hp.get(species, f'{max_hp}/{max_hp}'),
+                    'active': species == active,
+                    'stats': {'atk': 250, 'def': 220, 'spa': 180, 'spd': 220, 'spe': 260},
+                    'moves': moves,
+                    'baseAbility': ability,
+                    'item': item,
+                    'pokeball': 'pokeball',
+                    'ability': ability,
+                    'commanding': False,
+                    'reviving': False,
+                    'teraType': tera,
+                    'terastallized': '',
+                }
+                for species, max_hp, moves, ability, item, tera in TEAM
+            ],
+        },
+        'rqid': rqid,
+    }
+
+
+HEADER = f'''
+|player|p1|{PLAYER}|1|
+|player|p2|{OPPONENT}|1|
+|teamsize|p1|6
+|teamsize|p2|6
+|gen|9
+|tier|[Gen 9] OU
+|start
+'''
+
+EARLY_GAME = HEADER + '''
+|switch|p1a: Rillaboom|Rillaboom, L100|341/341
+|switch|p2a: Goodra|Goodra, L100, M|100/100
+|-fieldstart|move: Grassy Terrain|[from] ability: Grassy Surge|[of] p1a: Rillaboom
+|turn|1
+'''
+
+LATE_GAME = HEADER + '''
+|switch|p1a: Rillaboom|Rillaboom, L100|341/341
+|switch|p2a: Goodra|Goodra, L100, M|100/100
+|turn|1
+|move|p1a: Rillaboom|Wood Hammer|p2a: Goodra
+|-resisted|p2a: Goodra
+|-damage|p2a: Goodra|78/100
+|move|p2a: Goodra|Flamethrower|p1a: Rillaboom
+|-supereffective|p1a: Rillaboom
+|-damage|p1a: Rillaboom|120/341 brn
+|-status|p1a: Rillaboom|brn
+|turn|2
+|switch|p2a: Tyranitar|Tyranitar, L100|100/100
+|-weather|Sandstorm|[from] ability: Sand Stream|[of] p2a: Tyranitar
+|move|p1a: Rillaboom|Knock Off|p2a: Tyranitar
+|-damage|p2a: Tyranitar|81/100
+|-enditem|p2a: Tyranitar|Leftovers|[from] move: Knock Off|[of] p1a: Rillaboom
+|turn|3
+|switch|p1a: Cloyster|Cloyster, L100|241/241
+|move|p2a: Tyranitar|Dragon Dance|p2a: Tyranitar
+|-boost|p2a: Tyranitar|atk|1
+|-boost|p2a: Tyranitar|spe|1
+|turn|4
+|move|p1a: Cloyster|Shell Smash|p1a: Cloyster
+|-unboost|p1a: Cloyster|def|1
+|-unboost|p1a: Cloyster|spd|1
+|-boost|p1a: Cloyster|atk|2
+|-boost|p1a: Cloyster|spa|2
+|-boost|p1a: Cloyster|spe|2
+|move|p2a: Tyranitar|Stone Edge|p1a: Cloyster
+|-damage|p1a: Cloyster|0 fnt
+|faint|p1a: Cloyster
+|turn|5
+|switch|p1a: Dragonite|Dragonite, L100|323/323
+|switch|p2a: Excadrill|Excadrill, L100, F|100/100
+|-terastallize|p1a: Dragonite|Normal
+|move|p1a: Dragonite|Extreme Speed|p2a: Excadrill
+|-damage|p2a: Excadrill|62/100
+|move|p2a: Excadrill|Iron Head|p1a: Dragonite
+|-damage|p1a: Dragonite|210/323
+|turn|6
+|switch|p2a: Dragonite|Dragonite, L100, F|100/100
+|-start|p1a: Dragonite|confusion
+|move|p1a: Dragonite|Earthquake|p2a: Dragonite
+|-immune|p2a: Dragonite
+|switch|p2a: Cinccino|Cinccino, L100, M|100/100
+|-start|p2a: Cinccino|Substitute
+|turn|23
+'''
+
+HAZARD_HEAVY = HEADER + '''
+|switch|p1a: Deoxys-Speed|Deoxys-Speed, L100|261/261
+|switch|p2a: Glimmora|Glimmora, L100, M|100/100
+|turn|1
+|move|p1a: Deoxys-Speed|Spikes|p2a: Glimmora
+|-sidestart|p2: {OPPONENT}|Spikes
+|move|p2a: Glimmora|Mortal Spin|p1a: Deoxys-Speed
+|-sidestart|p1: {PLAYER}|move: Stealth Rock
+|-sidestart|p1: {PLAYER}|move: Toxic Spikes
+|turn|2
+|move|p1a: Deoxys-Speed|Spikes|p2a: Glimmora
+|-sidestart|p2: {OPPONENT}|Spikes
+|move|p2a: Glimmora|Toxic Spikes|p1a: Deoxys-Speed
+|-sidestart|p1: {PLAYER}|move: Toxic Spikes
+|turn|3
+|move|p1a: Deoxys-Speed|Spikes|p2a: Glimmora
+|-sidestart|p2: {OPPONENT}|Spikes
+|-sidestart|p2: {OPPONENT}|move: Sticky Web
+|-sidestart|p1: {PLAYER}|Spikes
+|turn|4
+|switch|p1a: Ninetales-Alola|Ninetales-Alola, L100|257/257
+|-weather|Snow|[from] ability: Snow Warning|[of] p1a: Ninetales-Alola
+|-damage|p1a: Ninetales-Alola|225/257|[from] Stealth Rock
+|move|p1a: Ninetales-Alola|Aurora Veil|p1a: Ninetales-Alola
+|-sidestart|p1: {PLAYER}|move: Aurora Veil
+|-sidestart|p2: {OPPONENT}|Reflect
+|-sidestart|p2: {OPPONENT}|move: Light Screen
+|-sidestart|p2: {OPPONENT}|move: Tailwind
+|-fieldstart|move: Trick Room|[of] p2a: Glimmora
+|-fieldstart|move: Electric Terrain
+|turn|12
+'''.replace('{PLAYER}', PLAYER).replace('{OPPONENT}', OPPONENT)
+
+SCENARIOS = {
+    'early_game': (EARLY_GAME, make_request()),
+    'late_game': (LATE_GAME, make_request(
+        hp={'Rillaboom': '120/341 brn', 'Cloyster': '0 fnt', 'Dragonite': '210/323'}, active='Dragonite', can_tera=False,
+    )),
+    'hazard_heavy': (HAZARD_HEAVY, make_request(
+        hp={'Ninetales-Alola': '225/257'}, active='Ninetales-Alola',
+    )),
+}
+
+
+def battle_from_protocol(protocol: str, request: dict, battle_tag: str = 'battle-gen9ou-1') -> Battle:
+    battle = Battle(battle_tag, PLAYER, logger, gen=9)
+
+    lines = [line.split('|') for line in protocol.splitlines() if line]
+    players = [line for line in lines if line[1] == 'player']
+
+    # players first so the battle knows which side is ours, then the request as showdown sends it
+    for split_message in players:
+        battle.parse_message(split_message)
+    battle.parse_request(request)
+
+    for split_message in lines:
+        if split_message[1] != 'player':
+            battle.parse_message(split_message)
+
+    return battle
+
+
+def make_battle(scenario: str, battle_tag: str = 'battle-gen9ou-1') -> Battle:
+    protocol, request = SCENARIOS[scenario]
+    return battle_from_protocol(protocol, request, battle_tag)
+
+
+def make_battles(n: int, scenarios: Optional[List[str]] = None) -> List[Battle]:
+    """n battles with unique tags, cycling through the scenarios."""
+    scenarios = scenarios or list(SCENARIOS)
+    return [make_battle(scenarios[i % len(scenarios)], f'battle-gen9ou-{i}') for i in range(n)]
+
+
+if __name__ == '__main__':
+    for name in SCENARIOS:
+        battle = make_battle(name)
+        print(name, battle.turn, battle.active_pokemon, battle.opponent_active_pokemon)
+        print('  ', battle.weather, battle.fields, battle.side_conditions, battle.opponent_side_conditions)
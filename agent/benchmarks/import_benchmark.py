@@ -0,0 +1,112 @@
+"""
+Import-time benchmark, each module is imported in a fresh interpreter.
+
+    python -m agent.benchmarks.import_benchmark --json results.json
+
+Reports the wall time of every import, whether it pulled in torch, and the
+slowest modules from python -X importtime.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+
+ROOT = Path(__file__).parents[2]
+
+MODULES = [
+    'agent.teams',
+    'agent.model',
+    'agent.model.to_vec',
+    'agent.model.featurizer',
+    'agent.model.sparse',
+    'agent.model.timestep_encoder',
+    'data_processing.util',
+    'data_processing.util.type_chart',
+    'data_processing.process_final',
+]
+
+# Statements run after an import, for costs that are paid on first use
+FIRST_USE = {
+    'agent.model': 'agent.model.get_encoder()',
+}
+
+
+def import_time(statement: str, repeats: int) -> float:
+    """Best wall time in seconds of running `statement` in a new interpreter, minus the interpreter startup."""
+    def run(code):
+        best = float('inf')
+        for _ in range(repeats):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True)
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    return max(run(statement) - run('pass'), 0.0)
+
+
+def imports_torch(module: str) -> bool:
+    code = f'import sys, {module}; print("torch" in sys.modules)'
+    return subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip() == 'True'
+
+
+def slowest_imports(module: str, top: int) -> List[Dict]:
+    """Modules with the largest self time in python -X importtime."""
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT, capture_output=True, text=True, check=True,
+    ).stderr
+
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len('import time:'):].split('|')]
+        entries.append({'module': name.strip(), 'self_ms': int(self_us) / 1000, 'cumulative_ms': int(cumulative_us) / 1000})
+
+    return sorted(entries, key=lambda entry: entry['self_ms'], reverse=True)[:top]
+
+
+def run(modules: List[str], repeats: int, top: int) -> dict:
+    results = {}
+    for module in modules:
+        results[module] = {
+            'import_ms': 1000 * import_time(f'import {module}', repeats),
+            'imports_torch': imports_torch(module),
+            'slowest': slowest_imports(module, top),
+        }
+        if module in FIRST_USE:
+            results[module]['first_use_ms'] = 1000 * import_time(f'import {module}; {FIRST_USE[module]}', repeats)
+
+    return results
+
+
+def print_results(results: dict):
+    print(f"{'module':<36} {'import ms':>10} {'first use ms':>13}  torch")
+    for module, result in results.items():
+        first_use = f"{result['first_use_ms']:.1f}" if 'first_use_ms' in result else '-'
+        print(f"{module:<36} {result['import_ms']:>10.1f} {first_use:>13}  {result['imports_torch']}")
+
+    for module, result in results.items():
+        print(f'\nslowest imports of {module}')
+        for entry in result['slowest']:
+            print(f"  {entry['module']:<48} {entry['self_ms']:>8.1f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import-time benchmark')
+    parser.add_argument('modules', nargs='*', default=MODULES)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--top', type=int, default=5)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    results = run(args.modules, args.repeats, args.top)
+    print_results(results)
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
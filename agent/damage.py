@@ -0,0 +1,383 @@
+"""
+Damage calculation as array math over batches of matchups, built on the
+processed data tables and indexed by the same ids as data/lookup.
+
+    engine = DamageEngine(DATA_PATH)
+    damage = engine.damage(attacker, moves, defender)   # (B,), (B, K), (B,) ids
+    damage.expected                                     # (B, K) fraction of the defender's max hp
+
+Stats come from the most used EV spreads of each species (usage stats), every
+attacker spread is matched against every defender spread. Covers STAB, type
+effectiveness, boosts, weather, tera, burn, crits, multi-hit moves, accuracy
+and the common damage items. Abilities, moves with variable base power and
+field effects other than weather are not modelled.
+"""
+
+import json
+import numpy as np
+from typing import NamedTuple, Optional
+
+from data_processing.util.to_vec import types as TYPES, nature_to_vec
+from data_processing.util.type_chart import M
+from data_processing.consts import TOP_N_SPREADS
+
+
+NONE = len(TYPES)                                               # type index of an empty second type
+STELLAR = TYPES.index('Stellar')
+
+PHYSICAL, SPECIAL, STATUS = 0, 1, 2
+CATEGORIES = {'Physical': PHYSICAL, 'Special': SPECIAL, 'Status': STATUS}
+
+WEATHERS = ['none', 'sun', 'rain', 'sand', 'snow']
+
+# stat order of the tables, boosts and natures skip hp
+HP, ATK, DEF, SPA, SPD, SPE = range(6)
+STATS = ['hp', 'atk', 'def', 'spa', 'spd', 'spe']
+
+# spread of species without usage stats (random battle style)
+DEFAULT_EVS = 84
+
+# moves dealing damage equal to the user's level
+LEVEL_DAMAGE = ['seismictoss', 'nightshade']
+
+# crit chance by crit ratio stage (gen 7+)
+CRIT_CHANCE = {1: 1 / 24, 2: 1 / 8, 3: 1 / 2}
+
+# expected hits of 2-5 hit moves (35%, 35%, 15%, 15%)
+EXPECTED_HITS_2_5 = 3.1
+
+TYPE_ITEMS = {
+    'silkscarf': 'Normal', 'charcoal': 'Fire', 'mysticwater': 'Water', 'magnet': 'Electric',
+    'miracleseed': 'Grass', 'nevermeltice': 'Ice', 'blackbelt': 'Fighting', 'poisonbarb': 'Poison',
+    'softsand': 'Ground', 'sharpbeak': 'Flying', 'twistedspoon': 'Psychic', 'silverpowder': 'Bug',
+    'hardstone': 'Rock', 'spelltag': 'Ghost', 'dragonfang': 'Dragon', 'blackglasses': 'Dark',
+    'metalcoat': 'Steel', 'fairyfeather': 'Fairy',
+}
+# item: (physical, special) multiplier of the holder's attacking / defending stat
+ATTACK_ITEMS = {'choiceband': (1.5, 1.0), 'choicespecs': (1.0, 1.5)}
+DEFENSE_ITEMS = {'assaultvest': (1.0, 1.5), 'eviolite': (1.5, 1.5)}
+DAMAGE_ITEMS = {'lifeorb': 1.3}
+SUPER_EFFECTIVE_ITEMS = {'expertbelt': 1.2}
+
+
+class Damage(NamedTuple):
+    """Damage of every move as a fraction of the defender's max hp."""
+    min: np.ndarray             # lowest roll without crit of the least favourable spreads
+    max: np.ndarray             # highest roll without crit of the most favourable spreads
+    expected: np.ndarray        # over rolls, crits, hits, accuracy and spread frequencies
+
+
+def effectiveness_table() -> np.ndarray:
+    """(attack type, defense type) multipliers, with rows and columns for Stellar and no type."""
+    table = np.ones((len(TYPES) + 1, len(TYPES) + 1))
+    table[:M.shape[0], :M.shape[1]] = M
+    return table
+
+
+def stage_multiplier(stages: np.ndarray) -> np.ndarray:
+    stages = np.clip(stages, -6, 6)
+    return np.where(stages >= 0, (2 + stages) / 2, 2 / (2 - np.minimum(stages, 0)))
+
+
+class DamageEngine:
+    def __init__(self, path: str):
+        with open(f'{path}/lookup/pokemon.json', 'r') as f:
+            pokemon_lookup = json.load(f)
+        with open(f'{path}/lookup/moves.json', 'r') as f:
+            move_lookup = json.load(f)
+        with open(f'{path}/lookup/items.json', 'r') as f:
+            item_lookup = json.load(f)
+        with open(f'{path}/processed/pokemon.json', 'r') as f:
+            pokemon = json.load(f)
+        with open(f'{path}/processed/moves.json', 'r') as f:
+            moves = json.load(f)
+
+        self.pokemon, self.moves, self.items = pokemon_lookup, move_lookup, item_lookup
+        # (attack type, first defense type, second defense type)
+        table = effectiveness_table()
+        self.effectiveness = table[:, :, None] * table[:, None, :]
+
+        # ----------------
+        # SPECIES
+        # ----------------
+        num_species = max(pokemon_lookup.values()) + 1
+        self.base_stats = np.zeros((num_species, 6))
+        self.types = np.full((num_species, 2), NONE)
+        self.evs = np.full((num_species, TOP_N_SPREADS, 6), DEFAULT_EVS, dtype=float)
+        self.natures = np.ones((num_species, TOP_N_SPREADS, 6))
+        self.spread_frequencies = np.zeros((num_species, TOP_N_SPREADS))
+        self.spread_frequencies[:, 0] = 1
+
+        for name, data in pokemon.items():
+            if name not in pokemon_lookup:
+                continue
+            i = pokemon_lookup[name]
+            self.base_stats[i] = [data['baseStats'][stat] for stat in STATS]
+            self.types[i, :len(data['types'])] = [TYPES.index(t) for t in data['types']]
+
+            spreads = data.get('stats', {}).get('spreads', [])[:TOP_N_SPREADS]
+            if spreads:
+                self.evs[i, :len(spreads)] = [[spread[stat] for stat in STATS] for spread in spreads]
+                self.natures[i, :len(spreads), 1:] = [1 + 0.1 * np.array(nature_to_vec(spread['nature'], default=True)) for spread in spreads]
+                frequencies = np.array([spread['frequency'] for spread in spreads])
+                self.spread_frequencies[i] = 0
+                self.spread_frequencies[i, :len(spreads)] = frequencies / frequencies.sum()
+
+        # unknown species are average ones
+        self.base_stats[0] = self.base_stats[1:].mean(axis=0)
+        self.level_100_stats = self.stats(self.base_stats[:, None, :], self.evs, self.natures, 100)
+
+        # ----------------
+        # MOVES
+        # ----------------
+        num_moves = max(move_lookup.values()) + 1
+        self.power = np.zeros(num_moves)
+        self.category = np.full(num_moves, STATUS)
+        self.move_types = np.full(num_moves, NONE)
+        self.accuracy = np.ones(num_moves)
+        self.hits = np.ones((num_moves, 3))                     # min, max, expected
+        self.crit_chance = np.full(num_moves, CRIT_CHANCE[1])
+        self.level_damage = np.zeros(num_moves, dtype=bool)
+
+        for name, data in moves.items():
+            if name not in move_lookup:
+                continue
+            i = move_lookup[name]
+            self.power[i] = data['basePower']
+            self.category[i] = CATEGORIES[data['category']]
+            self.move_types[i] = TYPES.index(data['type']) if data['type'] in TYPES else NONE
+            self.accuracy[i] = 1 if data['cannotMiss'] else data['accuracy'] / 100
+            self.crit_chance[i] = CRIT_CHANCE.get(max(data['critRatio'], 1), 1)
+            self.level_damage[i] = name in LEVEL_DAMAGE
+
+            multihit = data['multihit']
+            if isinstance(multihit, list):
+                self.hits[i] = [multihit[0], multihit[1], EXPECTED_HITS_2_5 if multihit == [2, 5] else sum(multihit) / 2]
+            else:
+                self.hits[i] = multihit
+
+        # ----------------
+        # ITEMS
+        # ----------------
+        num_items = max(item_lookup.values()) + 1
+        self.item_attack = np.ones((num_items, 2))
+        self.item_defense = np.ones((num_items, 2))
+        self.item_type = np.full(num_items, NONE)
+        self.item_damage = np.ones(num_items)
+        self.item_super_effective = np.ones(num_items)
+
+        for name, i in item_lookup.items():
+            if name in ATTACK_ITEMS:
+                self.item_attack[i] = ATTACK_ITEMS[name]
+            if name in DEFENSE_ITEMS:
+                self.item_defense[i] = DEFENSE_ITEMS[name]
+            if name in TYPE_ITEMS:
+                self.item_type[i] = TYPES.index(TYPE_ITEMS[name])
+            self.item_damage[i] = DAMAGE_ITEMS.get(name, 1.0)
+            self.item_super_effective[i] = SUPER_EFFECTIVE_ITEMS.get(name, 1.0)
+
+    # ----------------
+    # STATS
+    # ----------------
+    @staticmethod
+    def stats(base: np.ndarray, evs: np.ndarray, natures: np.ndarray, level: int) -> np.ndarray:
+        """(..., 6) stats from (..., 6) base stats, EVs and nature multipliers, with 31 IVs."""
+        raw = np.floor((2 * base + 31 + np.floor(evs / 4)) * level / 100)
+        stats = np.floor((raw + 5) * natures)
+        stats[..., HP] = raw[..., HP] + level + 10
+        return stats
+
+    def species_stats(self, species: np.ndarray, level: int = 100) -> np.ndarray:
+        """(..., TOP_N_SPREADS, 6) stats of every usage spread of the species."""
+        if level == 100:
+            return self.level_100_stats[species]
+        return self.stats(self.base_stats[species][..., None, :], self.evs[species], self.natures[species], level)
+
+    # ----------------
+    # DAMAGE
+    # ----------------
+    def damage(
+        self,
+        attacker: np.ndarray,
+        moves: np.ndarray,
+        defender: np.ndarray,
+        attacker_boosts: Optional[np.ndarray] = None,
+        defender_boosts: Optional[np.ndarray] = None,
+        attacker_tera: Optional[np.ndarray] = None,
+        defender_tera: Optional[np.ndarray] = None,
+        attacker_item: Optional[np.ndarray] = None,
+        defender_item: Optional[np.ndarray] = None,
+        weather: Optional[np.ndarray] = None,
+        burned: Optional[np.ndarray] = None,
+        level: int = 100,
+    ) -> Damage:
+        """
+        attacker, defender: (B,) species ids
+        moves: (B, K) move ids of the attacker
+        boosts: (B, 6) stat stages in STATS order (hp ignored)
+        tera: (B,) index in TYPES of the tera type, NONE if not terastallized
+        item: (B,) item ids
+        weather: (B,) index in WEATHERS
+        burned: (B,) whether the attacker is burned
+        """
+        batch = len(attacker)
+        zeros = np.zeros(batch, dtype=int)
+        attacker_boosts = np.zeros((batch, 6)) if attacker_boosts is None else attacker_boosts
+        defender_boosts = np.zeros((batch, 6)) if defender_boosts is None else defender_boosts
+        attacker_tera = np.full(batch, NONE) if attacker_tera is None else attacker_tera
+        defender_tera = np.full(batch, NONE) if defender_tera is None else defender_tera
+        attacker_item = zeros if attacker_item is None else attacker_item
+        defender_item = zeros if defender_item is None else defender_item
+        weather = zeros if weather is None else weather
+        burned = np.zeros(batch, dtype=bool) if burned is None else burned
+
+        # (B, K) move properties
+        power, category, move_type = self.power[moves], self.category[moves], self.move_types[moves]
+        special = (category == SPECIAL).astype(int)
+        rows = np.arange(batch)[:, None]
+
+        defender_types = np.where((defender_tera == NONE) | (defender_tera == STELLAR), self.types[defender].T, [defender_tera, np.full(batch, NONE)]).T
+        is_type = lambda t: (defender_types == TYPES.index(t)).any(axis=1)[:, None]
+
+        # ----------------
+        # STATS (B, K, spread)
+        # ----------------
+        attacker_stats = self.species_stats(attacker, level)    # (B, S, 6)
+        defender_stats = self.species_stats(defender, level)
+
+        attack_stat = np.where(special, SPA, ATK)               # (B, K)
+        defense_stat = np.where(special, SPD, DEF)
+
+        attack = np.take_along_axis(attacker_stats[:, None], attack_stat[:, :, None, None], axis=3)[..., 0]
+        defense = np.take_along_axis(defender_stats[:, None], defense_stat[:, :, None, None], axis=3)[..., 0]
+        hp = defender_stats[:, None, :, HP]
+
+        attack = attack * self.item_attack[attacker_item[rows], special][..., None]
+        defense = defense * self.item_defense[defender_item[rows], special][..., None]
+
+        # rock special defense in sand and ice defense in snow
+        sand, snow = (weather == WEATHERS.index('sand'))[:, None], (weather == WEATHERS.index('snow'))[:, None]
+        defense = defense * np.where((sand & is_type('Rock') & (special == 1)) | (snow & is_type('Ice') & (special == 0)), 1.5, 1.0)[..., None]
+
+        # crits ignore the attacker's drops and the defender's boosts
+        attack_boost, defense_boost = attacker_boosts[rows, attack_stat], defender_boosts[rows, defense_stat]
+        normal_stages = stage_multiplier(attack_boost) / stage_multiplier(defense_boost)
+        crit_stages = stage_multiplier(np.maximum(attack_boost, 0)) / stage_multiplier(np.minimum(defense_boost, 0))
+
+        # ----------------
+        # MODIFIERS (B, K)
+        # ----------------
+        sun, rain = (weather == WEATHERS.index('sun'))[:, None], (weather == WEATHERS.index('rain'))[:, None]
+        fire, water = move_type == TYPES.index('Fire'), move_type == TYPES.index('Water')
+        weather_modifier = np.where((sun & fire) | (rain & water), 1.5, np.where((sun & water) | (rain & fire), 0.5, 1.0))
+
+        original = (self.types[attacker][:, None, :] == move_type[..., None]).any(axis=2)
+        tera = attacker_tera[:, None]
+        matches_tera = (tera == move_type) & (tera != STELLAR)
+        stab = np.where(original & matches_tera, 2.0, np.where(original | matches_tera, 1.5, 1.0))
+        stab = np.where((tera == STELLAR) & (move_type != NONE), np.where(original, 2.0, 1.2), stab)
+
+        effectiveness = self.effectiveness[move_type, defender_types[:, None, 0], defender_types[:, None, 1]]
+
+        burn = np.where(burned[:, None] & (category == PHYSICAL), 0.5, 1.0)
+        item = self.item_damage[attacker_item][:, None] * np.where(effectiveness > 1, self.item_super_effective[attacker_item][:, None], 1.0)
+        power = np.where(self.item_type[attacker_item][:, None] == move_type, power * 1.2, power)
+
+        # status and variable power moves deal nothing, fixed damage moves ignore everything but immunities
+        deals_damage = (category != STATUS) & (power > 0) & (effectiveness > 0)
+        modifier = np.where(deals_damage, weather_modifier * stab * effectiveness * burn * item, 0.0)
+        fixed = np.where(self.level_damage[moves] & (effectiveness > 0), float(level), 0.0)
+
+        # ----------------
+        # DAMAGE
+        # ----------------
+        # Without the rounding of the games' formula one hit is (base * attack / defense + 2) * modifier,
+        # so every result is (coefficient * attack / defense + constant) / hp and the spreads of the
+        # two sides can be reduced separately instead of over every (attacker, defender) spread pair.
+        base = np.floor(2 * level / 5 + 2) / 50 * power
+        hits, crit_chance, accuracy = self.hits[moves], self.crit_chance[moves], self.accuracy[moves]
+
+        lowest = (base * normal_stages * modifier * 0.85 * hits[..., 0], 2 * modifier * 0.85 * hits[..., 0] + fixed)
+        highest = (base * normal_stages * modifier * hits[..., 1], 2 * modifier * hits[..., 1] + fixed)
+        mean = accuracy * 0.925 * modifier * hits[..., 2]
+        expected = (
+            mean * base * ((1 - crit_chance) * normal_stages + 1.5 * crit_chance * crit_stages),
+            mean * 2 * (1 + 0.5 * crit_chance) + accuracy * fixed,
+        )
+
+        # ----------------
+        # SPREADS
+        # ----------------
+        attacker_frequencies = self.spread_frequencies[attacker][:, None, :]
+        defender_frequencies = self.spread_frequencies[defender][:, None, :]
+        used = defender_frequencies > 0
+
+        weakest = np.where(attacker_frequencies > 0, attack, np.inf).min(axis=2, keepdims=True)
+        strongest = np.where(attacker_frequencies > 0, attack, -np.inf).max(axis=2, keepdims=True)
+
+        def over_defenders(attack, terms):
+            coefficient, constant = terms
+            return (coefficient[..., None] * attack / defense + constant[..., None]) / hp
+
+        return Damage(
+            min=np.where(used, over_defenders(weakest, lowest), np.inf).min(axis=2),
+            max=np.where(used, over_defenders(strongest, highest), -np.inf).max(axis=2),
+            expected=(
+                expected[0] * (attacker_frequencies * attack).sum(axis=2) * (defender_frequencies / (defense * hp)).sum(axis=2)
+                + expected[1] * (defender_frequencies / hp).sum(axis=2)
+            ),
+        )
+
+    # ----------------
+    # POKE-ENV
+    # ----------------
+    def battle_damage(self, battle) -> Damage:
+        """Damage of the active pokemon's available moves to the opponent's active pokemon, shape (1, K)."""
+        attacker, defender = battle.active_pokemon, battle.opponent_active_pokemon
+
+        def tera(pokemon):
+            return TYPES.index(pokemon.tera_type.name.title()) if pokemon.is_terastallized and pokemon.tera_type else NONE
+
+        def boosts(pokemon):
+            return [[pokemon.boosts.get(stat, 0) for stat in STATS]]
+
+        weathers = {'sunnyday': 'sun', 'desolateland': 'sun', 'raindance': 'rain', 'primordialsea': 'rain', 'sandstorm': 'sand', 'snow': 'snow', 'hail': 'snow'}
+        weather = next((weathers[w.name.lower()] for w in battle.weather if w.name.lower() in weathers), 'none')
+
+        return self.damage(
+            attacker=np.array([self.pokemon.get(attacker.species, 0)]),
+            moves=np.array([[self.moves.get(move.id, 0) for move in battle.available_moves]]),
+            defender=np.array([self.pokemon.get(defender.species, 0)]),
+            attacker_boosts=np.array(boosts(attacker)),
+            defender_boosts=np.array(boosts(defender)),
+            attacker_tera=np.array([tera(attacker)]),
+            defender_tera=np.array([tera(defender)]),
+            attacker_item=np.array([self.items.get(attacker.item or '', 0)]),
+            defender_item=np.array([self.items.get(defender.item or '', 0)]),
+            weather=np.array([WEATHERS.index(weather)]),
+            burned=np.array([attacker.status is not None and attacker.status.name == 'BRN']),
+            level=attacker.level,
+        )
+
+
+if __name__ == '__main__':
+    import time
+
+    from agent.model import DATA_PATH
+
+    engine = DamageEngine(DATA_PATH)
+
+    attacker = np.array([engine.pokemon['garchomp']])
+    moves = np.array([[engine.moves[move] for move in ['earthquake', 'scaleshot', 'stoneedge', 'swordsdance']]])
+    defender = np.array([engine.pokemon['gholdengo']])
+    print(engine.damage(attacker, moves, defender))
+
+    batch = 4096
+    attacker = np.random.randint(1, len(engine.base_stats), batch)
+    defender = np.random.randint(1, len(engine.base_stats), batch)
+    moves = np.random.randint(1, len(engine.power), (batch, 4))
+
+    start = time.perf_counter()
+    engine.damage(attacker, moves, defender)
+    elapsed = time.perf_counter() - start
+    print(f'{batch * 4} matchups in {1000 * elapsed:.1f} ms, {batch * 4 / (1000 * elapsed):.0f} per ms')
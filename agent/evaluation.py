@@ -0,0 +1,225 @@
+"""
+Evaluation of a candidate player against a set of baselines, over a pool of
+processes each with its own Simulator (or one shard of a ServerPool).
+
+    python -m agent.evaluation --battles 1000 --workers 8 --policy policy.pt --json results.json
+
+Reports the win rate against every baseline with its Wilson confidence
+interval, battles/sec, turns/sec and the candidate's decision latency
+percentiles (from the request to the order, including time waiting on a
+worker pool or inference server).
+"""
+
+import os
+import time
+import numpy as np
+from concurrent.futures import as_completed
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from poke_env.player import Player, RandomPlayer, MaxBasePowerPlayer, SimpleHeuristicsPlayer
+from poke_env.ps_client.server_configuration import ServerConfiguration
+
+from agent.server_pool import SHOWDOWN_PATH
+from agent.worker_pool import BattleWorker, call_worker, worker_pool
+
+
+# Factories are called in the worker processes with the Player keyword
+# arguments, so they have to be picklable (classes, functools.partial, ...)
+PlayerFactory = Callable[..., Player]
+
+BASELINES: Dict[str, PlayerFactory] = {
+    'random': RandomPlayer,
+    'max_base_power': MaxBasePowerPlayer,
+    'heuristics': SimpleHeuristicsPlayer,
+}
+
+
+def wilson_interval(wins: int, n: int, z: float = 1.96) -> Tuple[float, float]:
+    """Confidence interval of a win rate, 95% by default."""
+    if n == 0:
+        return 0.0, 1.0
+    p = wins / n
+    center = (p + z ** 2 / (2 * n)) / (1 + z ** 2 / n)
+    margin = z * np.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2)) / (1 + z ** 2 / n)
+    return float(center - margin), float(center + margin)
+
+
+def record_latency(player: Player) -> List[float]:
+    """Wraps the player's choose_move, appending the seconds of every decision to the returned list."""
+    latencies = []
+    choose_move = player.choose_move
+
+    async def timed_choose_move(battle):
+        start = time.perf_counter()
+        order = choose_move(battle)
+        if isinstance(order, Awaitable):
+            order = await order
+        latencies.append(time.perf_counter() - start)
+        return order
+
+    player.choose_move = timed_choose_move                     # type: ignore
+    return latencies
+
+
+# ----------------
+# WORKERS
+# ----------------
+class Worker(BattleWorker):
+    """Keeps the players of every matchup of one process."""
+
+    def __init__(self, worker_id: int, config: dict):
+        super().__init__(worker_id, config)
+        self.players: Dict[str, Player] = {}
+        self.latencies: List[float] = []
+
+    def player(self, name: str, factory: PlayerFactory, team: Optional[str]) -> Player:
+        if name not in self.players:
+            self.players[name] = factory(team=team, **self.player_kwargs)
+        return self.players[name]
+
+    def play(self, baseline: str, n_battles: int) -> dict:
+        if 'candidate' not in self.players:
+            self.latencies = record_latency(self.player('candidate', self.config['candidate'], self.config['team']))
+        candidate = self.players['candidate']
+        opponent = self.player(baseline, self.config['baselines'][baseline], self.config['opponent_team'] or self.config['team'])
+
+        self.latencies.clear()
+        result = self.battle(candidate, opponent, n_battles)
+        return {'baseline': baseline, **result, 'latencies': np.array(self.latencies, dtype=np.float32)}
+
+
+# ----------------
+# EVALUATION
+# ----------------
+def summarize(results: List[dict], seconds: float) -> dict:
+    report = {'baselines': {}}
+    for baseline in sorted({result['baseline'] for result in results}):
+        matchups = [result for result in results if result['baseline'] == baseline]
+        wins = sum(result['wins'] for result in matchups)
+        battles = sum(result['battles'] for result in matchups)
+        low, high = wilson_interval(wins, battles)
+        report['baselines'][baseline] = {
+            'battles': battles,
+            'wins': wins,
+            'losses': sum(result['losses'] for result in matchups),
+            'win_rate': wins / max(battles, 1),
+            'win_rate_low': low,
+            'win_rate_high': high,
+        }
+
+    battles = sum(result['battles'] for result in results)
+    turns = sum(result['turns'] for result in results)
+    latencies = 1000 * np.concatenate([result['latencies'] for result in results] + [np.zeros(0)])
+    report.update({
+        'battles': battles,
+        'turns': turns,
+        'seconds': seconds,
+        'battles_per_second': battles / seconds,
+        'turns_per_second': turns / seconds,
+        'decisions': len(latencies),
+        'decision_ms_p50': float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+        'decision_ms_p95': float(np.percentile(latencies, 95)) if len(latencies) else 0.0,
+        'decision_ms_p99': float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+    })
+    return report
+
+
+def evaluate(
+    candidate: PlayerFactory,
+    baselines: Dict[str, PlayerFactory] = BASELINES,
+    n_battles: int = 1000,
+    num_workers: int = os.cpu_count() or 1,
+    battles_per_job: int = 50,
+    concurrent_battles: int = 16,
+    battle_format: str = 'gen9ou',
+    team: Optional[str] = None,
+    opponent_team: Optional[str] = None,
+    server_configurations: Optional[List[ServerConfiguration]] = None,
+    showdown_path: Path = SHOWDOWN_PATH,
+) -> dict:
+    """
+    Plays n_battles of the candidate against every baseline, in jobs of
+    battles_per_job spread over num_workers processes. Without
+    server_configurations every process runs its own Simulator. Formats
+    other than random battles need a team.
+    """
+    if team is None and 'random' not in battle_format:
+        raise ValueError(f'{battle_format} battles need a team')
+
+    config = dict(
+        candidate=candidate,
+        baselines=baselines,
+        concurrent_battles=concurrent_battles,
+        battle_format=battle_format,
+        team=team,
+        opponent_team=opponent_team,
+        server_configurations=server_configurations,
+        showdown_path=showdown_path,
+    )
+    jobs = [
+        (baseline, min(battles_per_job, n_battles - start))
+        for baseline in baselines
+        for start in range(0, n_battles, battles_per_job)
+    ]
+
+    with worker_pool(Worker, num_workers, config) as executor:
+        start = time.perf_counter()
+        futures = [executor.submit(call_worker, 'play', baseline, battles) for baseline, battles in jobs]
+        results = [future.result() for future in as_completed(futures)]
+        return summarize(results, time.perf_counter() - start)
+
+
+def print_report(report: dict):
+    for baseline, result in report['baselines'].items():
+        print(f"{baseline:>16}: {100 * result['win_rate']:5.1f}% "
+              f"[{100 * result['win_rate_low']:5.1f}, {100 * result['win_rate_high']:5.1f}] "
+              f"of {result['battles']} battles")
+    print(f"{report['battles_per_second']:.1f} battles/s, {report['turns_per_second']:.1f} turns/s")
+    print(f"decision latency p50 {report['decision_ms_p50']:.1f} ms, "
+          f"p95 {report['decision_ms_p95']:.1f} ms, p99 {report['decision_ms_p99']:.1f} ms")
+
+
+if __name__ == '__main__':
+    import argparse
+    import functools
+    import json
+    import torch
+    from agent.async_player import policy_player
+    from agent.teams import team_1, team_2
+
+    parser = argparse.ArgumentParser(description='Evaluate a policy against baseline players')
+    parser.add_argument('--policy', help='state dict of a PolicyNetwork (encoder and head, ex. saved by agent.league --save), random weights if not given')
+    parser.add_argument('--baselines', nargs='+', choices=list(BASELINES), default=list(BASELINES))
+    parser.add_argument('--battles', type=int, default=1000, help='per baseline')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--battles-per-job', type=int, default=50)
+    parser.add_argument('--servers', type=int, default=0, help='use a pool of this many showdown servers instead of simulators')
+    parser.add_argument('--json', help='also write the report to this file')
+    args = parser.parse_args()
+
+    # every worker builds the network and loads these weights
+    state_dict = torch.load(args.policy) if args.policy else None
+
+    pool = None
+    if args.servers:
+        from agent.server_pool import ServerPool
+        pool = ServerPool(args.servers).start()
+
+    report = evaluate(
+        functools.partial(policy_player, state_dict),
+        baselines={name: BASELINES[name] for name in args.baselines},
+        n_battles=args.battles,
+        num_workers=args.workers,
+        battles_per_job=args.battles_per_job,
+        team=team_1,
+        opponent_team=team_2,
+        server_configurations=pool.configurations if pool else None,
+    )
+    print_report(report)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if pool:
+        pool.stop()
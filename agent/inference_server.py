@@ -0,0 +1,208 @@
+"""
+Micro-batching inference for many players and battles in one process.
+
+Battles are featurized where they are submitted (any thread or event loop),
+the features are queued and a worker thread runs them as one batched encoder
++ policy forward pass, as soon as max_batch_size requests are waiting or the
+oldest one waited max_wait seconds. The forward pass runs outside the event
+loop, so websocket traffic of the other battles keeps flowing while the
+model runs, and it never reads a battle poke-env may be updating.
+
+    server = InferenceServer(policy, max_batch_size=64, max_wait=0.002)
+    player = InferencePlayer(server, battle_format='gen9ou', team=team)
+"""
+
+import asyncio
+import queue
+import threading
+import time
+import numpy as np
+import torch
+import torch.nn as nn
+from collections import deque
+from concurrent.futures import Future
+from typing import List, Optional
+
+from poke_env.environment.battle import Battle
+from poke_env.player import Player
+
+from agent.model import get_encoder
+from agent.model.sparse import SparseBattleFeatures, SparseFeaturizer
+from agent.tracing import span
+from agent.vector_env import ACTION_SPACE_SIZE, best_order
+
+
+class InferenceStats:
+    """Rolling window of the last `window` batches."""
+
+    def __init__(self, window: int = 1000):
+        self.batch_sizes = deque(maxlen=window)
+        self.queue_latencies = deque(maxlen=window * 8)         # seconds from submit to the start of its batch
+        self.forward_times = deque(maxlen=window)
+        self.requests = 0
+        self.batches = 0
+
+    def record(self, submitted: List[float], start: float, end: float):
+        self.batch_sizes.append(len(submitted))
+        self.queue_latencies.extend(start - t for t in submitted)
+        self.forward_times.append(end - start)
+        self.requests += len(submitted)
+        self.batches += 1
+
+    def summary(self) -> dict:
+        latencies = 1000 * np.array(self.queue_latencies or [0.0])
+        return {
+            'requests': self.requests,
+            'batches': self.batches,
+            'mean_batch_size': float(np.mean(self.batch_sizes or [0])),
+            'max_batch_size': int(max(self.batch_sizes or [0])),
+            'queue_ms_p50': float(np.percentile(latencies, 50)),
+            'queue_ms_p95': float(np.percentile(latencies, 95)),
+            'queue_ms_p99': float(np.percentile(latencies, 99)),
+            'forward_ms_mean': 1000 * float(np.mean(self.forward_times or [0.0])),
+        }
+
+
+class InferenceServer:
+    """
+    policy maps a (B, ENCODING_FEATURES) batch of encodings to (B, ...)
+    outputs, each request gets its row. Without a policy the encodings are
+    returned.
+    """
+
+    def __init__(
+        self,
+        policy: Optional[nn.Module] = None,
+        encoder=None,
+        max_batch_size: int = 64,
+        max_wait: float = 0.002,
+    ):
+        self.policy = policy
+        self.encoder = encoder if encoder is not None else get_encoder()
+        self.featurizer = SparseFeaturizer(self.encoder.lookup)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.stats = InferenceStats()
+
+        self.requests: queue.Queue = queue.Queue()
+        self.worker = threading.Thread(target=self._serve, daemon=True)
+        # held while checking running and queueing, so nothing is queued after the sentinel of close()
+        self.lock = threading.Lock()
+        self.running = True
+        self.worker.start()
+
+    def featurize(self, battle: Battle) -> SparseBattleFeatures:
+        with span('featurize'):
+            return self.featurizer.featurize_batch([battle])
+
+    def submit(self, features: SparseBattleFeatures) -> Future:
+        """Thread-safe, `features` of a single battle (see featurize)."""
+        future = Future()
+        with self.lock:
+            if not self.running:
+                future.set_exception(RuntimeError('The inference server is closed'))
+                return future
+            self.requests.put((features, future, time.perf_counter()))
+        return future
+
+    async def infer(self, battle: Battle) -> torch.Tensor:
+        return await asyncio.wrap_future(self.submit(self.featurize(battle)))
+
+    def _collect(self) -> list:
+        batch = [self.requests.get()]
+        if batch[0] is None:
+            return []
+
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                request = self.requests.get(timeout=max(deadline - time.perf_counter(), 0))
+            except queue.Empty:
+                break
+            if request is None:
+                self.requests.put(None)                         # stop after this batch
+                break
+            batch.append(request)
+
+        return batch
+
+    def _serve(self):
+        # stops at the sentinel of close(), every request queued before it is served
+        while True:
+            batch = self._collect()
+            if not batch:
+                break
+
+            features, futures, submitted = zip(*batch)
+            start = time.perf_counter()
+            try:
+                with torch.no_grad(), span('inference_batch', args=lambda: {'size': len(batch)}):
+                    features = SparseBattleFeatures(*[np.concatenate(field) for field in zip(*features)])
+                    outputs = self.encoder.forward_sparse(features)
+                    if self.policy is not None:
+                        with span('policy'):
+                            outputs = self.policy(outputs.to(next(self.policy.parameters(), outputs).dtype))
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            self.stats.record(submitted, start, time.perf_counter())
+            for future, output in zip(futures, outputs):
+                future.set_result(output)
+
+    def close(self):
+        """Serves every request submitted before, later ones fail."""
+        with self.lock:
+            if not self.running:
+                return
+            self.running = False
+            self.requests.put(None)
+        self.worker.join()
+
+
+class InferencePlayer(Player):
+    """Picks the legal action with the highest policy logit, the policy outputs ACTION_SPACE_SIZE logits."""
+
+    def __init__(self, server: InferenceServer, **kwargs):
+        super().__init__(**kwargs)
+        self.server = server
+
+    def choose_move(self, battle: Battle):
+        return self._choose_move(battle)
+
+    async def _choose_move(self, battle: Battle):
+        logits = (await self.server.infer(battle)).float().numpy()
+        return best_order(self, logits, battle)
+
+
+if __name__ == '__main__':
+    import argparse
+    from agent.benchmarks.fixtures import make_battles
+    from agent.model.feature_encoder import ENCODING_FEATURES
+
+    parser = argparse.ArgumentParser(description='Inference server throughput with simulated concurrent battles')
+    parser.add_argument('--battles', type=int, default=256)
+    parser.add_argument('--decisions', type=int, default=4096)
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait', type=float, default=0.002)
+    args = parser.parse_args()
+
+    policy = nn.Linear(ENCODING_FEATURES, ACTION_SPACE_SIZE)
+    server = InferenceServer(policy, max_batch_size=args.max_batch_size, max_wait=args.max_wait)
+    battles = make_battles(args.battles)
+
+    async def battle_loop(battle, decisions):
+        for _ in range(decisions):
+            await server.infer(battle)
+
+    async def main():
+        await asyncio.gather(*[battle_loop(battle, args.decisions // args.battles) for battle in battles])
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    elapsed = time.perf_counter() - start
+
+    print(f'{args.decisions / elapsed:.0f} decisions/s')
+    print(server.stats.summary())
+    server.close()
@@ -0,0 +1,271 @@
+"""
+Multi-process self-play league. The learner plays matches against a pool of
+frozen snapshots of itself, spread over a process pool. Each worker keeps
+its own players and battle backend (a Simulator, or one of the servers of a
+ServerPool) for its whole life, and only receives policy weights per match.
+
+    league = League(default_policy, num_workers=8, trajectory_dir='trajectories')
+    league.add_snapshot()
+    for results in league.run(matches=1000):
+        ...                                     # train on the trajectories, add_snapshot() now and then
+"""
+
+import os
+import time
+import numpy as np
+import torch
+import torch.nn as nn
+from concurrent.futures import FIRST_COMPLETED, wait
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+from poke_env.environment.battle import Battle
+from poke_env.player.battle_order import BattleOrder
+from poke_env.ps_client.server_configuration import ServerConfiguration
+
+from agent.async_player import PolicyNetwork, PolicyPlayer
+from agent.model.sparse import SparseBattleFeatures
+from agent.server_pool import SHOWDOWN_PATH
+from agent.trajectory_store import TrajectoryWriter
+from agent.vector_env import action_mask, action_to_order, best_action
+from agent.worker_pool import BattleWorker, call_worker, worker_pool
+
+
+def default_policy() -> nn.Module:
+    return PolicyNetwork()
+
+
+# ----------------
+# MATCHMAKING
+# ----------------
+def uniform(win_rate: float) -> float:
+    return 1.0
+
+
+def pfsp_hard(win_rate: float) -> float:
+    """Prioritized fictitious self-play, mostly opponents the learner loses to."""
+    return (1 - win_rate) ** 2
+
+
+def pfsp_even(win_rate: float) -> float:
+    """Mostly opponents of about the learner's strength."""
+    return win_rate * (1 - win_rate)
+
+
+MATCHMAKING = {'uniform': uniform, 'hard': pfsp_hard, 'even': pfsp_even}
+
+
+# ----------------
+# WORKERS
+# ----------------
+class LeaguePlayer(PolicyPlayer):
+    """PolicyPlayer that can record its decisions as trajectories (reward +1 / -1 at the end)."""
+
+    def __init__(self, *args, writer: Optional[TrajectoryWriter] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.writer = writer
+        self.match: Dict = {}
+        self.prepared: Dict[str, SparseBattleFeatures] = {}
+        self.steps: Dict[str, list] = {}
+
+    def prepare(self, battle: Battle):
+        features = self.prepared[battle.battle_tag] = super().prepare(battle)
+        return features
+
+    def to_order(self, battle: Battle, logits) -> BattleOrder:
+        # steps that fell back to a random move are not recorded
+        features = self.prepared.pop(battle.battle_tag)
+        mask = action_mask(battle)
+        action = best_action(logits, battle, mask)
+
+        if self.writer is not None:
+            self.steps.setdefault(battle.battle_tag, []).append((features, action, mask))
+        return action_to_order(self, action, battle)
+
+    def _battle_finished_callback(self, battle: Battle):
+        self.prepared.pop(battle.battle_tag, None)
+        steps = self.steps.pop(battle.battle_tag, None)
+        if self.writer is None or not steps:
+            return
+
+        features, actions, masks = zip(*steps)
+        rewards = np.zeros(len(steps), dtype=np.float32)
+        rewards[-1] = 1.0 if battle.won else -1.0 if battle.lost else 0.0
+        self.writer.write(
+            SparseBattleFeatures(*[np.concatenate(field) for field in zip(*features)]),
+            np.array(actions), rewards, np.stack(masks),
+            metadata={**self.match, 'battle': battle.battle_tag, 'won': battle.won, 'turns': battle.turn},
+        )
+
+
+class Worker(BattleWorker):
+    def __init__(self, worker_id: int, config: dict):
+        super().__init__(worker_id, config)
+
+        # one process each, the event loop and the encoder threads share it
+        torch.set_num_threads(1)
+        writer = TrajectoryWriter(config['trajectory_dir'], prefix=f'worker{worker_id}') if config['trajectory_dir'] else None
+
+        self.learner = LeaguePlayer(config['policy_fn'](), team=config['team'], writer=writer, **self.player_kwargs)
+        self.opponent = LeaguePlayer(config['policy_fn'](), team=config['opponent_team'] or config['team'], **self.player_kwargs)
+
+    def play(self, match: dict) -> dict:
+        self.learner.policy.load_state_dict(match['learner'])
+        self.opponent.policy.load_state_dict(match['opponent'])
+        self.learner.match = {'opponent': match['opponent_name'], 'worker': self.id}
+
+        result = self.battle(self.learner, self.opponent, match['battles'])
+        if self.learner.writer is not None:
+            self.learner.writer.flush()
+        return {'opponent': match['opponent_name'], **result}
+
+
+# ----------------
+# LEAGUE
+# ----------------
+class League:
+    """
+    The learner is a PolicyNetwork (or any policy_fn module whose state
+    covers its encoder), its whole state dict including the learnable
+    embeddings is what gets snapshotted and sent to the workers.
+
+    Snapshots are frozen state dicts of the learner. Matches are played in
+    batches of `battles_per_match` against an opponent picked by
+    `matchmaking` from the learner's win rate against every snapshot.
+    Without server_configurations every worker runs its own Simulator.
+    Formats other than random battles need a team.
+    """
+
+    def __init__(
+        self,
+        policy_fn: Callable[[], nn.Module] = default_policy,
+        num_workers: int = os.cpu_count() or 1,
+        matchmaking: str = 'hard',
+        battles_per_match: int = 32,
+        concurrent_battles: int = 16,
+        battle_format: str = 'gen9ou',
+        team: Optional[str] = None,
+        opponent_team: Optional[str] = None,
+        server_configurations: Optional[List[ServerConfiguration]] = None,
+        trajectory_dir: Optional[str] = None,
+        showdown_path: Path = SHOWDOWN_PATH,
+    ):
+        if team is None and 'random' not in battle_format:
+            raise ValueError(f'{battle_format} battles need a team')
+
+        self.learner = policy_fn()
+        self.matchmaking = MATCHMAKING[matchmaking]
+        self.battles_per_match = battles_per_match
+        self.snapshots: Dict[str, dict] = {}
+        self.results: Dict[str, Dict[str, int]] = {}
+
+        config = dict(
+            policy_fn=policy_fn,
+            concurrent_battles=concurrent_battles,
+            battle_format=battle_format,
+            team=team,
+            opponent_team=opponent_team,
+            server_configurations=server_configurations,
+            trajectory_dir=trajectory_dir,
+            showdown_path=showdown_path,
+        )
+        self.num_workers = num_workers
+        self.executor = worker_pool(Worker, num_workers, config)
+
+    def add_snapshot(self, name: Optional[str] = None) -> str:
+        name = name or f'snapshot-{len(self.snapshots)}'
+        self.snapshots[name] = {key: value.detach().cpu().clone() for key, value in self.learner.state_dict().items()}
+        self.results.setdefault(name, {'wins': 0, 'battles': 0})
+        return name
+
+    def win_rate(self, name: str) -> float:
+        # one win and one loss of prior, so unplayed snapshots start at 0.5
+        result = self.results[name]
+        return (result['wins'] + 1) / (result['battles'] + 2)
+
+    def win_rates(self) -> Dict[str, float]:
+        return {name: self.win_rate(name) for name in self.snapshots}
+
+    def pick_opponent(self) -> str:
+        names = list(self.snapshots)
+        weights = np.array([self.matchmaking(self.win_rate(name)) for name in names]) + 1e-6
+        return names[np.random.choice(len(names), p=weights / weights.sum())]
+
+    def _submit(self):
+        opponent = self.pick_opponent()
+        learner = {key: value.detach().cpu() for key, value in self.learner.state_dict().items()}
+        return self.executor.submit(call_worker, 'play', {
+            'learner': learner,
+            'opponent': self.snapshots[opponent],
+            'opponent_name': opponent,
+            'battles': self.battles_per_match,
+        })
+
+    def run(self, matches: int) -> Iterator[dict]:
+        """Plays `matches` matches, yielding each result as it comes in. Every match uses the learner's weights at submit time."""
+        if not self.snapshots:
+            self.add_snapshot()
+
+        pending = {self._submit() for _ in range(min(self.num_workers, matches))}
+        submitted = len(pending)
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                self.results[result['opponent']]['wins'] += result['wins']
+                self.results[result['opponent']]['battles'] += result['battles']
+                yield result
+
+                if submitted < matches:
+                    pending.add(self._submit())
+                    submitted += 1
+
+    def close(self):
+        self.executor.shutdown()
+
+
+if __name__ == '__main__':
+    import argparse
+    from agent.teams import team_1, team_2
+
+    parser = argparse.ArgumentParser(description='Self-play league')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--matches', type=int, default=16)
+    parser.add_argument('--battles-per-match', type=int, default=32)
+    parser.add_argument('--matchmaking', choices=list(MATCHMAKING), default='hard')
+    parser.add_argument('--servers', type=int, default=0, help='use a pool of this many showdown servers instead of simulators')
+    parser.add_argument('--trajectory-dir')
+    parser.add_argument('--save', help='write the learner (encoder and head) here, for agent.evaluation --policy')
+    args = parser.parse_args()
+
+    pool = None
+    if args.servers:
+        from agent.server_pool import ServerPool
+        pool = ServerPool(args.servers).start()
+
+    league = League(
+        num_workers=args.workers,
+        matchmaking=args.matchmaking,
+        battles_per_match=args.battles_per_match,
+        team=team_1,
+        opponent_team=team_2,
+        server_configurations=pool.configurations if pool else None,
+        trajectory_dir=args.trajectory_dir,
+    )
+
+    start, battles = time.perf_counter(), 0
+    for i, result in enumerate(league.run(args.matches)):
+        battles += result['battles']
+        print(f"{result['opponent']}: won {result['wins']} / {result['battles']} on worker {result['worker']}")
+
+        # stand-in for training, every few matches the learner is frozen into the pool
+        if i % 4 == 3:
+            league.add_snapshot()
+
+    print(f'{battles / (time.perf_counter() - start):.1f} battles/s, win rates {league.win_rates()}')
+    league.close()
+    if args.save:
+        torch.save(league.learner.state_dict(), args.save)
+    if pool:
+        pool.stop()
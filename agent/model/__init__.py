@@ -0,0 +1,48 @@
+"""
+Nothing heavy (torch, numpy, poke-env, the data files) is imported here, the
+classes below are only imported on first access:
+
+    from agent.model import get_encoder     # cheap
+    encoder = get_encoder()                 # imports torch and loads the data
+"""
+
+import importlib
+import threading
+from pathlib import Path
+
+
+DATA_PATH = str(Path(__file__).parents[2] / 'data')
+
+_LAZY = {
+    'TimestepEncoder': 'agent.model.timestep_encoder',
+    'FeatureEncoder': 'agent.model.feature_encoder',
+    'BattleFeaturizer': 'agent.model.featurizer',
+    'BattleFeatures': 'agent.model.featurizer',
+    'FeatureLookup': 'agent.model.feature_lookup',
+    'load_lookup': 'agent.model.packed_lookup',
+    'attach_lookup': 'agent.model.packed_lookup',
+}
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        return getattr(importlib.import_module(_LAZY[name]), name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+_encoders = {}
+_encoders_lock = threading.Lock()
+
+
+def get_encoder(path: str = DATA_PATH, **kwargs):
+    """
+    TimestepEncoder shared by everything in the process, built on first use.
+    One encoder is kept per (path, kwargs).
+    """
+    key = (path, tuple(sorted(kwargs.items())))
+
+    with _encoders_lock:
+        if key not in _encoders:
+            from agent.model.timestep_encoder import TimestepEncoder
+            _encoders[key] = TimestepEncoder(path, **kwargs)
+        return _encoders[key]
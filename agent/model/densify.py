@@ -0,0 +1,59 @@
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from agent.model.featurizer import BattleFeatures, POKEMON_LAYOUT, POKEMON_FEATURES, BATTLE_FEATURES
+from agent.model.sparse import SparseBattleFeatures, POKEMON_NUMERIC_COLUMNS, BATTLE_NUMERIC_COLUMNS
+from agent.model.to_vec import EFFECT_VECTORIZER
+
+
+class Densify(nn.Module):
+    """
+    Model side of the sparse format: rebuilds the dense BattleFeatures tensors
+    on the model's device. Categories are scattered and effects go through an
+    identity embedding bag weighted by their values.
+    """
+
+    def __init__(self):
+        super(Densify, self).__init__()
+        num_effects = EFFECT_VECTORIZER.size
+
+        self.register_buffer("pokemon_numeric_columns", torch.as_tensor(POKEMON_NUMERIC_COLUMNS), persistent=False)
+        self.register_buffer("battle_numeric_columns", torch.as_tensor(BATTLE_NUMERIC_COLUMNS), persistent=False)
+
+        # last row is the padding effect
+        self.register_buffer("effect_table", torch.cat([torch.eye(num_effects), torch.zeros(1, num_effects)]), persistent=False)
+
+    def _one_hots(self, categories: torch.Tensor, size: int) -> torch.Tensor:
+        # padding (-1) goes to an extra column that is dropped
+        categories = categories.long()
+        categories = torch.where(categories < 0, size, categories)
+        dense = torch.zeros((*categories.shape[:-1], size + 1), device=categories.device)
+        return dense.scatter_(-1, categories, 1)[..., :size]
+
+    def forward(self, features: SparseBattleFeatures) -> BattleFeatures:
+        pokemon_features = self._one_hots(features.pokemon_categories, POKEMON_FEATURES)
+        pokemon_features[..., self.pokemon_numeric_columns] = features.pokemon_numeric
+
+        effect_ids = features.effect_ids.long()
+        effect_ids = torch.where(effect_ids < 0, EFFECT_VECTORIZER.size, effect_ids)
+        effects = F.embedding_bag(
+            effect_ids.flatten(0, 1),
+            self.effect_table,
+            per_sample_weights=features.effect_values.flatten(0, 1),
+            mode='sum',
+            padding_idx=EFFECT_VECTORIZER.size,
+        )
+        pokemon_features[..., POKEMON_LAYOUT['effects']] = effects.view(*effect_ids.shape[:-1], -1)
+
+        battle_features = self._one_hots(features.battle_categories, BATTLE_FEATURES)
+        battle_features[..., self.battle_numeric_columns] = features.battle_numeric
+
+        return BattleFeatures(
+            features.species_ids.long(),
+            features.ability_ids.long(),
+            features.item_ids.long(),
+            features.move_ids.long(),
+            pokemon_features,
+            battle_features,
+        )
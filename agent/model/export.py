@@ -0,0 +1,112 @@
+import copy
+import torch
+import torch.nn as nn
+from typing import Optional
+
+from agent.model.featurizer import empty_features
+from agent.model.feature_encoder import FeatureEncoder, features_to_tensors
+
+
+INPUT_NAMES = ['species_ids', 'ability_ids', 'item_ids', 'move_ids', 'pokemon_features', 'battle_features']
+
+
+class StaticEncoder(nn.Module):
+    """
+    Frozen copy of a FeatureEncoder (optionally followed by a policy head) with
+    a fixed-shape graph: no caches, versions or grad-mode branches, only
+    gathers and concatenations. This is what gets traced, compiled or exported.
+
+    Produces the same encoding as FeatureEncoder.forward. The embeddings and
+    head are copied, freezing them leaves the source trainable.
+    """
+
+    def __init__(self, encoder: FeatureEncoder, head: Optional[nn.Module] = None):
+        super(StaticEncoder, self).__init__()
+
+        self.register_buffer("species_table", encoder.species_table().detach().clone())
+        self.ability_embeddings = copy.deepcopy(encoder.ability_embeddings)
+        self.item_embeddings = copy.deepcopy(encoder.item_embeddings)
+        self.move_embeddings = copy.deepcopy(encoder.move_embeddings)
+        self.head = copy.deepcopy(head)
+
+    def forward(
+        self,
+        species_ids: torch.Tensor,          # (B, 12)
+        ability_ids: torch.Tensor,          # (B, 12)
+        item_ids: torch.Tensor,             # (B, 12)
+        move_ids: torch.Tensor,             # (B, 12, MOVE_IDS)
+        pokemon_features: torch.Tensor,     # (B, 12, POKEMON_FEATURES)
+        battle_features: torch.Tensor,      # (B, BATTLE_FEATURES)
+    ) -> torch.Tensor:
+        moves = self.move_embeddings(move_ids)                  # (B, 12, 4 + 1, D)
+
+        # Same order as ENCODED_POKEMON_LAYOUT
+        pokemon = torch.cat([
+            self.species_table[species_ids],
+            pokemon_features,
+            self.ability_embeddings(ability_ids),
+            moves[:, :, :4].flatten(2),
+            self.item_embeddings(item_ids),
+            moves[:, :, 4],
+        ], dim=-1)
+
+        encoding = torch.cat([pokemon.flatten(1), battle_features], dim=1)
+
+        if self.head is not None:
+            return self.head(encoding)
+        return encoding
+
+
+def freeze(encoder: FeatureEncoder, head: Optional[nn.Module] = None) -> StaticEncoder:
+    static = StaticEncoder(encoder, head).eval()
+    for parameter in static.parameters():
+        parameter.requires_grad_(False)
+    return static
+
+
+def example_inputs(batch_size: int = 2):
+    return tuple(features_to_tensors(empty_features(batch_size)))
+
+
+def compile_encoder(encoder: FeatureEncoder, head: Optional[nn.Module] = None, **kwargs):
+    """torch.compile the static graph, kwargs are passed to torch.compile."""
+    return torch.compile(freeze(encoder, head), **kwargs)
+
+
+def export_torchscript(encoder: FeatureEncoder, path: str, head: Optional[nn.Module] = None):
+    static = freeze(encoder, head)
+
+    with torch.no_grad():
+        traced = torch.jit.trace(static, example_inputs())
+        traced = torch.jit.freeze(traced)
+
+    torch.jit.save(traced, path)
+    return traced
+
+
+def export_onnx(encoder: FeatureEncoder, path: str, head: Optional[nn.Module] = None, opset_version: int = 17):
+    static = freeze(encoder, head)
+    dynamic_axes = {name: {0: 'batch'} for name in INPUT_NAMES + ['encoding']}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            static,
+            example_inputs(),
+            path,
+            input_names=INPUT_NAMES,
+            output_names=['encoding'],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset_version,
+            dynamo=False,
+        )
+
+
+if __name__ == '__main__':
+    from agent.model.timestep_encoder import TimestepEncoder
+
+    model = TimestepEncoder(path='../../data')
+    traced = export_torchscript(model.encoder, 'encoder.pt')
+
+    inputs = example_inputs()
+    with torch.no_grad():
+        print(torch.allclose(traced(*inputs), model.encoder(*inputs)))
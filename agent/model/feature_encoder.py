@@ -0,0 +1,216 @@
+import itertools
+import torch
+import torch.nn as nn
+from typing import Optional, Union
+
+from agent.tracing import span
+from agent.util import make_layout
+from agent.model.feature_lookup import FeatureLookup, TOP_N_ABILITIES, TOP_N_ITEMS, TOP_N_MOVES
+from agent.model.hybrid_embedding import HybridEmbedding
+from agent.model.featurizer import BattleFeatures, PokemonFeatures, NUM_SLOTS, POKEMON_FEATURES, BATTLE_FEATURES
+
+
+NUM_ABILITIES = 313
+NUM_ITEMS = 250
+NUM_MOVES = 687
+NUM_POKEMON = 1331
+
+class STATIC_FEATURES:
+    ABILITIES = 1
+    ITEMS = 1
+    MOVES = 104
+    POKEMON = 241
+
+class LEARNABLE_FEATURES:
+    ABILITIES = 50
+    ITEMS = 50
+    MOVES = 50
+    POKEMON = 50
+
+ABILITY_DIM = STATIC_FEATURES.ABILITIES + LEARNABLE_FEATURES.ABILITIES
+ITEM_DIM = STATIC_FEATURES.ITEMS + LEARNABLE_FEATURES.ITEMS
+MOVE_DIM = STATIC_FEATURES.MOVES + LEARNABLE_FEATURES.MOVES
+POKEMON_DIM = STATIC_FEATURES.POKEMON + LEARNABLE_FEATURES.POKEMON
+
+# Positions of each section in the encoding of a single pokemon
+ENCODED_POKEMON_LAYOUT, ENCODED_POKEMON_FEATURES = make_layout({
+    # Species related features
+    'species': POKEMON_DIM,
+    'species_abilities': TOP_N_ABILITIES * ABILITY_DIM,
+    'species_items': TOP_N_ITEMS * ITEM_DIM,
+    'species_moves': TOP_N_MOVES * MOVE_DIM,
+    # Individual and Battle related features
+    'features': POKEMON_FEATURES,
+    'ability': ABILITY_DIM,
+    'moves': 4 * MOVE_DIM,
+    'item': ITEM_DIM,
+    'preparing_move': MOVE_DIM,
+})
+SPECIES_FEATURES = ENCODED_POKEMON_LAYOUT['features'].start
+
+# The full encoding is every pokemon followed by the battle state
+ENCODING_FEATURES = NUM_SLOTS * ENCODED_POKEMON_FEATURES + BATTLE_FEATURES
+
+
+def features_to_tensors(features: Union[BattleFeatures, PokemonFeatures], device=None):
+    """Wraps (without copying, on cpu) the numpy arrays of Battle/PokemonFeatures as tensors."""
+    return type(features)(*[torch.as_tensor(field, device=device) for field in features])
+
+
+class FeatureEncoder(nn.Module):
+    """
+    Tensor-only half of the TimestepEncoder. Takes batched BattleFeatures
+    tensors (see featurizer.py) and returns the flat (B, ENCODING_FEATURES)
+    timestep encoding.
+
+    Every section is written at a fixed offset of the output, which can be
+    passed in as `out` (ex. a row of a pinned or shared rollout buffer).
+    """
+
+    def __init__(self, lookup: FeatureLookup):
+        super(FeatureEncoder, self).__init__()
+
+        self.ability_embeddings = HybridEmbedding(NUM_ABILITIES, STATIC_FEATURES.ABILITIES, LEARNABLE_FEATURES.ABILITIES, lookup.ability_tensors)
+        self.item_embeddings = HybridEmbedding(NUM_ITEMS, STATIC_FEATURES.ITEMS, LEARNABLE_FEATURES.ITEMS, lookup.item_tensors)
+        self.move_embeddings = HybridEmbedding(NUM_MOVES, STATIC_FEATURES.MOVES, LEARNABLE_FEATURES.MOVES, lookup.move_tensors)
+        self.pokemon_embeddings = HybridEmbedding(NUM_POKEMON, STATIC_FEATURES.POKEMON, LEARNABLE_FEATURES.POKEMON, lookup.pokemon_tensors)
+
+        # (NUM_POKEMON, TOP_N_ABILITIES + TOP_N_ITEMS + TOP_N_MOVES) ability, item and move ids of every species
+        self.register_buffer("species_components", lookup.species_components, persistent=False)
+
+        # Species features of every species, rebuilt when the parameters change
+        self._species_table = None
+        self._species_table_version = None
+        self._invalidations = 0
+
+    def parameter_version(self):
+        """
+        Changes whenever a parameter or buffer is replaced or modified in place
+        (optimizer steps, load_state_dict, .to()). Writes through .data are not
+        tracked, call invalidate() after those.
+        """
+        return (self._invalidations,) + tuple(
+            (tensor.data_ptr(), tensor._version) for tensor in itertools.chain(self.parameters(), self.buffers())
+        )
+
+    @property
+    def dtype(self):
+        """dtype of the encoding, float32 unless the encoder was quantized (see quantize.py)."""
+        return self.pokemon_embeddings.dtype
+
+    def invalidate(self):
+        self._invalidations += 1
+
+    def species_table(self) -> torch.Tensor:
+        """(NUM_POKEMON, SPECIES_FEATURES) species features of every species for the current parameters."""
+        version = self.parameter_version()
+
+        if self._species_table is None or self._species_table_version != version:
+            with torch.no_grad():
+                species_ids = torch.arange(NUM_POKEMON, device=self.species_components.device)
+                table = self.species_components.new_empty((NUM_POKEMON, SPECIES_FEATURES), dtype=self.dtype)
+                self._encode_species(species_ids, self.species_components, table)
+                self._species_table = table
+            self._species_table_version = version
+
+        return self._species_table
+
+    def _encode_species(self, species_ids, components, out, ability_ids=None, item_ids=None, move_ids=None):
+        """
+        Writes the species features into out[..., :SPECIES_FEATURES], along with the
+        embeddings of the pokemon's own ability, item and moves when given, so
+        every vocabulary is looked up only once.
+        """
+        abilities = components[..., :TOP_N_ABILITIES]
+        items = components[..., TOP_N_ABILITIES:TOP_N_ABILITIES + TOP_N_ITEMS]
+        moves = components[..., TOP_N_ABILITIES + TOP_N_ITEMS:]
+
+        if ability_ids is not None:
+            abilities = torch.cat([abilities, ability_ids[..., None]], dim=-1)
+            items = torch.cat([items, item_ids[..., None]], dim=-1)
+            moves = torch.cat([moves, move_ids], dim=-1)
+
+        self.pokemon_embeddings(species_ids, out=out[..., ENCODED_POKEMON_LAYOUT['species']])
+        abilities = self.ability_embeddings(abilities)          # (..., 3 (+ 1), D)
+        items = self.item_embeddings(items)                     # (..., TOP_N_ITEMS (+ 1), D)
+        moves = self.move_embeddings(moves)                     # (..., TOP_N_MOVES (+ 4 + 1), D)
+
+        out[..., ENCODED_POKEMON_LAYOUT['species_abilities']] = abilities[..., :TOP_N_ABILITIES, :].flatten(-2)
+        out[..., ENCODED_POKEMON_LAYOUT['species_items']] = items[..., :TOP_N_ITEMS, :].flatten(-2)
+        out[..., ENCODED_POKEMON_LAYOUT['species_moves']] = moves[..., :TOP_N_MOVES, :].flatten(-2)
+
+        if ability_ids is not None:
+            self._write_individual(out, abilities[..., TOP_N_ABILITIES, :], items[..., TOP_N_ITEMS, :], moves[..., TOP_N_MOVES:, :])
+
+    @staticmethod
+    def _write_individual(out, ability, item, moves):
+        out[..., ENCODED_POKEMON_LAYOUT['ability']] = ability
+        out[..., ENCODED_POKEMON_LAYOUT['moves']] = moves[..., :4, :].flatten(-2)
+        out[..., ENCODED_POKEMON_LAYOUT['item']] = item
+        out[..., ENCODED_POKEMON_LAYOUT['preparing_move']] = moves[..., 4, :]
+
+    def encode_pokemon(
+        self,
+        species_ids: torch.Tensor,          # (...,)
+        ability_ids: torch.Tensor,          # (...,)
+        item_ids: torch.Tensor,             # (...,)
+        move_ids: torch.Tensor,             # (..., MOVE_IDS)
+        pokemon_features: torch.Tensor,     # (..., POKEMON_FEATURES)
+        out: Optional[torch.Tensor] = None, # (..., ENCODED_POKEMON_FEATURES)
+    ) -> torch.Tensor:
+        if out is None:
+            out = pokemon_features.new_empty((*species_ids.shape, ENCODED_POKEMON_FEATURES), dtype=self.dtype)
+
+        if torch.is_grad_enabled():
+            # Species related features, differentiable (the individual embeddings are looked up with them)
+            with span('species'):
+                self._encode_species(species_ids, self.species_components[species_ids], out, ability_ids, item_ids, move_ids)
+        else:
+            # Frozen parameters, species features are a single index into the table
+            with span('species'):
+                out[..., :SPECIES_FEATURES] = self.species_table()[species_ids]
+            with span('individual'):
+                self._write_individual(
+                    out,
+                    self.ability_embeddings(ability_ids),
+                    self.item_embeddings(item_ids),
+                    self.move_embeddings(move_ids),
+                )
+
+        with span('pokemon_state'):
+            out[..., ENCODED_POKEMON_LAYOUT['features']] = pokemon_features
+        return out
+
+    def forward(
+        self,
+        species_ids: torch.Tensor,          # (B, 12)
+        ability_ids: torch.Tensor,          # (B, 12)
+        item_ids: torch.Tensor,             # (B, 12)
+        move_ids: torch.Tensor,             # (B, 12, MOVE_IDS)
+        pokemon_features: torch.Tensor,     # (B, 12, POKEMON_FEATURES)
+        battle_features: torch.Tensor,      # (B, BATTLE_FEATURES)
+        out: Optional[torch.Tensor] = None, # (B, ENCODING_FEATURES)
+    ) -> torch.Tensor:
+        if out is None:
+            out = pokemon_features.new_empty((species_ids.shape[0], ENCODING_FEATURES), dtype=self.dtype)
+
+        # ----------------
+        # POKEMON FEATURES
+        # ----------------
+        self.encode_pokemon(
+            species_ids, ability_ids, item_ids, move_ids, pokemon_features,
+            out=pokemon_rows(out),
+        )
+
+
+        # ----------------
+        # BATTLE CONDITION FEATURES
+        # ----------------
+        with span('battle_state'):
+            out[:, NUM_SLOTS * ENCODED_POKEMON_FEATURES:] = battle_features
+        return out
+
+
+def pokemon_rows(out: torch.Tensor) -> torch.Tensor:
+    """(B, 12, ENCODED_POKEMON_FEATURES) view of the pokemon part of a (B, ENCODING_FEATURES) encoding."""
+    return out[:, :NUM_SLOTS * ENCODED_POKEMON_FEATURES].unflatten(1, (NUM_SLOTS, ENCODED_POKEMON_FEATURES))
@@ -1,5 +1,34 @@
 import json
 import torch
+from collections.abc import Mapping
+
+
+# Each species is described by its most used abilities, items and moves
+TOP_N_ABILITIES = 3
+TOP_N_ITEMS = 5
+TOP_N_MOVES = 15
+
+
+class SpeciesComponents(Mapping):
+    """Read-only species -> {'abilities', 'items', 'moves'} view of the species components table."""
+
+    def __init__(self, pokemon: Mapping, components: torch.Tensor):
+        self.pokemon = pokemon
+        self.components = components
+
+    def __getitem__(self, species: str) -> dict:
+        row = self.components[self.pokemon[species]].tolist()
+        return {
+            'abilities': row[:TOP_N_ABILITIES],
+            'items': row[TOP_N_ABILITIES:TOP_N_ABILITIES + TOP_N_ITEMS],
+            'moves': row[TOP_N_ABILITIES + TOP_N_ITEMS:],
+        }
+
+    def __len__(self):
+        return len(self.pokemon)
+
+    def __iter__(self):
+        return iter(self.pokemon)
 
 
 class FeatureLookup:
@@ -9,6 +38,8 @@ class FeatureLookup:
         self.moves = None
         self.pokemon = None
 
+        # (NUM_POKEMON, TOP_N_ABILITIES + TOP_N_ITEMS + TOP_N_MOVES) ability, item and move ids of every species
+        self.species_components = None
         self.pokemon_embeddings = None
 
         self.ability_tensors = None
@@ -26,18 +57,19 @@ class FeatureLookup:
                 self.moves = json.load(f)
             with open(f'{path}/lookup/pokemon.json', 'r') as f:
                 self.pokemon = json.load(f)
-            with open(f'{path}/final/pokemon_embeddings.json', 'r') as f:
-                self.pokemon_embeddings = json.load(f)
 
             # Loading tensors
             self.ability_tensors = torch.load(f'{path}/tensors/abilities.pt')
             self.item_tensors = torch.load(f'{path}/tensors/items.pt')
             self.move_tensors = torch.load(f'{path}/tensors/moves.pt')
             self.pokemon_tensors = torch.load(f'{path}/tensors/pokemon.pt')
+            self.species_components = torch.load(f'{path}/tensors/pokemon_embeddings.pt')
 
         except Exception as e:
             raise Exception(f'Failed to load data: {e}')
 
+        self.pokemon_embeddings = SpeciesComponents(self.pokemon, self.species_components)
+
     def get_pokemon_embeddings(self, pokemon):
         return [self.pokemon_embeddings[poke] for poke in pokemon]
 
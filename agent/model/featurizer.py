@@ -0,0 +1,238 @@
+import numpy as np
+from typing import List, NamedTuple, Optional, TYPE_CHECKING
+from poke_env.environment.battle import Battle, Pokemon
+
+from agent.util import pad, flatten_list, make_layout
+from agent.model.to_vec import gender_to_vec, effects_to_vec, pokemon_type_to_vec, status_to_vec, weathers_to_vec, fields_to_vec, side_conditions_to_vec
+from agent.model.to_vec import GENDER_VECTORIZER, TYPE_VECTORIZER, STATUS_VECTORIZER, EFFECT_VECTORIZER, WEATHER_VECTORIZER, FIELD_VECTORIZER, SIDE_CONDITION_VECTORIZER
+
+# Only for annotations, importing it pulls in torch which featurizer processes don't need
+if TYPE_CHECKING:
+    from agent.model.feature_lookup import FeatureLookup
+
+
+NUM_SLOTS = 12              # 2 active + 5 switches + 5 opponent bench
+
+MOVE_IDS = 4 + 1             # known moves + preparing move
+
+# Positions of each section in the numeric features of a single pokemon
+POKEMON_LAYOUT, POKEMON_FEATURES = make_layout({
+    'types': 3 * TYPE_VECTORIZER.size,                  # 60
+    'gender': GENDER_VECTORIZER.size,                   # 3
+    'numeric': 12,                                      # level, hp, active, boosts
+    'effects': EFFECT_VECTORIZER.size,                  # 230   (224 in original poke-env)
+    'tera_flags': 2,                                    # first_turn, is_terastallized
+    'tera_type': TYPE_VECTORIZER.size,                  # 20
+    'move_flags': 3,                                    # must_recharge, protect_counter, revealed
+    'stats': 6,                                         # 6
+    'status': STATUS_VECTORIZER.size,                   # 7
+    'status_counter': 1,                                # 1
+})
+
+# Positions of each section in the battle state features
+BATTLE_LAYOUT, BATTLE_FEATURES = make_layout({
+    'turn': 1,                                          # 1
+    'weather': WEATHER_VECTORIZER.counter_size,         # 9 counters
+    'fields': FIELD_VECTORIZER.counter_size,            # 13 counters
+    'opponent_side': SIDE_CONDITION_VECTORIZER.counter_size,    # 24 counters
+    'side': SIDE_CONDITION_VECTORIZER.counter_size,             # 24 counters
+    'reviving': 1,                                      # 1
+    'can_tera': TYPE_VECTORIZER.size,                   # 20
+    'flags': 2,                                         # opponent_can_tera, force_switch
+})
+
+STATS = ['hp', 'atk', 'def', 'spa', 'spd', 'spe']
+
+
+class PokemonFeatures(NamedTuple):
+    """The per-pokemon part of BattleFeatures for a flat list of N pokemon."""
+    species_ids: np.ndarray         # (N,)                      int64
+    ability_ids: np.ndarray         # (N,)                      int64
+    item_ids: np.ndarray            # (N,)                      int64
+    move_ids: np.ndarray            # (N, MOVE_IDS)             int64
+    pokemon_features: np.ndarray    # (N, POKEMON_FEATURES)     float32
+
+
+class BattleFeatures(NamedTuple):
+    """
+    Plain numpy arrays describing one battle (or a batch of battles with a
+    leading batch dimension). Cheap to pickle and send between processes.
+    """
+    species_ids: np.ndarray         # (12,)                     int64
+    ability_ids: np.ndarray         # (12,)                     int64
+    item_ids: np.ndarray            # (12,)                     int64
+    move_ids: np.ndarray            # (12, MOVE_IDS)            int64
+    pokemon_features: np.ndarray    # (12, POKEMON_FEATURES)    float32
+    battle_features: np.ndarray     # (BATTLE_FEATURES,)        float32
+
+
+def empty_features(batch_size: int) -> BattleFeatures:
+    return BattleFeatures(
+        species_ids=np.zeros((batch_size, NUM_SLOTS), dtype=np.int64),
+        ability_ids=np.zeros((batch_size, NUM_SLOTS), dtype=np.int64),
+        item_ids=np.zeros((batch_size, NUM_SLOTS), dtype=np.int64),
+        move_ids=np.zeros((batch_size, NUM_SLOTS, MOVE_IDS), dtype=np.int64),
+        pokemon_features=np.zeros((batch_size, NUM_SLOTS, POKEMON_FEATURES), dtype=np.float32),
+        battle_features=np.zeros((batch_size, BATTLE_FEATURES), dtype=np.float32),
+    )
+
+
+def empty_pokemon_features(num_pokemon: int) -> PokemonFeatures:
+    return PokemonFeatures(
+        species_ids=np.zeros(num_pokemon, dtype=np.int64),
+        ability_ids=np.zeros(num_pokemon, dtype=np.int64),
+        item_ids=np.zeros(num_pokemon, dtype=np.int64),
+        move_ids=np.zeros((num_pokemon, MOVE_IDS), dtype=np.int64),
+        pokemon_features=np.zeros((num_pokemon, POKEMON_FEATURES), dtype=np.float32),
+    )
+
+
+def flatten_pokemon(features: BattleFeatures) -> PokemonFeatures:
+    """View of the pokemon arrays of batched BattleFeatures as (B * 12, ...) arrays."""
+    return PokemonFeatures(*[field.reshape(-1, *field.shape[2:]) for field in features[:5]])
+
+
+def pokemon_fingerprint(poke: Optional[Pokemon]):
+    """Everything the featurized row of a pokemon depends on, as a hashable tuple."""
+    if poke is None:
+        return None
+
+    return (
+        poke.species,
+        poke.level,
+        poke.current_hp,
+        poke.max_hp,
+        poke.active,
+        tuple(poke.boosts.values()),
+        poke.status,
+        poke.status_counter,
+        tuple(poke.effects.items()),
+        tuple(poke.moves),
+        poke.preparing_move.id if poke.preparing_move else None,
+        poke.ability,
+        poke.item,
+        tuple(poke.types),
+        poke.gender,
+        poke.tera_type,
+        poke.is_terastallized,
+        poke.first_turn,
+        poke.must_recharge,
+        poke.protect_counter,
+        poke.revealed,
+        tuple(poke.stats.values()),
+    )
+
+
+def collate(features: List[BattleFeatures]) -> BattleFeatures:
+    return BattleFeatures(*[np.stack(field) for field in zip(*features)])
+
+
+class BattleFeaturizer:
+    """
+    Turns poke-env battles into BattleFeatures. Pure CPU work with no torch
+    dependency, so it can run in env worker processes.
+    """
+
+    def __init__(self, lookup: 'FeatureLookup'):
+        self.lookup = lookup
+
+    def featurize(self, battle: Battle) -> BattleFeatures:
+        return BattleFeatures(*[field[0] for field in self.featurize_batch([battle])])
+
+    def featurize_batch(self, battles: List[Battle]) -> BattleFeatures:
+        features = empty_features(len(battles))
+
+        pokemon = flatten_list([self.battle_pokemon(battle) for battle in battles])
+        self.featurize_pokemon(pokemon, out=flatten_pokemon(features))
+        self.featurize_battle_state(battles, out=features.battle_features)
+
+        return features
+
+    def featurize_pokemon(self, pokemon: List[Optional[Pokemon]], out: Optional[PokemonFeatures] = None) -> PokemonFeatures:
+        out = empty_pokemon_features(len(pokemon)) if out is None else out
+
+        for i, poke in enumerate(pokemon):
+            self._write_ids(poke, out, i)
+            if poke is not None:
+                self._write_pokemon(poke, out.pokemon_features[i])
+
+        return out
+
+    def featurize_battle_state(self, battles: List[Battle], out: Optional[np.ndarray] = None) -> np.ndarray:
+        out = np.zeros((len(battles), BATTLE_FEATURES), dtype=np.float32) if out is None else out
+
+        for battle, row in zip(battles, out):
+            self._write_battle_state(battle, row)
+
+        return out
+
+    @staticmethod
+    def battle_pokemon(battle: Battle) -> List[Optional[Pokemon]]:
+        return flatten_list([
+            battle.active_pokemon,
+            battle.opponent_active_pokemon,
+            pad([poke for poke in battle.available_switches], 5, None),
+            pad([poke for key, poke in battle.opponent_team.items() if not poke.active], 5, None)
+        ])
+
+    def _write_ids(self, poke: Optional[Pokemon], features: PokemonFeatures, i: int):
+        # the species' most used abilities, items and moves are looked up by the FeatureEncoder
+        features.species_ids[i] = self.lookup.pokemon[poke.species if poke is not None else 'nothing']
+        features.ability_ids[i] = self.lookup.abilities[poke.ability or 'unknown' if poke else 'nothing']
+        features.item_ids[i] = self.lookup.items[
+            (
+                poke.item or 'unknown'
+                if poke.item != 'unknown_item' else 'unknown'
+            ) if poke else 'nothing'
+        ]
+
+        # known moves, then the preparing move
+        # TODO - missing remaining move pp
+        moves = features.move_ids[i]
+        moves[:4] = [
+            self.lookup.moves[move] for move in
+            pad(list(poke.moves.keys()) if poke else [], 4, 'unknown')
+        ]
+        moves[4] = self.lookup.moves[poke.preparing_move.id if poke and poke.preparing_move else 'nothing']
+
+    @staticmethod
+    def _write_pokemon(poke: Pokemon, row: np.ndarray):
+        types = TYPE_VECTORIZER.size
+
+        section = row[POKEMON_LAYOUT['types']]
+        for i, type in enumerate(pad(poke.types, 3, None)):
+            pokemon_type_to_vec(type, out=section[i * types:(i + 1) * types])
+
+        gender_to_vec(poke.gender, out=row[POKEMON_LAYOUT['gender']])
+        row[POKEMON_LAYOUT['numeric']] = (
+            poke.level / 100,
+            poke.current_hp / 500,
+            poke.max_hp / 500,
+            poke.current_hp_fraction,
+            poke.active,
+            poke.boosts['accuracy'] / 6,
+            poke.boosts['atk'] / 6,
+            poke.boosts['def'] / 6,
+            poke.boosts['evasion'] / 6,
+            poke.boosts['spa'] / 6,
+            poke.boosts['spd'] / 6,
+            poke.boosts['spe'] / 6,
+        )
+        effects_to_vec(poke.effects, out=row[POKEMON_LAYOUT['effects']])
+        row[POKEMON_LAYOUT['tera_flags']] = (poke.first_turn, poke.is_terastallized)
+        pokemon_type_to_vec(poke.tera_type, out=row[POKEMON_LAYOUT['tera_type']])
+        row[POKEMON_LAYOUT['move_flags']] = (poke.must_recharge, poke.protect_counter, poke.revealed)
+        row[POKEMON_LAYOUT['stats']] = [(poke.stats[stat] or -500) / 500 for stat in STATS]
+        status_to_vec(poke.status, out=row[POKEMON_LAYOUT['status']])
+        row[POKEMON_LAYOUT['status_counter']] = poke.status_counter
+
+    @staticmethod
+    def _write_battle_state(battle: Battle, row: np.ndarray):
+        row[BATTLE_LAYOUT['turn']] = battle.turn
+        weathers_to_vec(battle.weather, battle.turn, out=row[BATTLE_LAYOUT['weather']])
+        fields_to_vec(battle.fields, battle.turn, out=row[BATTLE_LAYOUT['fields']])
+        side_conditions_to_vec(battle.opponent_side_conditions, battle.turn, out=row[BATTLE_LAYOUT['opponent_side']])
+        side_conditions_to_vec(battle.side_conditions, battle.turn, out=row[BATTLE_LAYOUT['side']])
+        row[BATTLE_LAYOUT['reviving']] = battle.reviving
+        pokemon_type_to_vec(battle.can_tera, out=row[BATTLE_LAYOUT['can_tera']])
+        row[BATTLE_LAYOUT['flags']] = (battle.opponent_can_tera, battle.force_switch)
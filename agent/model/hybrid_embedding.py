@@ -1,10 +1,12 @@
 import torch
 import torch.nn as nn
+from typing import Optional
 
 class HybridEmbedding(nn.Module):
     def __init__(self, num_embeddings, num_static_features, num_learnable_features, static_features):
         super().__init__()
         assert static_features.shape == (num_embeddings, num_static_features)
+        self.num_static_features = num_static_features
 
         # store fixed part (not learnable)
         self.register_buffer("static_features", static_features)
@@ -12,7 +14,18 @@ class HybridEmbedding(nn.Module):
         # learnable part
         self.learnable = nn.Embedding(num_embeddings, num_learnable_features)
 
-    def forward(self, indices):
+    @property
+    def dtype(self):
+        return self.static_features.dtype
+
+    def forward(self, indices, out: Optional[torch.Tensor] = None):
         static = self.static_features[indices]                 # (batch, num_static_features)
         learnable = self.learnable(indices)                    # (batch, num_learnable_features)
-        return torch.cat([static, learnable], dim=-1)  # (batch, num_static+num_learnable)
+
+        if out is None:
+            return torch.cat([static, learnable], dim=-1)  # (batch, num_static+num_learnable)
+
+        # write both parts straight into the caller's (batch, num_static+num_learnable) slice
+        out[..., :self.num_static_features] = static
+        out[..., self.num_static_features:] = learnable
+        return out
@@ -0,0 +1,231 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import warnings
+import numpy as np
+import torch
+from bisect import bisect_left
+from collections.abc import Mapping
+from typing import Dict, Optional
+
+from agent.model import DATA_PATH
+from agent.model.feature_lookup import FeatureLookup, SpeciesComponents
+
+
+MAGIC = b'PKLOOKUP'
+FORMAT_VERSION = 2
+ALIGNMENT = 64
+
+VOCABULARIES = ['abilities', 'items', 'moves', 'pokemon']
+TENSORS = ['ability_tensors', 'item_tensors', 'move_tensors', 'pokemon_tensors']
+
+# Bundle written by the data pipeline (see data_processing/process_bundle) and the files it is built from
+BUNDLE = 'bundle/lookup.bin'
+BUNDLE_SOURCES = [
+    *[f'lookup/{name}.json' for name in VOCABULARIES],
+    *[f'tensors/{name}.pt' for name in VOCABULARIES],
+    'tensors/pokemon_embeddings.pt',
+]
+
+
+class StringTable(Mapping):
+    """
+    Read-only str -> int mapping over sorted utf-8 keys packed in a buffer,
+    looked up by binary search. Keys that were looked up are memoized.
+    """
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray, values: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+        self.values = values
+        self.memo: Dict[str, int] = {}
+
+    @staticmethod
+    def pack(vocabulary: Dict[str, int]):
+        keys = sorted(vocabulary)
+        encoded = [key.encode() for key in keys]
+
+        blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        offsets = np.cumsum([0] + [len(key) for key in encoded]).astype(np.uint32)
+        values = np.array([vocabulary[key] for key in keys], dtype=np.int32)
+        return blob, offsets, values
+
+    def key(self, i: int) -> str:
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode()
+
+    def __getitem__(self, name: str) -> int:
+        value = self.memo.get(name)
+        if value is not None:
+            return value
+
+        i = bisect_left(range(len(self)), name, key=self.key)
+        if i == len(self) or self.key(i) != name:
+            raise KeyError(name)
+
+        value = self.memo[name] = int(self.values[i])
+        return value
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return (self.key(i) for i in range(len(self)))
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def pack_lookup(lookup: FeatureLookup, metadata: Optional[dict] = None) -> bytes:
+    """
+    Packs a FeatureLookup into one buffer:
+
+        MAGIC | version (u32) | header size (u32) | json header | aligned arrays...
+
+    The header holds the metadata and maps every array name to its dtype, shape
+    and offset.
+    """
+    arrays = {}
+    for name in VOCABULARIES:
+        blob, offsets, values = StringTable.pack(getattr(lookup, name))
+        arrays[f'{name}.blob'], arrays[f'{name}.offsets'], arrays[f'{name}.values'] = blob, offsets, values
+    for name in TENSORS:
+        arrays[name] = getattr(lookup, name).numpy()
+    arrays['species_components'] = lookup.species_components.numpy()
+
+    header, offset = {}, 0
+    for name, array in arrays.items():
+        header[name] = {'dtype': array.dtype.str, 'shape': array.shape, 'offset': offset}
+        offset = _align(offset + array.nbytes)
+
+    header_bytes = json.dumps({'metadata': metadata or {}, 'arrays': header}).encode()
+    start = _align(len(MAGIC) + 8 + len(header_bytes))
+
+    buffer = bytearray(start + offset)
+    buffer[:len(MAGIC) + 8] = MAGIC + struct.pack('<II', FORMAT_VERSION, len(header_bytes))
+    buffer[len(MAGIC) + 8:len(MAGIC) + 8 + len(header_bytes)] = header_bytes
+    for name, array in arrays.items():
+        position = start + header[name]['offset']
+        buffer[position:position + array.nbytes] = np.ascontiguousarray(array).tobytes()
+
+    return bytes(buffer)
+
+
+class PackedLookup:
+    """
+    FeatureLookup backed by a buffer from pack_lookup (ex. a memory-mapped
+    file). Nothing is parsed or copied, the vocabularies are StringTables and
+    the tensors are views of the buffer.
+    """
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+        magic, (version, header_size) = bytes(buffer[:len(MAGIC)]), struct.unpack_from('<II', buffer, len(MAGIC))
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise Exception(f'Not a version {FORMAT_VERSION} packed lookup')
+
+        header = json.loads(bytes(buffer[len(MAGIC) + 8:len(MAGIC) + 8 + header_size]))
+        start = _align(len(MAGIC) + 8 + header_size)
+        self.metadata = header['metadata']
+
+        arrays = {
+            name: np.frombuffer(buffer, dtype=entry['dtype'], count=int(np.prod(entry['shape'])), offset=start + entry['offset']).reshape(entry['shape'])
+            for name, entry in header['arrays'].items()
+        }
+
+        self.abilities, self.items, self.moves, self.pokemon = [
+            StringTable(arrays[f'{name}.blob'], arrays[f'{name}.offsets'], arrays[f'{name}.values'])
+            for name in VOCABULARIES
+        ]
+        self.ability_tensors, self.item_tensors, self.move_tensors, self.pokemon_tensors = [
+            torch.from_numpy(arrays[name]) for name in TENSORS
+        ]
+        self.species_components = torch.from_numpy(arrays['species_components'])
+        self.pokemon_embeddings = SpeciesComponents(self.pokemon, self.species_components)
+
+    def get_pokemon_embeddings(self, pokemon):
+        return [self.pokemon_embeddings[poke] for poke in pokemon]
+
+
+def default_shared_path(path: str = DATA_PATH) -> str:
+    # /dev/shm is memory backed on linux, elsewhere the page cache still shares the file
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    # keyed by the data it holds, so checkouts with different data never read each other's tables
+    uid = os.getuid() if hasattr(os, 'getuid') else 0
+    return os.path.join(directory, f'poke-agent-lookup-{uid}-{source_hash(path)[:16]}.bin')
+
+
+def source_hash(path: str) -> str:
+    """Hash of the data files a bundle is built from."""
+    digest = hashlib.sha256()
+    for source in BUNDLE_SOURCES:
+        with open(f'{path}/{source}', 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def publish_lookup(path: str, target: Optional[str] = None) -> str:
+    """Loads the lookup from the data directory once and writes it packed to `target` for attach_lookup."""
+    target = target or default_shared_path(path)
+    os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+
+    # written under a temporary name so attaching processes never see a partial file
+    temporary = f'{target}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(pack_lookup(FeatureLookup(path), metadata={'source_hash': source_hash(path)}))
+    os.replace(temporary, target)
+
+    return target
+
+
+def write_bundle(path: str) -> str:
+    return publish_lookup(path, f'{path}/{BUNDLE}')
+
+
+def attach_lookup(target: Optional[str] = None, path: str = DATA_PATH) -> PackedLookup:
+    """
+    Memory-maps a published lookup, by default the one published from the
+    data directory `path`. The mapping is copy-on-write, so every process
+    shares the same physical pages as long as nothing writes to them.
+    """
+    with open(target or default_shared_path(path), 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    return PackedLookup(buffer)
+
+
+def load_lookup(path: str, check: bool = True):
+    """
+    The bundle of the data directory when there is one, otherwise a FeatureLookup
+    parsed from the json and .pt files. A bundle that was not built from the
+    current data files is stale and they are parsed instead (a few ms of
+    hashing, check=False skips it).
+    """
+    if not os.path.exists(f'{path}/{BUNDLE}'):
+        return FeatureLookup(path)
+
+    lookup = attach_lookup(f'{path}/{BUNDLE}')
+    if check and lookup.metadata.get('source_hash') != source_hash(path):
+        warnings.warn(f'{path}/{BUNDLE} is stale, rebuild it with data_processing/process_bundle')
+        return FeatureLookup(path)
+    return lookup
+
+
+if __name__ == '__main__':
+    import time
+
+    target = publish_lookup('../../data')
+
+    start = time.perf_counter()
+    lookup = FeatureLookup('../../data')
+    print(f'FeatureLookup: {1000 * (time.perf_counter() - start):.1f} ms')
+
+    start = time.perf_counter()
+    packed = attach_lookup(target)
+    print(f'attach_lookup: {1000 * (time.perf_counter() - start):.1f} ms')
+
+    print(packed.moves['flamethrower'], lookup.moves['flamethrower'])
+    print(torch.equal(packed.pokemon_tensors, lookup.pokemon_tensors))
@@ -0,0 +1,42 @@
+import torch
+from typing import Dict, Hashable, Optional
+
+
+class PokemonCache:
+    """
+    Encoded pokemon rows from previous turns, kept per battle and per pokemon.
+
+    An entry is reused while the pokemon's fingerprint is unchanged. The whole
+    cache is dropped whenever the encoder's parameter version changes.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.battles: Dict[str, Dict[Hashable, tuple]] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def set_version(self, version):
+        if version != self.version:
+            self.clear()
+            self.version = version
+
+    def get(self, battle_tag: str, poke, fingerprint) -> Optional[torch.Tensor]:
+        entry = self.battles.get(battle_tag, {}).get(poke)
+
+        if entry is not None and entry[0] == fingerprint:
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        return None
+
+    def put(self, battle_tag: str, poke, fingerprint, row: torch.Tensor):
+        self.battles.setdefault(battle_tag, {})[poke] = (fingerprint, row)
+
+    def finish(self, battle_tag: str):
+        self.battles.pop(battle_tag, None)
+
+    def clear(self):
+        self.battles.clear()
@@ -0,0 +1,129 @@
+import copy
+import torch
+import torch.nn as nn
+from typing import Dict, Optional
+
+from agent.model.hybrid_embedding import HybridEmbedding
+from agent.model.feature_encoder import FeatureEncoder, features_to_tensors
+from agent.model.featurizer import BattleFeatures
+
+
+EMBEDDINGS = ['ability_embeddings', 'item_embeddings', 'move_embeddings', 'pokemon_embeddings']
+
+
+def quantize_int8(table: torch.Tensor, dim: int):
+    """Symmetric int8 quantization with one scale per slice along `dim`."""
+    scales = table.abs().amax(dim=dim, keepdim=True).clamp(min=1e-12) / 127
+    return torch.round(table / scales).to(torch.int8), scales
+
+
+class ReducedEmbedding(nn.Module):
+    """
+    Inference-only HybridEmbedding stored in bfloat16, or in int8
+    with a scale per static feature (their ranges differ wildly, ex. the pokemon
+    table goes up to ~650k) and a scale per learnable row.
+
+    Lookups are returned in `dtype`.
+    """
+
+    def __init__(self, embedding: HybridEmbedding, storage: torch.dtype, dtype: torch.dtype):
+        super(ReducedEmbedding, self).__init__()
+        self.num_static_features = embedding.num_static_features
+        self.output_dtype = dtype
+
+        static = embedding.static_features.detach()
+        learnable = embedding.learnable.weight.detach()
+
+        static_scales = learnable_scales = None
+        if storage == torch.int8:
+            static, static_scales = quantize_int8(static, dim=0)              # (1, S)
+            learnable, learnable_scales = quantize_int8(learnable, dim=1)     # (N, 1)
+            static_scales, learnable_scales = static_scales[0].to(dtype), learnable_scales.to(dtype)
+
+        self.register_buffer("static_features", static.to(storage))
+        self.register_buffer("learnable_weight", learnable.to(storage))
+        self.register_buffer("static_scales", static_scales)
+        self.register_buffer("learnable_scales", learnable_scales)
+
+    @property
+    def dtype(self):
+        return self.output_dtype
+
+    def forward(self, indices, out: Optional[torch.Tensor] = None):
+        static = self.static_features[indices].to(self.output_dtype)
+        learnable = self.learnable_weight[indices].to(self.output_dtype)
+
+        if self.static_scales is not None:
+            static = static * self.static_scales
+            learnable = learnable * self.learnable_scales[indices]
+
+        if out is None:
+            return torch.cat([static, learnable], dim=-1)
+
+        out[..., :self.num_static_features] = static
+        out[..., self.num_static_features:] = learnable
+        return out
+
+
+def quantize_encoder(encoder: FeatureEncoder, storage: torch.dtype = torch.bfloat16, dtype: Optional[torch.dtype] = None) -> FeatureEncoder:
+    """
+    Replaces (in place) the embeddings of a FeatureEncoder with ReducedEmbeddings
+    stored as bfloat16 or int8. The encoding is emitted in `dtype`, which
+    defaults to bfloat16. float16 is not supported, the static feature tables
+    have values past its range (ex. ~650k in the pokemon table).
+
+    Inference only, the result has no learnable parameters.
+    """
+    if storage not in (torch.bfloat16, torch.int8):
+        raise ValueError(f'Unsupported storage dtype: {storage}')
+
+    dtype = dtype or torch.bfloat16
+
+    # check every table before replacing any of them
+    for name in EMBEDDINGS:
+        embedding = getattr(encoder, name)
+        largest = max(embedding.static_features.abs().max().item(), embedding.learnable.weight.abs().max().item())
+        for type in (storage, dtype):
+            if type != torch.int8 and largest > torch.finfo(type).max:
+                raise ValueError(f'{name} has values up to {largest:.0f}, out of range for {type}')
+
+    for name in EMBEDDINGS:
+        setattr(encoder, name, ReducedEmbedding(getattr(encoder, name), storage, dtype))
+
+    encoder.invalidate()
+    return encoder
+
+
+def encoder_bytes(encoder: FeatureEncoder) -> int:
+    """Memory of the embedding tables and the cached species table."""
+    tensors = list(encoder.buffers()) + list(encoder.parameters()) + [encoder.species_table()]
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+
+def accuracy(reference: FeatureEncoder, reduced: FeatureEncoder, features: BattleFeatures) -> Dict[str, float]:
+    """Errors of a reduced-precision encoder against the float32 one on the same BattleFeatures."""
+    with torch.no_grad():
+        expected = reference(*features_to_tensors(features))
+        actual = reduced(*features_to_tensors(features)).float()
+
+    error = (actual - expected).abs()
+    return {
+        'max_abs_error': error.max().item(),
+        'mean_abs_error': error.mean().item(),
+        # relative to the magnitude of each value, small values are compared absolutely
+        'max_rel_error': (error / expected.abs().clamp(min=1)).max().item(),
+        'finite': bool(torch.isfinite(actual).all()),
+    }
+
+
+if __name__ == '__main__':
+    from agent.benchmarks.fixtures import make_battles
+    from agent.model.timestep_encoder import TimestepEncoder
+
+    model = TimestepEncoder(path='../../data')
+    features = model.featurizer.featurize_batch(make_battles(8))
+
+    print(f'float32: {encoder_bytes(model.encoder) / 2 ** 20:.1f} MB')
+    for storage in [torch.bfloat16, torch.int8]:
+        reduced = quantize_encoder(copy.deepcopy(model.encoder), storage)
+        print(f'{storage}: {encoder_bytes(reduced) / 2 ** 20:.1f} MB', accuracy(model.encoder, reduced, features))
@@ -0,0 +1,152 @@
+import numpy as np
+from typing import List, NamedTuple
+from poke_env.environment.battle import Battle, Pokemon
+
+from agent.util import pad, flatten_list
+from agent.model.featurizer import BattleFeaturizer, PokemonFeatures, NUM_SLOTS, MOVE_IDS
+from agent.model.featurizer import POKEMON_LAYOUT, POKEMON_FEATURES, BATTLE_LAYOUT, BATTLE_FEATURES, STATS
+from agent.model.to_vec import GENDER_VECTORIZER, TYPE_VECTORIZER, STATUS_VECTORIZER, EFFECT_VECTORIZER, WEATHER_VECTORIZER, FIELD_VECTORIZER, SIDE_CONDITION_VECTORIZER
+from agent.model.to_vec import STACKABLE_SIDE_CONDITIONS
+
+
+# Most effects a single pokemon can have at once (featurizing one with more fails)
+MAX_EFFECTS = 16
+
+# Dense columns that hold plain numbers rather than one-hots
+POKEMON_NUMERIC_COLUMNS = np.concatenate([
+    np.arange(POKEMON_FEATURES)[POKEMON_LAYOUT[section]]
+    for section in ['numeric', 'tera_flags', 'move_flags', 'stats', 'status_counter']
+])
+BATTLE_NUMERIC_COLUMNS = np.concatenate([
+    np.arange(BATTLE_FEATURES)[BATTLE_LAYOUT[section]]
+    for section in ['turn', 'reviving', 'flags']
+])
+
+# One-hot sections become the column of their hot entry (-1 when there is none):
+# 3 types, gender, tera type and status
+POKEMON_CATEGORIES = 6
+# one column per weather, field and side condition counter, then can_tera
+BATTLE_CATEGORIES = WEATHER_VECTORIZER.size + FIELD_VECTORIZER.size + 2 * SIDE_CONDITION_VECTORIZER.size + 1
+
+
+class SparseBattleFeatures(NamedTuple):
+    """
+    BattleFeatures with the mostly-zero one-hot sections replaced by the column
+    of their hot entry and the effects by (effect id, value) pairs. Padding
+    entries are -1. Densify (densify.py) turns these back into BattleFeatures exactly.
+    """
+    species_ids: np.ndarray         # (B, 12)                       int16
+    ability_ids: np.ndarray         # (B, 12)                       int16
+    item_ids: np.ndarray            # (B, 12)                       int16
+    move_ids: np.ndarray            # (B, 12, MOVE_IDS)             int16
+    pokemon_numeric: np.ndarray     # (B, 12, numeric columns)      float32
+    pokemon_categories: np.ndarray  # (B, 12, POKEMON_CATEGORIES)   int16
+    effect_ids: np.ndarray          # (B, 12, MAX_EFFECTS)          int16
+    effect_values: np.ndarray       # (B, 12, MAX_EFFECTS)          float32
+    battle_numeric: np.ndarray      # (B, numeric columns)          float32
+    battle_categories: np.ndarray   # (B, BATTLE_CATEGORIES)        int16
+
+
+def empty_sparse_features(batch_size: int) -> SparseBattleFeatures:
+    return SparseBattleFeatures(
+        species_ids=np.zeros((batch_size, NUM_SLOTS), dtype=np.int16),
+        ability_ids=np.zeros((batch_size, NUM_SLOTS), dtype=np.int16),
+        item_ids=np.zeros((batch_size, NUM_SLOTS), dtype=np.int16),
+        move_ids=np.zeros((batch_size, NUM_SLOTS, MOVE_IDS), dtype=np.int16),
+        pokemon_numeric=np.zeros((batch_size, NUM_SLOTS, len(POKEMON_NUMERIC_COLUMNS)), dtype=np.float32),
+        pokemon_categories=np.full((batch_size, NUM_SLOTS, POKEMON_CATEGORIES), -1, dtype=np.int16),
+        effect_ids=np.full((batch_size, NUM_SLOTS, MAX_EFFECTS), -1, dtype=np.int16),
+        effect_values=np.zeros((batch_size, NUM_SLOTS, MAX_EFFECTS), dtype=np.float32),
+        battle_numeric=np.zeros((batch_size, len(BATTLE_NUMERIC_COLUMNS)), dtype=np.float32),
+        battle_categories=np.full((batch_size, BATTLE_CATEGORIES), -1, dtype=np.int16),
+    )
+
+
+class SparseFeaturizer(BattleFeaturizer):
+    """BattleFeaturizer that emits SparseBattleFeatures."""
+
+    def featurize_batch(self, battles: List[Battle]) -> SparseBattleFeatures:
+        features = empty_sparse_features(len(battles))
+
+        pokemon = flatten_list([self.battle_pokemon(battle) for battle in battles])
+        ids = PokemonFeatures(*[field.reshape(-1, *field.shape[2:]) for field in features[:4]], pokemon_features=None)
+        numeric = features.pokemon_numeric.reshape(-1, len(POKEMON_NUMERIC_COLUMNS))
+        categories = features.pokemon_categories.reshape(-1, POKEMON_CATEGORIES)
+        effect_ids = features.effect_ids.reshape(-1, MAX_EFFECTS)
+        effect_values = features.effect_values.reshape(-1, MAX_EFFECTS)
+
+        for i, poke in enumerate(pokemon):
+            self._write_ids(poke, ids, i)
+            if poke is not None:
+                self._write_sparse_pokemon(poke, numeric[i], categories[i], effect_ids[i], effect_values[i])
+
+        for i, battle in enumerate(battles):
+            self._write_sparse_battle_state(battle, features.battle_numeric[i], features.battle_categories[i])
+
+        return features
+
+    @staticmethod
+    def _write_sparse_pokemon(poke: Pokemon, numeric, categories, effect_ids, effect_values):
+        numeric[:] = (
+            poke.level / 100,
+            poke.current_hp / 500,
+            poke.max_hp / 500,
+            poke.current_hp_fraction,
+            poke.active,
+            poke.boosts['accuracy'] / 6,
+            poke.boosts['atk'] / 6,
+            poke.boosts['def'] / 6,
+            poke.boosts['evasion'] / 6,
+            poke.boosts['spa'] / 6,
+            poke.boosts['spd'] / 6,
+            poke.boosts['spe'] / 6,
+            poke.first_turn,
+            poke.is_terastallized,
+            poke.must_recharge,
+            poke.protect_counter,
+            poke.revealed,
+            *[(poke.stats[stat] or -500) / 500 for stat in STATS],
+            poke.status_counter,
+        )
+
+        types = TYPE_VECTORIZER.size
+        for i, type in enumerate(pad(poke.types, 3, None)):
+            if type is not None:
+                categories[i] = POKEMON_LAYOUT['types'].start + i * types + TYPE_VECTORIZER.index[type]
+        if poke.gender is not None:
+            categories[3] = POKEMON_LAYOUT['gender'].start + GENDER_VECTORIZER.index[poke.gender]
+        if poke.tera_type is not None:
+            categories[4] = POKEMON_LAYOUT['tera_type'].start + TYPE_VECTORIZER.index[poke.tera_type]
+        if poke.status is not None:
+            categories[5] = POKEMON_LAYOUT['status'].start + STATUS_VECTORIZER.index[poke.status]
+
+        assert len(poke.effects) <= MAX_EFFECTS, f'{poke.species} has {len(poke.effects)} effects, the sparse format holds {MAX_EFFECTS}'
+        for i, (effect, value) in enumerate(poke.effects.items()):
+            effect_ids[i] = EFFECT_VECTORIZER.index[effect]
+            effect_values[i] = value
+
+    @staticmethod
+    def _write_sparse_battle_state(battle: Battle, numeric, categories):
+        numeric[:] = (battle.turn, battle.reviving, battle.opponent_can_tera, battle.force_switch)
+
+        # every counter starts at its zero column
+        sections = [
+            (WEATHER_VECTORIZER, BATTLE_LAYOUT['weather'], battle.weather),
+            (FIELD_VECTORIZER, BATTLE_LAYOUT['fields'], battle.fields),
+            (SIDE_CONDITION_VECTORIZER, BATTLE_LAYOUT['opponent_side'], battle.opponent_side_conditions),
+            (SIDE_CONDITION_VECTORIZER, BATTLE_LAYOUT['side'], battle.side_conditions),
+        ]
+
+        start = 0
+        for vectorizer, section, values in sections:
+            counters = categories[start:start + vectorizer.size]
+            counters[:] = [section.start + offset for offset in vectorizer.offsets]
+
+            for member, value in values.items():
+                value = value if member in STACKABLE_SIDE_CONDITIONS else battle.turn - value
+                counters[vectorizer.index[member]] = section.start + vectorizer.counter_position(member, value)
+
+            start += vectorizer.size
+
+        if battle.can_tera is not None:
+            categories[start] = BATTLE_LAYOUT['can_tera'].start + TYPE_VECTORIZER.index[battle.can_tera]
@@ -1,170 +1,128 @@
+import numpy as np
 import torch
 import torch.nn as nn
-from typing import List, Optional
-from poke_env.environment.battle import Battle, Pokemon
+from typing import List, Optional, Union
+from poke_env.environment.battle import Battle
 
-from agent.util import pad, flatten_list
-from agent.model.feature_lookup import FeatureLookup
-from agent.model.hybrid_embedding import HybridEmbedding
-from agent.model.to_vec import gender_to_vec, effects_to_vec, pokemon_type_to_vec, status_to_vec, weathers_to_vec, fields_to_vec, side_conditions_to_vec
+from agent.model.packed_lookup import load_lookup
+from agent.model.featurizer import BattleFeaturizer, pokemon_fingerprint
+from agent.model.pokemon_cache import PokemonCache
+from agent.model.sparse import SparseBattleFeatures
+from agent.model.densify import Densify
+from agent.model.quantize import quantize_encoder
+from agent.model.feature_encoder import FeatureEncoder, features_to_tensors, ENCODING_FEATURES, ENCODED_POKEMON_FEATURES
+from agent.model.featurizer import NUM_SLOTS
+from agent.tracing import span
+from agent.model.feature_encoder import NUM_ABILITIES, NUM_ITEMS, NUM_MOVES, NUM_POKEMON, STATIC_FEATURES, LEARNABLE_FEATURES
 
 
-NUM_ABILITIES = 313
-NUM_ITEMS = 250
-NUM_MOVES = 687
-NUM_POKEMON = 1331
 
-class STATIC_FEATURES:
-    ABILITIES = 1
-    ITEMS = 1
-    MOVES = 104
-    POKEMON = 241
+class TimestepEncoder(nn.Module):
+    """
+    Encodes poke-env battles into flat timestep vectors.
 
-class LEARNABLE_FEATURES:
-    ABILITIES = 50
-    ITEMS = 50
-    MOVES = 50
-    POKEMON = 50
+    This is the BattleFeaturizer (battle -> numpy arrays) and the tensor-only
+    FeatureEncoder (arrays -> encoding) chained together. Use those two
+    directly to run featurization and the model in different processes.
 
+    With incremental=True (and gradients disabled) every pokemon's encoded row
+    is cached across turns and only re-encoded when its state changed.
 
+    Both forward methods accept an `out` tensor or float32 numpy array (ex. a
+    row of a pinned / shared-memory rollout buffer) that the encoding is
+    written into instead of a newly allocated tensor.
 
-class TimestepEncoder(nn.Module):
-    def __init__(self, path):
+    reduce_precision() turns it into an inference-only encoder (for actors)
+    with bfloat16 / int8 tables and a reduced-precision encoding.
+    """
+
+    def __init__(self, path, incremental=False, lookup=None):
         super(TimestepEncoder, self).__init__()
-        self.lookup = FeatureLookup(path)
-
-        self.ability_embeddings = HybridEmbedding(NUM_ABILITIES, STATIC_FEATURES.ABILITIES, LEARNABLE_FEATURES.ABILITIES, self.lookup.ability_tensors)
-        self.item_embeddings = HybridEmbedding(NUM_ITEMS, STATIC_FEATURES.ITEMS, LEARNABLE_FEATURES.ITEMS, self.lookup.item_tensors)
-        self.move_embeddings = HybridEmbedding(NUM_MOVES, STATIC_FEATURES.MOVES, LEARNABLE_FEATURES.MOVES, self.lookup.move_tensors)
-        self.pokemon_embeddings = HybridEmbedding(NUM_POKEMON, STATIC_FEATURES.POKEMON, LEARNABLE_FEATURES.POKEMON, self.lookup.pokemon_tensors)
-
-    def _encode_pokemon_species(self, pokemon : List[str]) -> torch.Tensor:
-        pokemon_ids = torch.tensor([self.lookup.pokemon[poke] for poke in pokemon])
-        feature_tensor = self.pokemon_embeddings(pokemon_ids)
-
-        embeddings = self.lookup.get_pokemon_embeddings(pokemon)
-        embeddings_tensor = torch.stack([torch.cat([
-            self.ability_embeddings(torch.tensor(features['abilities'])).flatten(),
-            self.item_embeddings(torch.tensor(features['items'])).flatten(),
-            self.move_embeddings(torch.tensor(features['moves'])).flatten(),
-        ]) for features in embeddings])
-
-        return torch.cat([feature_tensor, embeddings_tensor], dim=1)
-
-    def _encode_pokemon(self, pokemon : List[Optional[Pokemon]]) -> torch.Tensor:
-        features = torch.stack([torch.tensor(flatten_list([
-            flatten_list([                        # 60
-                pokemon_type_to_vec(type)
-                for type in
-                pad(poke.types, 3, None)
-            ]),
-            gender_to_vec(poke.gender),           # 3
-            poke.level / 100,                     # 1
-            poke.current_hp / 500,                # 1
-            poke.max_hp / 500,                    # 1
-            poke.current_hp_fraction,             # 1
-            poke.active,                          # 1
-            poke.boosts['accuracy'] / 6,          # 1
-            poke.boosts['atk'] / 6,               # 1
-            poke.boosts['def'] / 6,               # 1
-            poke.boosts['evasion'] / 6,           # 1
-            poke.boosts['spa'] / 6,               # 1
-            poke.boosts['spd'] / 6,               # 1
-            poke.boosts['spe'] / 6,               # 1
-            effects_to_vec(poke.effects),         # 230   (224 in original poke-env)
-            poke.first_turn,                      # 1
-            poke.is_terastallized,                # 1
-            pokemon_type_to_vec(poke.tera_type),  # 20
-            poke.must_recharge,                   # 1
-            poke.protect_counter,                 # 1
-            poke.revealed,                        # 1
-            (poke.stats['hp'] or -500) / 500,     # 1
-            (poke.stats['atk'] or -500) / 500,    # 1
-            (poke.stats['def'] or -500) / 500,    # 1
-            (poke.stats['spa'] or -500) / 500,    # 1
-            (poke.stats['spd'] or -500) / 500,    # 1
-            (poke.stats['spe'] or -500) / 500,    # 1
-            status_to_vec(poke.status),           # 7
-            poke.status_counter,                  # 1
-        ])) if poke is not None else torch.zeros(344) for poke in pokemon])
-
-        abilities = self.ability_embeddings(torch.tensor([
-            self.lookup.abilities[poke.ability or 'unknown' if poke else 'nothing'] for poke in pokemon
-        ]))
-
-        # TODO - missing remaining move pp
-        moves = torch.stack([
-            self.move_embeddings(torch.tensor([
-                self.lookup.moves[move] for move in
-                pad(list(poke.moves.keys()) if poke else [], 4, 'unknown')
-            ])).flatten()
-            for poke in pokemon
-        ])
-
-        items = self.item_embeddings(torch.tensor([
-            self.lookup.items[
-                (
-                    poke.item or 'unknown'
-                    if poke.item != 'unknown_item' else 'unknown'
-                ) if poke else 'nothing'
-            ] for poke in pokemon
-        ]))
-
-        preparing_moves = self.move_embeddings(torch.tensor([
-            self.lookup.moves[poke.preparing_move.id if poke and poke.preparing_move else 'nothing'] for poke in pokemon
-        ]))
-
-        return torch.cat([features, abilities, moves, items, preparing_moves], dim=1)
-
-    def _encode_battle_state(self, battle: Battle) -> torch.Tensor:
-        tensor = torch.tensor(flatten_list([
-            battle.turn,                                                            # 1
-            weathers_to_vec(battle.weather, battle.turn),                           # 9
-            fields_to_vec(battle.fields, battle.turn),                              # 13
-            side_conditions_to_vec(battle.opponent_side_conditions, battle.turn),   # 24
-            side_conditions_to_vec(battle.side_conditions, battle.turn),            # 24
-            battle.reviving,                                                        # 1
-            pokemon_type_to_vec(battle.can_tera),                                   # 20
-            battle.opponent_can_tera,                                               # 1
-            battle.force_switch,                                                    # 1
-        ]))
-
-        return tensor
-
-    def forward(self, battle: Battle):
-        # ----------------
-        # POKEMON FEATURES
-        # ----------------
-        pokemon: List[Optional[Pokemon]] = flatten_list([
-            battle.active_pokemon,
-            battle.opponent_active_pokemon,
-            pad([poke for poke in battle.available_switches], 5, None),
-            pad([poke for key, poke in battle.opponent_team.items() if not poke.active], 5, None)
-        ])
-
-        # Species related features
-        pokemon_species = [poke.species if poke is not None else 'nothing' for poke in pokemon]
-        species_features = self._encode_pokemon_species(pokemon_species)
-
-        # Individual and Battle related features
-        individual_features = self._encode_pokemon(pokemon)
-
-        # Final Pokemon features
-        pokemon_features = torch.cat([species_features, individual_features], dim=1)
-
-
-        # ----------------
-        # BATTLE CONDITION FEATURES
-        # ----------------
-        battle_state = self._encode_battle_state(battle)
-
-        return torch.cat([pokemon_features.flatten(), battle_state])
+        # a lookup attached from shared memory (see packed_lookup.py) can be passed instead of loading from path
+        self.lookup = lookup if lookup is not None else load_lookup(path)
+
+        self.featurizer = BattleFeaturizer(self.lookup)
+        self.encoder = FeatureEncoder(self.lookup)
+
+        self.incremental = incremental
+        self.cache = PokemonCache()
+
+        self.densify = Densify()
+
+    def reduce_precision(self, storage: torch.dtype = torch.bfloat16, dtype: Optional[torch.dtype] = None):
+        quantize_encoder(self.encoder, storage, dtype)
+        self.cache.clear()
+        return self
+
+    def forward(self, battle: Battle, out: Optional[Union[torch.Tensor, np.ndarray]] = None):
+        return self.forward_batch([battle], out=out[None] if out is not None else None)[0]
+
+    def forward_batch(self, battles: List[Battle], out: Optional[Union[torch.Tensor, np.ndarray]] = None) -> torch.Tensor:
+        if isinstance(out, np.ndarray):
+            out = torch.from_numpy(out)
+        if out is not None:
+            assert out.shape == (len(battles), ENCODING_FEATURES)
+
+        if self.incremental and not torch.is_grad_enabled():
+            return self._forward_incremental(battles, out)
+
+        with span('featurize'):
+            features = self.featurizer.featurize_batch(battles)
+        with span('encode'):
+            return self.encoder(*features_to_tensors(features), out=out)
+
+    def forward_sparse(self, features: SparseBattleFeatures, out: Optional[torch.Tensor] = None) -> torch.Tensor:
+        """Encodes batched SparseBattleFeatures (ex. sent by env workers running a SparseFeaturizer)."""
+        with span('densify'):
+            features = self.densify(features_to_tensors(features, device=self.encoder.species_components.device))
+        with span('encode'):
+            return self.encoder(*features, out=out)
+
+    def _forward_incremental(self, battles: List[Battle], out: Optional[torch.Tensor]) -> torch.Tensor:
+        self.cache.set_version(self.encoder.parameter_version())
+
+        if out is None:
+            out = torch.empty((len(battles), ENCODING_FEATURES), dtype=self.encoder.dtype)
+
+        missing = []
+        with span('cache'):
+            for i, battle in enumerate(battles):
+                for slot, poke in enumerate(self.featurizer.battle_pokemon(battle)):
+                    fingerprint = pokemon_fingerprint(poke)
+                    row = self.cache.get(battle.battle_tag, poke, fingerprint)
+
+                    if row is None:
+                        missing.append((i, slot, battle.battle_tag, poke, fingerprint))
+                    else:
+                        out[i, slot * ENCODED_POKEMON_FEATURES:(slot + 1) * ENCODED_POKEMON_FEATURES] = row
+
+        # Only pokemon whose state changed are featurized and encoded
+        if missing:
+            with span('featurize', args=lambda: {'pokemon': len(missing)}):
+                features = self.featurizer.featurize_pokemon([poke for _, _, _, poke, _ in missing])
+            with span('encode', args=lambda: {'pokemon': len(missing)}):
+                encoded = self.encoder.encode_pokemon(*features_to_tensors(features))
+
+            for (i, slot, battle_tag, poke, fingerprint), row in zip(missing, encoded):
+                self.cache.put(battle_tag, poke, fingerprint, row)
+                out[i, slot * ENCODED_POKEMON_FEATURES:(slot + 1) * ENCODED_POKEMON_FEATURES] = row
+
+        with span('featurize_battle_state'):
+            battle_features = self.featurizer.featurize_battle_state(battles)
+        out[:, NUM_SLOTS * ENCODED_POKEMON_FEATURES:] = torch.from_numpy(battle_features)
+
+        for battle in battles:
+            if battle.finished:
+                self.cache.finish(battle.battle_tag)
+
+        return out
 
 
 
 if __name__ == '__main__':
     model = TimestepEncoder(path='../../data')
 
-    print(model._encode_pokemon_species(['ivysaur', 'venusaur']).shape)
+    features = model.featurizer.featurize_batch([])
+    print([field.shape for field in features])
 
 
@@ -1,26 +1,80 @@
 import numpy as np
-from enum import Enum
-from typing import Dict
+from typing import Dict, Optional
 from poke_env.environment import PokemonGender, PokemonType, Effect, Status, Weather, Field, SideCondition
 
 
-def enum_to_one_hot(enum_cls, member):
-    """Convert an enum member to a one-hot numpy array."""
-    members = list(enum_cls)
-    one_hot = np.zeros(len(members), dtype=int)
-    if member is not None:
-        idx = members.index(member)
-        one_hot[idx] = 1
-    return one_hot.tolist()
+class EnumVectorizer:
+    """
+    Encodes members of an enum into preallocated numpy arrays.
 
-def gender_to_vec(gender: PokemonGender):
-    return enum_to_one_hot(PokemonGender, gender)
+    The member -> index table (and for counters the offset of every member's
+    block) is built once, so encoding a member is a dict lookup and a write.
+    """
 
-def pokemon_type_to_vec(type: PokemonType):
-    return enum_to_one_hot(PokemonType, type)
+    def __init__(self, enum_cls, max_values=None):
+        self.members = list(enum_cls)
+        self.index = {member: i for i, member in enumerate(self.members)}
+        self.size = len(self.members)
 
-def status_to_vec(status: Status):
-    return enum_to_one_hot(Status, status)
+        # Counter encoding: every member gets a one-hot block of max_value + 1
+        self.max_values = None
+        self.offsets = None
+        self.counter_size = 0
+        self.empty_counters = None
+
+        if max_values is not None:
+            assert len(max_values) == self.size
+            self.max_values = list(max_values)
+            self.offsets = [int(offset) for offset in np.cumsum([0] + [value + 1 for value in self.max_values[:-1]])]
+            self.counter_size = sum(self.max_values) + self.size
+            self.empty_counters = np.zeros(self.counter_size, dtype=np.float32)
+            self.empty_counters[self.offsets] = 1
+
+    def one_hot(self, member, out: Optional[np.ndarray] = None) -> np.ndarray:
+        out = _output(out, self.size)
+        out[:] = 0
+        if member is not None:
+            out[self.index[member]] = 1
+        return out
+
+    def values(self, values: Dict, out: Optional[np.ndarray] = None) -> np.ndarray:
+        out = _output(out, self.size)
+        out[:] = 0
+        for member, value in values.items():
+            out[self.index[member]] = value
+        return out
+
+    def reset_counters(self, out: Optional[np.ndarray] = None) -> np.ndarray:
+        out = _output(out, self.counter_size)
+        out[:] = self.empty_counters
+        return out
+
+    def set_counter(self, member, value: int, out: np.ndarray):
+        out[self.offsets[self.index[member]]] = 0
+        out[self.counter_position(member, value)] = 1
+
+    def counter_position(self, member, value: int) -> int:
+        # values past the known maximum (ex. an extended weather) are clamped
+        i = self.index[member]
+        return self.offsets[i] + min(max(value, 0), self.max_values[i])
+
+
+def _output(out, size):
+    return np.zeros(size, dtype=np.float32) if out is None else out
+
+
+GENDER_VECTORIZER = EnumVectorizer(PokemonGender)
+TYPE_VECTORIZER = EnumVectorizer(PokemonType)
+STATUS_VECTORIZER = EnumVectorizer(Status)
+
+def gender_to_vec(gender: PokemonGender, out: Optional[np.ndarray] = None):
+    return GENDER_VECTORIZER.one_hot(gender, out)
+
+def pokemon_type_to_vec(type: PokemonType, out: Optional[np.ndarray] = None):
+    return TYPE_VECTORIZER.one_hot(type, out)
+
+def status_to_vec(status: Status, out: Optional[np.ndarray] = None):
+    return STATUS_VECTORIZER.one_hot(status, out)
 
 
 # EFFECT
@@ -28,16 +82,13 @@ def status_to_vec(status: Status):
 # and not worth it, so I'm not doing it.
 effect_max_value = []
 
-def effect_to_vec(effect: Effect):
-    return enum_to_one_hot(Effect, effect)
-
-def effects_to_vec(effects: Dict[Effect, int]):
-    vector = np.zeros(len(Effect), dtype=int)
+EFFECT_VECTORIZER = EnumVectorizer(Effect)
 
-    for effect, value in effects.items():
-        vector += np.array(effect_to_vec(effect)) * value
+def effect_to_vec(effect: Effect, out: Optional[np.ndarray] = None):
+    return EFFECT_VECTORIZER.one_hot(effect, out)
 
-    return vector.tolist()
+def effects_to_vec(effects: Dict[Effect, int], out: Optional[np.ndarray] = None):
+    return EFFECT_VECTORIZER.values(effects, out)
 
 
 # WEATHER
@@ -64,20 +115,18 @@ weather_max_values = [
 #           if Weather.from_showdown_message(weather) not in self._weather:
 #               self._weather = {Weather.from_showdown_message(weather): self.turn}
 
-def weather_to_vec(weather: Weather):
-    return enum_to_one_hot(Weather, weather)
+WEATHER_VECTORIZER = EnumVectorizer(Weather, weather_max_values)
 
-def weathers_to_vec(weathers: Dict[Weather, int], turn: int):
-    vector = np.zeros(len(Weather), dtype=int)
+def weather_to_vec(weather: Weather, out: Optional[np.ndarray] = None):
+    return WEATHER_VECTORIZER.one_hot(weather, out)
 
-    for weather, value in weathers.items():
-        vector += np.array(weather_to_vec(weather)) * (turn - value)
+def weathers_to_vec(weathers: Dict[Weather, int], turn: int, out: Optional[np.ndarray] = None):
+    out = WEATHER_VECTORIZER.reset_counters(out)
 
-    features = []
-    for value, max_value in zip(vector, weather_max_values):
-        features.append(np.eye(max_value + 1)[value])
+    for weather, value in weathers.items():
+        WEATHER_VECTORIZER.set_counter(weather, turn - value, out)
 
-    return np.concatenate(features, axis=0).tolist()
+    return out
 
 
 # FIELDS
@@ -97,20 +146,18 @@ field_max_values = [
     5, # WONDER_ROOM
 ]
 
-def field_to_vec(field: Field):
-    return enum_to_one_hot(Field, field)
+FIELD_VECTORIZER = EnumVectorizer(Field, field_max_values)
 
-def fields_to_vec(fields: Dict[Field, int], turn: int):
-    vector = np.zeros(len(Field), dtype=int)
+def field_to_vec(field: Field, out: Optional[np.ndarray] = None):
+    return FIELD_VECTORIZER.one_hot(field, out)
 
-    for field, value in fields.items():
-        vector += np.array(field_to_vec(field)) * (turn - value)
+def fields_to_vec(fields: Dict[Field, int], turn: int, out: Optional[np.ndarray] = None):
+    out = FIELD_VECTORIZER.reset_counters(out)
 
-    features = []
-    for value, max_value in zip(vector, field_max_values):
-        features.append(np.eye(max_value + 1)[value])
+    for field, value in fields.items():
+        FIELD_VECTORIZER.set_counter(field, turn - value, out)
 
-    return np.concatenate(features, axis=0).tolist()
+    return out
 
 
 # SIDE CONDITIONS
@@ -141,23 +188,24 @@ side_condition_max_values = [
     1, # WIDE_GUARD
 ]
 
-def side_condition_to_vec(side_condition: SideCondition):
-    return enum_to_one_hot(SideCondition, side_condition)
+SIDE_CONDITION_VECTORIZER = EnumVectorizer(SideCondition, side_condition_max_values)
+
+# stackable side conditions store their number of layers instead of a start turn
+STACKABLE_SIDE_CONDITIONS = {SideCondition.SPIKES, SideCondition.TOXIC_SPIKES}
 
-def side_conditions_to_vec(side_conditions: Dict[SideCondition, int], turn: int):
-    vector = np.zeros(len(SideCondition), dtype=int)
+def side_condition_to_vec(side_condition: SideCondition, out: Optional[np.ndarray] = None):
+    return SIDE_CONDITION_VECTORIZER.one_hot(side_condition, out)
+
+def side_conditions_to_vec(side_conditions: Dict[SideCondition, int], turn: int, out: Optional[np.ndarray] = None):
+    out = SIDE_CONDITION_VECTORIZER.reset_counters(out)
 
     for side_condition, value in side_conditions.items():
-        if side_condition in [SideCondition.SPIKES, SideCondition.TOXIC_SPIKES]:
-            vector += np.array(side_condition_to_vec(side_condition)) * value
+        if side_condition in STACKABLE_SIDE_CONDITIONS:
+            SIDE_CONDITION_VECTORIZER.set_counter(side_condition, value, out)
         else:
-            vector += np.array(side_condition_to_vec(side_condition)) * (turn - value)
-
-    features = []
-    for value, max_value in zip(vector, side_condition_max_values):
-        features.append(np.eye(max_value + 1)[value])
+            SIDE_CONDITION_VECTORIZER.set_counter(side_condition, turn - value, out)
 
-    return np.concatenate(features, axis=0).tolist()
+    return out
 
 
 
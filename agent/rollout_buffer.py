@@ -0,0 +1,181 @@
+"""
+Rollout storage of timesteps in a compact form of the sparse feature format
+(see agent/model/sparse.py) instead of flat float32 encodings:
+
+    ids and one-hot columns     int16
+    0/1 flags                   bits (np.packbits)
+    other numbers               float16
+
+A step of one env takes ~1.7 KB instead of the ~200 KB of its encoding. The
+model input is rebuilt at training time with expand() and
+TimestepEncoder.forward_sparse().
+"""
+
+import numpy as np
+from typing import NamedTuple, Optional
+
+from agent.model.sparse import SparseBattleFeatures, empty_sparse_features, POKEMON_NUMERIC_COLUMNS, BATTLE_NUMERIC_COLUMNS
+from agent.model.featurizer import POKEMON_LAYOUT, BATTLE_LAYOUT
+from agent.vector_env import ACTION_SPACE_SIZE
+
+
+def numeric_positions(layout: dict, numeric_columns: np.ndarray, columns: list) -> np.ndarray:
+    """Positions in the sparse numeric arrays of dense layout columns, given as (section, offset in the section)."""
+    dense = [layout[section].start + offset for section, offset in columns]
+    assert all(column in numeric_columns for column in dense), 'flag columns have to be numeric columns'
+    return np.array([np.flatnonzero(numeric_columns == column)[0] for column in dense])
+
+
+# Columns of pokemon_numeric / battle_numeric that only hold 0 or 1
+POKEMON_FLAGS = numeric_positions(POKEMON_LAYOUT, POKEMON_NUMERIC_COLUMNS, [
+    ('numeric', 4),                                     # active
+    ('tera_flags', 0), ('tera_flags', 1),               # first_turn, is_terastallized
+    ('move_flags', 0), ('move_flags', 2),               # must_recharge, revealed
+])
+BATTLE_FLAGS = numeric_positions(BATTLE_LAYOUT, BATTLE_NUMERIC_COLUMNS, [
+    ('reviving', 0),
+    ('flags', 0), ('flags', 1),                         # opponent_can_tera, force_switch
+])
+
+POKEMON_VALUES = np.setdiff1d(np.arange(len(POKEMON_NUMERIC_COLUMNS)), POKEMON_FLAGS)
+BATTLE_VALUES = np.setdiff1d(np.arange(len(BATTLE_NUMERIC_COLUMNS)), BATTLE_FLAGS)
+
+
+class CompactFeatures(NamedTuple):
+    """SparseBattleFeatures with flags bit-packed and numbers in float16."""
+    species_ids: np.ndarray         # (..., 12)                     int16
+    ability_ids: np.ndarray         # (..., 12)                     int16
+    item_ids: np.ndarray            # (..., 12)                     int16
+    move_ids: np.ndarray            # (..., 12, MOVE_IDS)           int16
+    pokemon_flags: np.ndarray       # (..., 12, 1)                  uint8
+    pokemon_values: np.ndarray      # (..., 12, values)             float16
+    pokemon_categories: np.ndarray  # (..., 12, POKEMON_CATEGORIES) int16
+    effect_ids: np.ndarray          # (..., 12, MAX_EFFECTS)        int16
+    effect_values: np.ndarray       # (..., 12, MAX_EFFECTS)        float16
+    battle_flags: np.ndarray        # (..., 1)                      uint8
+    battle_values: np.ndarray       # (..., values)                 float16
+    battle_categories: np.ndarray   # (..., BATTLE_CATEGORIES)      int16
+
+
+def compact(features: SparseBattleFeatures) -> CompactFeatures:
+    return CompactFeatures(
+        species_ids=features.species_ids.astype(np.int16),
+        ability_ids=features.ability_ids.astype(np.int16),
+        item_ids=features.item_ids.astype(np.int16),
+        move_ids=features.move_ids.astype(np.int16),
+        pokemon_flags=np.packbits(features.pokemon_numeric[..., POKEMON_FLAGS] != 0, axis=-1),
+        pokemon_values=features.pokemon_numeric[..., POKEMON_VALUES].astype(np.float16),
+        pokemon_categories=features.pokemon_categories.astype(np.int16),
+        effect_ids=features.effect_ids.astype(np.int16),
+        effect_values=features.effect_values.astype(np.float16),
+        battle_flags=np.packbits(features.battle_numeric[..., BATTLE_FLAGS] != 0, axis=-1),
+        battle_values=features.battle_numeric[..., BATTLE_VALUES].astype(np.float16),
+        battle_categories=features.battle_categories.astype(np.int16),
+    )
+
+
+def expand(features: CompactFeatures) -> SparseBattleFeatures:
+    """Inverse of compact(), exact except for the float16 rounding of the numbers."""
+    pokemon_numeric = np.empty((*features.pokemon_values.shape[:-1], len(POKEMON_NUMERIC_COLUMNS)), dtype=np.float32)
+    pokemon_numeric[..., POKEMON_FLAGS] = np.unpackbits(features.pokemon_flags, axis=-1, count=len(POKEMON_FLAGS))
+    pokemon_numeric[..., POKEMON_VALUES] = features.pokemon_values
+
+    battle_numeric = np.empty((*features.battle_values.shape[:-1], len(BATTLE_NUMERIC_COLUMNS)), dtype=np.float32)
+    battle_numeric[..., BATTLE_FLAGS] = np.unpackbits(features.battle_flags, axis=-1, count=len(BATTLE_FLAGS))
+    battle_numeric[..., BATTLE_VALUES] = features.battle_values
+
+    return SparseBattleFeatures(
+        species_ids=features.species_ids,
+        ability_ids=features.ability_ids,
+        item_ids=features.item_ids,
+        move_ids=features.move_ids,
+        pokemon_numeric=pokemon_numeric,
+        pokemon_categories=features.pokemon_categories,
+        effect_ids=features.effect_ids,
+        effect_values=features.effect_values.astype(np.float32),
+        battle_numeric=battle_numeric,
+        battle_categories=features.battle_categories,
+    )
+
+
+class RolloutBuffer:
+    """
+    (num_steps, num_envs) ring of compact timesteps with their actions,
+    rewards, episode ends and packed action masks.
+
+        buffer.add(featurizer.featurize_batch(env.battles), actions, rewards, terminated, masks)
+        encodings = encoder.forward_sparse(buffer.features(steps, envs))
+    """
+
+    def __init__(self, num_steps: int, num_envs: int):
+        self.num_steps = num_steps
+        self.num_envs = num_envs
+        self.step = 0
+        self.full = False
+
+        template = compact(empty_sparse_features(num_envs))
+        self.observations = CompactFeatures(*[np.zeros((num_steps, *field.shape), dtype=field.dtype) for field in template])
+
+        self.actions = np.zeros((num_steps, num_envs), dtype=np.int16)
+        self.rewards = np.zeros((num_steps, num_envs), dtype=np.float32)
+        self.terminated = np.zeros((num_steps, num_envs), dtype=bool)
+        self.action_masks = np.zeros((num_steps, num_envs, (ACTION_SPACE_SIZE + 7) // 8), dtype=np.uint8)
+
+    def __len__(self):
+        return self.num_steps if self.full else self.step
+
+    def add(
+        self,
+        observations: SparseBattleFeatures,
+        actions: np.ndarray,
+        rewards: np.ndarray,
+        terminated: np.ndarray,
+        action_masks: Optional[np.ndarray] = None,
+    ):
+        for stored, field in zip(self.observations, compact(observations)):
+            stored[self.step] = field
+
+        self.actions[self.step] = actions
+        self.rewards[self.step] = rewards
+        self.terminated[self.step] = terminated
+        if action_masks is not None:
+            self.action_masks[self.step] = np.packbits(action_masks, axis=-1)
+
+        self.step = (self.step + 1) % self.num_steps
+        self.full = self.full or self.step == 0
+
+    def features(self, steps, envs=slice(None)) -> SparseBattleFeatures:
+        """Sparse features of the selected timesteps, ready for TimestepEncoder.forward_sparse()."""
+        return expand(CompactFeatures(*[field[steps, envs] for field in self.observations]))
+
+    def action_mask(self, steps, envs=slice(None)) -> np.ndarray:
+        return np.unpackbits(self.action_masks[steps, envs], axis=-1, count=ACTION_SPACE_SIZE).astype(bool)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [*self.observations, self.actions, self.rewards, self.terminated, self.action_masks]
+        return sum(array.nbytes for array in arrays)
+
+
+if __name__ == '__main__':
+    import torch
+    from agent.benchmarks.fixtures import make_battles
+    from agent.model import get_encoder
+    from agent.model.feature_encoder import ENCODING_FEATURES
+    from agent.model.sparse import SparseFeaturizer
+
+    encoder = get_encoder()
+    featurizer = SparseFeaturizer(encoder.lookup)
+    battles = make_battles(8)
+
+    buffer = RolloutBuffer(num_steps=128, num_envs=len(battles))
+    for _ in range(buffer.num_steps):
+        buffer.add(featurizer.featurize_batch(battles), np.zeros(len(battles)), np.zeros(len(battles)), np.zeros(len(battles), dtype=bool))
+
+    with torch.no_grad():
+        dense = encoder.forward_batch(battles)
+        rebuilt = encoder.forward_sparse(buffer.features(0))
+
+    per_step = buffer.nbytes / (buffer.num_steps * buffer.num_envs)
+    print(f'{per_step:.0f} bytes per step vs {4 * ENCODING_FEATURES} dense ({4 * ENCODING_FEATURES / per_step:.0f}x)')
+    print(f'max abs difference of the rebuilt encoding: {(dense - rebuilt).abs().max().item():.2e}')
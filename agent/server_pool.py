@@ -0,0 +1,186 @@
+"""
+Pool of local headless Showdown servers, one node process each:
+
+    python -m agent.server_pool --servers 8
+
+Players and environments are spread over the servers with pool.configuration(i),
+so battles are not bottlenecked by the event loop of a single node process.
+"""
+
+import argparse
+import os
+import socket
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from poke_env.ps_client.server_configuration import LocalhostServerConfiguration, ServerConfiguration
+
+
+SHOWDOWN_PATH = Path(__file__).parents[1] / 'modules' / 'pokemon-showdown'
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+
+class ShowdownServer:
+    def __init__(self, port: int, path: Path = SHOWDOWN_PATH, log: Optional[str] = None):
+        self.port = port
+        self.path = path
+        self.log = log
+        self.process: Optional[subprocess.Popen] = None
+        self.output = None
+        self.restarts = 0
+
+    @property
+    def configuration(self) -> ServerConfiguration:
+        return ServerConfiguration(
+            f'ws://localhost:{self.port}/showdown/websocket',
+            LocalhostServerConfiguration.authentication_url,
+        )
+
+    def start(self):
+        # a crashed server being restarted still holds the log of its last run
+        self._close_log()
+        self.output = open(self.log, 'ab') if self.log else None
+        self.process = subprocess.Popen(
+            ['node', 'pokemon-showdown', 'start', '--no-security', str(self.port)],
+            cwd=self.path, stdout=self.output or subprocess.DEVNULL, stderr=subprocess.STDOUT, start_new_session=True,
+        )
+
+    def _close_log(self):
+        if self.output is not None:
+            self.output.close()
+            self.output = None
+
+    def running(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def healthy(self, timeout: float = 1.0) -> bool:
+        if not self.running():
+            return False
+        try:
+            with socket.create_connection(('localhost', self.port), timeout=timeout):
+                return True
+        except OSError:
+            return False
+
+    def wait_until_healthy(self, timeout: float = 60.0):
+        deadline = time.monotonic() + timeout
+        while not self.healthy():
+            if not self.running():
+                raise Exception(f'Showdown server on port {self.port} exited with code {self.process.returncode}')
+            if time.monotonic() > deadline:
+                raise Exception(f'Showdown server on port {self.port} not listening after {timeout}s')
+            time.sleep(0.2)
+
+    def stop(self, timeout: float = 10.0):
+        if self.running():
+            self.process.terminate()
+            try:
+                self.process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self._close_log()
+
+
+class ServerPool:
+    """
+    Starts `num_servers` Showdown servers on free ports and restarts any that
+    crash. Usable as a context manager:
+
+        with ServerPool(4) as pool:
+            env = BattleVectorEnv(64, server_configuration=pool.configuration(0))
+    """
+
+    def __init__(
+        self,
+        num_servers: int = os.cpu_count() or 1,
+        ports: Optional[List[int]] = None,
+        path: Path = SHOWDOWN_PATH,
+        log_dir: Optional[str] = None,
+        check_interval: float = 5.0,
+    ):
+        ports = ports or [free_port() for _ in range(num_servers)]
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+
+        self.path = path
+        self.servers = [
+            ShowdownServer(port, path, log=f'{log_dir}/showdown-{port}.log' if log_dir else None)
+            for port in ports
+        ]
+        self.check_interval = check_interval
+        self._stopped = threading.Event()
+        self._monitor: Optional[threading.Thread] = None
+
+    def __len__(self):
+        return len(self.servers)
+
+    def configuration(self, i: int) -> ServerConfiguration:
+        """Server of the i-th player or environment, round robin over the pool."""
+        return self.servers[i % len(self.servers)].configuration
+
+    @property
+    def configurations(self) -> List[ServerConfiguration]:
+        return [server.configuration for server in self.servers]
+
+    def start(self, timeout: float = 120.0):
+        # built once up front, otherwise every instance would try to build the same files on start
+        subprocess.run(['node', 'build'], cwd=self.path, check=True, stdout=subprocess.DEVNULL)
+
+        for server in self.servers:
+            server.start()
+        for server in self.servers:
+            server.wait_until_healthy(timeout)
+
+        self._stopped.clear()
+        self._monitor = threading.Thread(target=self._watch, daemon=True)
+        self._monitor.start()
+        return self
+
+    def _watch(self):
+        while not self._stopped.wait(self.check_interval):
+            for server in self.servers:
+                if not server.running():
+                    server.restarts += 1
+                    server.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._monitor is not None:
+            self._monitor.join()
+        for server in self.servers:
+            server.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a pool of local Showdown servers')
+    parser.add_argument('--servers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--base-port', type=int, help='use consecutive ports from this one instead of free ports')
+    parser.add_argument('--log-dir', help='write the output of every server to this directory')
+    args = parser.parse_args()
+
+    ports = list(range(args.base_port, args.base_port + args.servers)) if args.base_port else None
+    with ServerPool(args.servers, ports=ports, log_dir=args.log_dir) as pool:
+        for server in pool.servers:
+            print(f'showdown listening on {server.configuration.websocket_url}')
+
+        try:
+            while True:
+                time.sleep(60)
+                print(f'restarts: {[server.restarts for server in pool.servers]}')
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,43 @@
+// Runs many battles in one node process for agent/simulator.py
+//
+//   node agent/simulator.js modules/pokemon-showdown
+//
+// Every stdin line is `<battle id>\t<simulator command>` and every stdout line is
+// `<battle id>\t<json encoded output chunk>` of that battle's BattleStream.
+
+const path = require('path');
+const readline = require('readline');
+const {BattleStream} = require(path.resolve(process.argv[2], 'dist/sim'));
+
+const battles = new Map();
+
+async function forward(id, stream) {
+	for await (const chunk of stream) {
+		process.stdout.write(`${id}\t${JSON.stringify(chunk)}\n`);
+		if (chunk.startsWith('end\n')) break;
+	}
+	battles.delete(id);
+}
+
+readline.createInterface({input: process.stdin}).on('line', line => {
+	const tab = line.indexOf('\t');
+	const id = line.slice(0, tab);
+	const command = line.slice(tab + 1);
+
+	let stream = battles.get(id);
+	if (command === '>destroy') {
+		// battles that already ended are gone
+		if (stream) {
+			battles.delete(id);
+			void stream.writeEnd();
+		}
+		return;
+	}
+
+	if (!stream) {
+		stream = new BattleStream();
+		battles.set(id, stream);
+		void forward(id, stream);
+	}
+	void stream.write(command);
+});
@@ -0,0 +1,229 @@
+"""
+Battles without a server: players are driven by `node agent/simulator.js`
+processes that run Showdown's BattleStream directly, many battles per process.
+There is no login, challenge or websocket, the protocol of each battle is fed
+straight into the players' poke-env Battles.
+
+    simulator = Simulator(num_processes=4)
+    await simulator.battle_against(player, opponent, n_battles=100)
+
+Players should be created with start_listening=False.
+"""
+
+import asyncio
+import itertools
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from poke_env.concurrency import handle_threaded_coroutines
+from poke_env.player import Player
+
+from agent.server_pool import SHOWDOWN_PATH
+from agent.tracing import span
+
+
+SIMULATOR_SCRIPT = Path(__file__).parent / 'simulator.js'
+SIDES = ['p1', 'p2']
+
+
+def side_view(lines: List[str], side: str) -> List[str]:
+    """The lines of an update seen by `side`, |split| sections keep the private line for their owner only."""
+    view, i = [], 0
+    while i < len(lines):
+        if lines[i].startswith('|split|'):
+            view.append(lines[i + 1] if lines[i][len('|split|'):] == side else lines[i + 2])
+            i += 3
+        else:
+            view.append(lines[i])
+            i += 1
+    return view
+
+
+def to_command(message: str, side: str) -> Optional[str]:
+    """Simulator command for a message poke-env would send to the battle room."""
+    if message.startswith('/choose '):
+        return f'>{side} {message[len("/choose "):]}'
+    if message.startswith('/team '):
+        return f'>{side} team {message[len("/team "):]}'
+    if message == '/forfeit':
+        return f'>forfeit {side}'
+    return None                                                 # ex. /timer, nothing to do without a server
+
+
+class SimulatedBattle:
+    def __init__(self, id: str, battle_format: str, players: List[Player], process: 'SimulatorProcess'):
+        self.id = id
+        self.tag = f'battle-{battle_format}-{id}'
+        self.format = battle_format
+        self.players = dict(zip(SIDES, players))
+        self.process = process
+        self.queues: Dict[str, asyncio.Queue] = {side: asyncio.Queue() for side in SIDES}
+
+    def side_of(self, player: Player) -> str:
+        return next(side for side, other in self.players.items() if other is player)
+
+    def dispatch(self, chunk: str):
+        kind, _, body = chunk.partition('\n')
+        if kind == 'update':
+            lines = body.split('\n')
+            for side in SIDES:
+                self.queues[side].put_nowait(side_view(lines, side))
+        elif kind == 'sideupdate':
+            side, _, body = body.partition('\n')
+            self.queues[side].put_nowait(body.split('\n'))
+        elif kind == 'end':
+            for side in SIDES:
+                self.queues[side].put_nowait(None)
+
+    async def _feed(self, side: str):
+        # messages of a battle are handled in order, like poke-env does for one websocket room
+        player = self.players[side]
+        await player._handle_battle_message([[f'>{self.tag}'], ['', 'init', 'battle']])
+
+        while (lines := await self.queues[side].get()) is not None:
+            await player._handle_battle_message([[f'>{self.tag}'], *[line.split('|') for line in lines]])
+
+    async def play(self):
+        self.process.send(self.id, f'>start {json.dumps({"formatid": self.format})}')
+        for side, player in self.players.items():
+            options = {'name': player.username}
+            if (team := player.next_team) is not None:
+                options['team'] = team
+            self.process.send(self.id, f'>player {side} {json.dumps(options)}')
+
+        try:
+            await asyncio.gather(*[self._feed(side) for side in SIDES])
+        finally:
+            self.process.send(self.id, '>destroy')
+
+
+class SimulatorProcess:
+    def __init__(self, path: Path = SHOWDOWN_PATH):
+        self.path = path
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.battles: Dict[str, SimulatedBattle] = {}
+        self.reader: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            'node', str(SIMULATOR_SCRIPT), str(self.path),
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            limit=2 ** 24,                                      # chunks hold whole requests
+        )
+        self.reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        async for line in self.process.stdout:
+            id, _, chunk = line.decode().rstrip('\n').partition('\t')
+            battle = self.battles.get(id)
+            if battle is not None:
+                battle.dispatch(json.loads(chunk))
+
+        # the process died, end its battles instead of waiting on them forever
+        for battle in list(self.battles.values()):
+            battle.dispatch('end\n')
+
+    def send(self, id: str, command: str):
+        if self.process.stdin.is_closing():
+            return
+        self.process.stdin.write(f'{id}\t{command}\n'.encode())
+
+    async def play(self, battle: SimulatedBattle):
+        self.battles[battle.id] = battle
+        try:
+            await battle.play()
+        finally:
+            del self.battles[battle.id]
+
+    async def close(self):
+        if self.process is not None and self.process.returncode is None:
+            self.process.stdin.close()
+            await self.process.wait()
+        if self.reader is not None:
+            await self.reader
+
+
+class Simulator:
+    """
+    Pool of simulator processes, each battle goes to the process with the
+    fewest running battles. Coroutines run on poke-env's loop like the ones
+    of Player.
+    """
+
+    def __init__(self, num_processes: int = os.cpu_count() or 1, path: Path = SHOWDOWN_PATH):
+        self.processes = [SimulatorProcess(path) for _ in range(num_processes)]
+        self.ids = itertools.count()
+        self.routes: Dict[str, SimulatedBattle] = {}
+        self.started: Optional[asyncio.Future] = None
+
+    def attach(self, player: Player):
+        """Sends the player's battle room messages to the simulator instead of its websocket."""
+        async def send_message(message: str, room: str = '', message_2: Optional[str] = None):
+            battle = self.routes.get(room)
+            if battle is None:
+                return
+            command = to_command(message, battle.side_of(player))
+            if command is not None:
+                with span('send', room, lambda: {'player': player.username}):
+                    battle.process.send(battle.id, command)
+
+        player.ps_client.send_message = send_message            # type: ignore
+
+    async def _start(self):
+        if self.started is None:
+            self.started = asyncio.ensure_future(asyncio.gather(*[process.start() for process in self.processes]))
+        await self.started
+
+    async def _battle(self, player: Player, opponent: Player) -> str:
+        await self._start()
+        process = min(self.processes, key=lambda process: len(process.battles))
+        battle = SimulatedBattle(str(next(self.ids)), player.format, [player, opponent], process)
+
+        self.routes[battle.tag] = battle
+        try:
+            await process.play(battle)
+        finally:
+            del self.routes[battle.tag]
+        return battle.tag
+
+    async def _battle_against(self, player: Player, opponent: Player, n_battles: int, concurrency: Optional[int]):
+        for p in [player, opponent]:
+            self.attach(p)
+
+        # players block new battles past their max_concurrent_battles, both have to be within it
+        limits = [p._max_concurrent_battles for p in [player, opponent] if p._max_concurrent_battles > 0]
+        semaphore = asyncio.Semaphore(concurrency or min(limits, default=n_battles))
+
+        async def battle():
+            async with semaphore:
+                return await self._battle(player, opponent)
+
+        return await asyncio.gather(*[battle() for _ in range(n_battles)])
+
+    async def battle_against(self, player: Player, opponent: Player, n_battles: int = 1, concurrency: Optional[int] = None) -> List[str]:
+        """Plays n_battles between the two players, returns the battle tags."""
+        return await handle_threaded_coroutines(self._battle_against(player, opponent, n_battles, concurrency))
+
+    async def close(self):
+        async def close():
+            await asyncio.gather(*[process.close() for process in self.processes])
+        await handle_threaded_coroutines(close())
+
+
+if __name__ == '__main__':
+    import time
+    from poke_env import RandomPlayer
+
+    player = RandomPlayer(battle_format='gen9randombattle', max_concurrent_battles=64, start_listening=False)
+    opponent = RandomPlayer(battle_format='gen9randombattle', max_concurrent_battles=64, start_listening=False)
+
+    async def main(n_battles):
+        simulator = Simulator()
+        start = time.perf_counter()
+        await simulator.battle_against(player, opponent, n_battles)
+        print(f'{n_battles / (time.perf_counter() - start):.1f} battles/s, won {player.n_won_battles} / {n_battles}')
+        await simulator.close()
+
+    asyncio.run(main(1000))
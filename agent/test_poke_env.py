@@ -5,19 +5,24 @@ from poke_env.player import Player
 from poke_env.environment.battle import Battle
 from poke_env.player.battle_order import BattleOrder
 
-from agent.model.timestep_encoder import TimestepEncoder
+from agent.damage import DamageEngine
+from agent.model import DATA_PATH, get_encoder
 
 from teams import team_1, team_2
 
-encoder = TimestepEncoder('../data')
 
 class MaxDamagePlayer(Player):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.damage = DamageEngine(DATA_PATH)
+
     def choose_move(self, battle: Battle):
-        features = encoder(battle)
+        features = get_encoder()(battle)
         print(features.shape)
 
         if battle.available_moves:
-            best_move = max(battle.available_moves, key=lambda move: move.base_power)
+            expected = self.damage.battle_damage(battle).expected[0]
+            best_move = battle.available_moves[int(expected.argmax())]
 
             if battle.can_tera:
                 return self.create_order(best_move, terastallize=True)
@@ -27,11 +32,12 @@ class MaxDamagePlayer(Player):
             return self.choose_random_move(battle)
 
 
-player = MaxDamagePlayer(battle_format="gen9ou", team=team_1)
-random_player = RandomPlayer(battle_format="gen9ou", team=team_2)
+if __name__ == '__main__':
+    player = MaxDamagePlayer(battle_format="gen9ou", team=team_1)
+    random_player = RandomPlayer(battle_format="gen9ou", team=team_2)
 
-n_battles = 1
-asyncio.run(player.battle_against(random_player, n_battles=n_battles))
+    n_battles = 1
+    asyncio.run(player.battle_against(random_player, n_battles=n_battles))
 
-print(f"Max damage player won {player.n_won_battles} / {n_battles} battles")
+    print(f"Max damage player won {player.n_won_battles} / {n_battles} battles")
 
@@ -0,0 +1,258 @@
+"""
+Lightweight tracing of the decision pipeline.
+
+    from agent import tracing
+
+    tracing.enable()
+    tracing.trace_player(player)            # receive / choose_move / send spans of every battle
+    ...
+    tracing.export_chrome('trace.json')     # open in ui.perfetto.dev or chrome://tracing
+    print(tracing.summary())                # rolling p50 / p95 / p99 of every span
+
+Spans given a battle go on a track of that battle, as do the spans nested
+in them (in the same thread or asyncio task), so every turn reads as
+receive > choose_move > decide > featurize / encode (species, individual,
+pokemon_state, battle_state) > policy > send.
+
+While tracing is disabled span() returns a shared no-op context manager,
+which costs about as much as a function call. Args that take work to build
+are given as a function returning them, called only while tracing:
+
+    with tracing.span('send', room, lambda: {'player': player.username}):
+
+Setting AGENT_TRACE=trace.json enables tracing at import and exports there
+when the process exits.
+"""
+
+import atexit
+import contextlib
+import json
+import os
+import threading
+import time
+import numpy as np
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, Optional, Union
+
+if TYPE_CHECKING:
+    from poke_env.player import Player
+
+
+_NULL_SPAN = contextlib.nullcontext()
+
+SpanArgs = Optional[Union[dict, Callable[[], dict]]]
+
+# battle of the innermost span, per thread and asyncio task
+_track: ContextVar[Optional[str]] = ContextVar('track', default=None)
+
+
+class Span:
+    __slots__ = ('tracer', 'name', 'battle', 'args', 'track', 'token', 'start')
+
+    def __init__(self, tracer: 'Tracer', name: str, battle: Optional[str], args: Optional[dict]):
+        self.tracer = tracer
+        self.name = name
+        self.battle = battle
+        self.args = args
+
+    def __enter__(self):
+        if self.battle is not None:
+            self.track = self.battle
+            self.token = _track.set(self.battle)
+        else:
+            self.track = _track.get() or threading.current_thread().name
+            self.token = None
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer._record(self, time.perf_counter_ns() - self.start)
+        if self.token is not None:
+            _track.reset(self.token)
+
+
+class Tracer:
+    """Keeps the last `max_events` spans for export and the last `window` durations of every span name."""
+
+    def __init__(self, max_events: int = 1_000_000, window: int = 10_000):
+        self.events = deque(maxlen=max_events)
+        self.durations: Dict[str, deque] = defaultdict(lambda: deque(maxlen=window))
+
+    def span(self, name: str, battle: Optional[str] = None, args: SpanArgs = None) -> Span:
+        return Span(self, name, battle, args() if callable(args) else args)
+
+    def _record(self, span: Span, duration: int):
+        # deque appends are atomic, spans are recorded from any thread without a lock
+        self.events.append((span.name, span.track, span.start, duration, span.args))
+        self.durations[span.name].append(duration)
+
+    def summary(self) -> Dict[str, dict]:
+        summary = {}
+        for name, durations in list(self.durations.items()):
+            ms = np.array(durations) / 1e6
+            summary[name] = {
+                'count': len(ms),
+                'mean_ms': float(ms.mean()),
+                'p50_ms': float(np.percentile(ms, 50)),
+                'p95_ms': float(np.percentile(ms, 95)),
+                'p99_ms': float(np.percentile(ms, 99)),
+            }
+        return summary
+
+    def histogram(self, name: str, bins: int = 20) -> tuple:
+        """(counts, edges in ms) of the recent durations of a span, with log-spaced bins."""
+        ms = np.array(self.durations[name]) / 1e6
+        if len(ms) == 0:
+            return np.zeros(bins, dtype=np.int64), np.zeros(bins + 1)
+        edges = np.geomspace(max(ms.min(), 1e-3), max(ms.max(), 2e-3), bins + 1)
+        return np.histogram(ms, edges)
+
+    def chrome_trace(self) -> dict:
+        pid = os.getpid()
+        tracks: Dict[str, int] = {}
+        events = []
+        for name, track, start, duration, args in list(self.events):
+            tid = tracks.setdefault(track, len(tracks))
+            event = {'name': name, 'ph': 'X', 'ts': start / 1000, 'dur': duration / 1000, 'pid': pid, 'tid': tid}
+            if args:
+                event['args'] = args
+            events.append(event)
+
+        metadata = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': track}}
+            for track, tid in tracks.items()
+        ]
+        return {'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}
+
+    def export_chrome(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+    def clear(self):
+        self.events.clear()
+        self.durations.clear()
+
+
+_tracer: Optional[Tracer] = None
+
+
+def span(name: str, battle: Optional[str] = None, args: SpanArgs = None):
+    """Context manager timing its body, a no-op while tracing is disabled (args, when a function, is not called)."""
+    if _tracer is None:
+        return _NULL_SPAN
+    return _tracer.span(name, battle, args)
+
+
+def enable(max_events: int = 1_000_000, window: int = 10_000) -> Tracer:
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(max_events, window)
+    return _tracer
+
+
+def disable():
+    global _tracer
+    _tracer = None
+
+
+def get_tracer() -> Optional[Tracer]:
+    return _tracer
+
+
+def summary() -> Dict[str, dict]:
+    return _tracer.summary() if _tracer is not None else {}
+
+
+def export_chrome(path: str):
+    if _tracer is not None:
+        _tracer.export_chrome(path)
+
+
+# ----------------
+# PLAYERS
+# ----------------
+def trace_player(player: 'Player') -> 'Player':
+    """
+    Adds receive (message handling, poke-env state updates and the decision
+    when the message is a request), choose_move and send spans to the player.
+    Players without a websocket (ex. attached to a Simulator) get their send
+    spans from where their messages are routed.
+    """
+    handle_battle_message = player._handle_battle_message
+    choose_move = player.choose_move
+    send_message = player.ps_client.send_message
+
+    async def traced_handle_battle_message(split_messages):
+        with span('receive', split_messages[0][0].lstrip('>'), lambda: {'messages': len(split_messages) - 1}):
+            await handle_battle_message(split_messages)
+
+    async def traced_choose_move(battle):
+        with span('choose_move', battle.battle_tag, lambda: {'turn': battle.turn}):
+            order = choose_move(battle)
+            if isinstance(order, Awaitable):
+                order = await order
+            return order
+
+    async def traced_send_message(message: str, room: str = '', message_2: Optional[str] = None):
+        with span('send', room or None):
+            await send_message(message, room, message_2)
+
+    player._handle_battle_message = traced_handle_battle_message           # type: ignore
+    player.ps_client._handle_battle_message = traced_handle_battle_message  # type: ignore
+    player.choose_move = traced_choose_move                                 # type: ignore
+    if hasattr(player.ps_client, '_listening_coroutine'):
+        player.ps_client.send_message = traced_send_message                 # type: ignore
+    return player
+
+
+if os.environ.get('AGENT_TRACE'):
+    enable()
+    atexit.register(lambda: export_chrome(os.environ['AGENT_TRACE']))
+
+
+if __name__ == '__main__':
+    import torch
+    import torch.nn as nn
+    from agent import tracing                   # not this __main__ module, the one the encoder imports
+    from agent.benchmarks.fixtures import make_battles
+    from agent.model import get_encoder
+    from agent.model.feature_encoder import ENCODING_FEATURES
+    from agent.vector_env import ACTION_SPACE_SIZE
+
+    encoder = get_encoder()
+    policy = nn.Linear(ENCODING_FEATURES, ACTION_SPACE_SIZE)
+    battles = make_battles(16)
+
+    def decide(battle):
+        with tracing.span('decide', battle.battle_tag), torch.no_grad():
+            encoding = encoder(battle)
+            with tracing.span('policy'):
+                policy(encoding)
+
+    def run(iterations: int) -> float:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for battle in battles:
+                decide(battle)
+        return (time.perf_counter() - start) / (iterations * len(battles))
+
+    def span_cost(n: int = 100_000) -> float:
+        start = time.perf_counter()
+        for _ in range(n):
+            with tracing.span('empty'):
+                pass
+        return (time.perf_counter() - start) / n
+
+    run(5)
+    disabled, disabled_span = run(50), span_cost()
+    enabled_span = tracing.enable() and span_cost()
+    tracing.get_tracer().clear()
+    enabled = run(50)
+
+    print(f'{1000 * disabled:.3f} ms per decision without tracing, {1000 * enabled:.3f} ms with')
+    print(f'{1e9 * disabled_span:.0f} ns per span without tracing, {1e9 * enabled_span:.0f} ns with')
+    for name, stats in tracing.summary().items():
+        print(f"{name:>24}: {stats['count']:6d} x {stats['mean_ms']:.3f} ms, p99 {stats['p99_ms']:.3f} ms")
+    tracing.export_chrome('trace.json')
+    print('wrote trace.json')
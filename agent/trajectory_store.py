@@ -0,0 +1,299 @@
+"""
+On-disk trajectory storage for offline training.
+
+TrajectoryWriter streams finished trajectories into fixed-size, append-only
+shards. Each shard is a directory holding one preallocated .npy per field
+(the compact features of agent/rollout_buffer.py, actions, rewards, episode
+ends and packed action masks), an episodes.jsonl of battle metadata and a
+shard.json with the number of steps written so far. Readers only look at
+the committed steps, so shards can be read while they are being written.
+
+TrajectoryDataset memory-maps the shards, serving shuffled minibatches
+without loading them into RAM:
+
+    dataset = TrajectoryDataset('trajectories')
+    loader = DataLoader(dataset, sampler=dataset.batch_sampler(256), batch_size=None, num_workers=4)
+    for batch in loader:
+        encodings = encoder.forward_sparse(batch['features'])
+"""
+
+import json
+import os
+import numpy as np
+import torch
+from torch.utils.data import BatchSampler, Dataset, RandomSampler
+from typing import Dict, List, Optional
+
+from agent.model.sparse import SparseBattleFeatures, empty_sparse_features
+from agent.rollout_buffer import CompactFeatures, compact, expand
+from agent.vector_env import ACTION_SPACE_SIZE
+
+
+# Fields stored next to the compact features
+STEP_FIELDS = {
+    'actions': ((), np.int16),
+    'rewards': ((), np.float32),
+    'terminated': ((), bool),
+    'action_masks': (((ACTION_SPACE_SIZE + 7) // 8,), np.uint8),
+}
+
+
+def field_specs() -> Dict[str, tuple]:
+    """(shape of one step, dtype) of every stored field."""
+    template = compact(empty_sparse_features(1))
+    specs = {name: (field.shape[1:], field.dtype) for name, field in zip(CompactFeatures._fields, template)}
+    return {**specs, **STEP_FIELDS}
+
+
+def _write_json(path: str, data):
+    # replaced atomically so readers never see a partial file
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(f'{path}.tmp', path)
+
+
+class Shard:
+    def __init__(self, path: str, capacity: int):
+        self.path = path
+        self.capacity = capacity
+        self.steps = 0
+
+        os.makedirs(path)
+        self.arrays = {
+            name: np.lib.format.open_memmap(f'{path}/{name}.npy', mode='w+', dtype=dtype, shape=(capacity, *shape))
+            for name, (shape, dtype) in field_specs().items()
+        }
+        self.episodes = open(f'{path}/episodes.jsonl', 'a')
+        self._commit(complete=False)
+
+    def _commit(self, complete: bool):
+        _write_json(f'{self.path}/shard.json', {'steps': self.steps, 'capacity': self.capacity, 'complete': complete})
+
+    def append(self, fields: Dict[str, np.ndarray], metadata: dict):
+        length = len(fields['actions'])
+        for name, array in fields.items():
+            self.arrays[name][self.steps:self.steps + length] = array
+
+        self.episodes.write(json.dumps({**metadata, 'start': self.steps, 'length': length}) + '\n')
+        self.steps += length
+
+    def flush(self):
+        for array in self.arrays.values():
+            array.flush()
+        self.episodes.flush()
+        self._commit(complete=False)
+
+    def close(self):
+        self.flush()
+        self.episodes.close()
+        self._commit(complete=True)
+
+
+class TrajectoryWriter:
+    """
+    Appends trajectories to `directory`/shard-XXXXX, a new shard is started
+    when a trajectory does not fit in the current one. Several writers (ex.
+    one per process) can share a directory with different `prefix`es.
+    """
+
+    def __init__(self, directory: str, shard_steps: int = 2 ** 16, prefix: str = 'shard', flush_every: int = 64):
+        self.directory = directory
+        self.shard_steps = shard_steps
+        self.prefix = prefix
+        self.flush_every = flush_every
+        os.makedirs(directory, exist_ok=True)
+
+        # after the highest existing index, so a gap (ex. a deleted shard) never leads to overwriting one
+        indices = [name[len(prefix) + 1:] for name in os.listdir(directory) if name.startswith(f'{prefix}-')]
+        self.next_shard = max([int(index) + 1 for index in indices if index.isdigit()], default=0)
+        self.shard: Optional[Shard] = None
+        self.unflushed = 0
+
+    def _new_shard(self, capacity: int):
+        if self.shard is not None:
+            self.shard.close()
+        self.shard = Shard(f'{self.directory}/{self.prefix}-{self.next_shard:05d}', capacity)
+        self.next_shard += 1
+
+    def write(
+        self,
+        observations: SparseBattleFeatures,
+        actions: np.ndarray,
+        rewards: np.ndarray,
+        action_masks: Optional[np.ndarray] = None,
+        metadata: Optional[dict] = None,
+    ):
+        """One trajectory of T > 0 steps, observations have a leading (T,) dimension."""
+        length = len(actions)
+        if length == 0:
+            raise ValueError('a trajectory needs at least one step')
+        terminated = np.zeros(length, dtype=bool)
+        terminated[-1] = True
+        action_masks = np.ones((length, ACTION_SPACE_SIZE), dtype=bool) if action_masks is None else action_masks
+
+        fields = {
+            **compact(observations)._asdict(),
+            'actions': actions,
+            'rewards': rewards,
+            'terminated': terminated,
+            'action_masks': np.packbits(action_masks, axis=-1),
+        }
+
+        if self.shard is None or self.shard.steps + length > self.shard.capacity:
+            self._new_shard(max(self.shard_steps, length))
+        self.shard.append(fields, metadata or {})
+
+        self.unflushed += 1
+        if self.unflushed >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if self.shard is not None:
+            self.shard.flush()
+        self.unflushed = 0
+
+    def close(self):
+        if self.shard is not None:
+            self.shard.close()
+            self.shard = None
+
+
+class TrajectoryRecorder:
+    """Collects the steps of every env of a vector env and writes each battle when it ends."""
+
+    def __init__(self, writer: TrajectoryWriter, num_envs: int):
+        self.writer = writer
+        self.steps: List[list] = [[] for _ in range(num_envs)]
+
+    def add(
+        self,
+        observations: SparseBattleFeatures,
+        actions: np.ndarray,
+        rewards: np.ndarray,
+        terminated: np.ndarray,
+        action_masks: Optional[np.ndarray] = None,
+        metadata: Optional[List[dict]] = None,
+    ):
+        """observations are the ones the actions were taken in, metadata is per env and used when it terminates."""
+        for i in range(len(self.steps)):
+            observation = SparseBattleFeatures(*[field[i] for field in observations])
+            mask = action_masks[i] if action_masks is not None else np.ones(ACTION_SPACE_SIZE, dtype=bool)
+            self.steps[i].append((observation, actions[i], rewards[i], mask))
+
+            if terminated[i]:
+                observations_i, actions_i, rewards_i, masks_i = zip(*self.steps[i])
+                self.writer.write(
+                    SparseBattleFeatures(*[np.stack(field) for field in zip(*observations_i)]),
+                    np.array(actions_i), np.array(rewards_i), np.stack(masks_i),
+                    metadata=metadata[i] if metadata is not None else None,
+                )
+                self.steps[i] = []
+
+
+class TrajectoryDataset(Dataset):
+    """
+    Steps of every committed shard in `directory`. Indexing with an array of
+    step indices returns a whole minibatch, which batch_sampler() yields.
+    Shards are memory-mapped lazily, so every DataLoader worker opens its own.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.refresh()
+
+    def refresh(self):
+        """Picks up shards and steps written since the dataset was created."""
+        self.shards, lengths = [], []
+        for name in sorted(os.listdir(self.directory)):
+            path = f'{self.directory}/{name}/shard.json'
+            if not os.path.exists(path):
+                continue
+            with open(path) as f:
+                steps = json.load(f)['steps']
+            if steps > 0:
+                self.shards.append(f'{self.directory}/{name}')
+                lengths.append(steps)
+
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        self.arrays: Dict[int, Dict[str, np.ndarray]] = {}
+
+    def _shard(self, i: int) -> Dict[str, np.ndarray]:
+        if i not in self.arrays:
+            self.arrays[i] = {name: np.load(f'{self.shards[i]}/{name}.npy', mmap_mode='r') for name in field_specs()}
+        return self.arrays[i]
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def __getitem__(self, index) -> dict:
+        indices = np.atleast_1d(np.asarray(index, dtype=np.int64))
+        shards = np.searchsorted(self.offsets, indices, side='right') - 1
+
+        batch = {name: np.empty((len(indices), *shape), dtype=dtype) for name, (shape, dtype) in field_specs().items()}
+        for shard in np.unique(shards):
+            rows = np.flatnonzero(shards == shard)
+            local = indices[rows] - self.offsets[shard]
+            order = np.argsort(local)                           # sorted reads are sequential on disk
+            for name, array in self._shard(shard).items():
+                batch[name][rows[order]] = array[local[order]]
+
+        features = expand(CompactFeatures(*[batch[name] for name in CompactFeatures._fields]))
+        return {
+            'features': SparseBattleFeatures(*[torch.from_numpy(np.ascontiguousarray(field)) for field in features]),
+            'actions': torch.from_numpy(batch['actions'].astype(np.int64)),
+            'rewards': torch.from_numpy(batch['rewards']),
+            'terminated': torch.from_numpy(batch['terminated']),
+            'action_masks': torch.from_numpy(np.unpackbits(batch['action_masks'], axis=-1, count=ACTION_SPACE_SIZE).astype(bool)),
+        }
+
+    def batch_sampler(self, batch_size: int, drop_last: bool = True) -> BatchSampler:
+        return BatchSampler(RandomSampler(range(len(self))), batch_size, drop_last)
+
+    def episodes(self) -> List[dict]:
+        """Metadata of every trajectory, with its global start step."""
+        episodes = []
+        for i, shard in enumerate(self.shards):
+            with open(f'{shard}/episodes.jsonl') as f:
+                for line in f:
+                    episode = json.loads(line)
+                    if episode['start'] + episode['length'] <= self.offsets[i + 1] - self.offsets[i]:
+                        episodes.append({**episode, 'start': int(self.offsets[i] + episode['start'])})
+        return episodes
+
+    def __getstate__(self):
+        # memory maps are reopened in each DataLoader worker
+        return {**self.__dict__, 'arrays': {}}
+
+
+if __name__ == '__main__':
+    import tempfile
+    import time
+    from torch.utils.data import DataLoader
+    from agent.benchmarks.fixtures import make_battles
+    from agent.model import get_encoder
+    from agent.model.sparse import SparseFeaturizer
+
+    encoder = get_encoder()
+    featurizer = SparseFeaturizer(encoder.lookup)
+    battles = make_battles(30)
+
+    with tempfile.TemporaryDirectory() as directory:
+        writer = TrajectoryWriter(directory, shard_steps=1024)
+        start = time.perf_counter()
+        for episode in range(200):
+            observations = featurizer.featurize_batch(battles)
+            writer.write(observations, np.random.randint(0, ACTION_SPACE_SIZE, len(battles)), np.zeros(len(battles)), metadata={'episode': episode})
+        writer.close()
+        print(f'wrote {200 * len(battles)} steps in {time.perf_counter() - start:.2f}s')
+
+        dataset = TrajectoryDataset(directory)
+        loader = DataLoader(dataset, sampler=dataset.batch_sampler(256), batch_size=None, num_workers=2)
+
+        start = time.perf_counter()
+        steps = 0
+        for batch in loader:
+            steps += len(batch['actions'])
+        print(f'read {steps} of {len(dataset)} steps in {len(dataset.shards)} shards in {time.perf_counter() - start:.2f}s')
+
+        with torch.no_grad():
+            print(encoder.forward_sparse(batch['features']).shape)
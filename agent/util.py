@@ -9,4 +9,14 @@ def flatten_list(lst):
             flat.extend(x)
         else:
             flat.append(x)
-    return flat
\ No newline at end of file
+    return flat
+
+
+def make_layout(sizes):
+    """Turns an ordered {name: size} dict into ({name: slice}, total size)."""
+    layout = {}
+    offset = 0
+    for name, size in sizes.items():
+        layout[name] = slice(offset, offset + size)
+        offset += size
+    return layout, offset
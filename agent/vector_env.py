@@ -0,0 +1,318 @@
+import asyncio
+import numpy as np
+import torch
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from gymnasium.spaces import Box, Discrete
+from gymnasium.vector import VectorEnv
+from poke_env import RandomPlayer, to_id_str
+from poke_env.concurrency import POKE_LOOP
+from poke_env.environment.battle import Battle
+from poke_env.player import Player
+from poke_env.player.battle_order import BattleOrder, ForfeitBattleOrder
+from poke_env.ps_client.server_configuration import ServerConfiguration
+
+from agent.model import get_encoder
+from agent.model.feature_encoder import ENCODING_FEATURES
+from agent.simulator import Simulator
+
+
+# 4 moves, 4 moves while terastallizing, 6 switches
+ACTION_SPACE_SIZE = 14
+
+
+def action_to_order(player: Player, action: int, battle: Battle) -> BattleOrder:
+    """Illegal actions fall back to a random legal order."""
+    if 0 <= action < 4 and action < len(battle.available_moves) and not battle.force_switch:
+        return player.create_order(battle.available_moves[action])
+    if 0 <= action - 4 < len(battle.available_moves) and battle.can_tera and not battle.force_switch:
+        return player.create_order(battle.available_moves[action - 4], terastallize=True)
+    if 0 <= action - 8 < len(battle.available_switches):
+        return player.create_order(battle.available_switches[action - 8])
+    return player.choose_random_move(battle)
+
+
+def action_mask(battle: Battle) -> np.ndarray:
+    mask = np.zeros(ACTION_SPACE_SIZE, dtype=bool)
+    if not battle.force_switch:
+        mask[:len(battle.available_moves)] = True
+        if battle.can_tera:
+            mask[4:4 + len(battle.available_moves)] = True
+    mask[8:8 + len(battle.available_switches)] = True
+    return mask
+
+
+def best_action(logits: np.ndarray, battle: Battle, mask: Optional[np.ndarray] = None) -> int:
+    """Legal action with the highest logit."""
+    mask = action_mask(battle) if mask is None else mask
+    return int(np.where(mask, logits, -np.inf).argmax())
+
+
+def best_order(player: Player, logits: np.ndarray, battle: Battle) -> BattleOrder:
+    return action_to_order(player, best_action(logits, battle), battle)
+
+
+def victory_reward(battle: Battle) -> float:
+    if battle.won:
+        return 1.0
+    if battle.lost:
+        return -1.0
+    return 0.0
+
+
+class VectorPlayer(Player):
+    """Player whose decisions are made by a BattleVectorEnv, choose_move returns a future of the order."""
+
+    def __init__(self, env: 'BattleVectorEnv', **kwargs):
+        super().__init__(**kwargs)
+        self.env = env
+
+    def choose_move(self, battle: Battle):
+        return self.env._on_request(battle)
+
+    def _battle_finished_callback(self, battle: Battle):
+        self.env._on_finished(battle)
+
+
+class BattleVectorEnv(VectorEnv):
+    """
+    num_envs concurrent battles of one VectorPlayer against an opponent
+    player, all on poke-env's event loop. step() sends one order per battle,
+    waits until every battle needs a new decision (or ended) and encodes all
+    of them with a single TimestepEncoder call.
+
+    Finished battles are reset within the same step, gymnasium style: the
+    returned observation is the first one of the new battle and the last one
+    of the finished battle is in infos['final_observation'].
+
+    With a Simulator the battles run in its processes instead of on a server,
+    a custom opponent then has to be created with start_listening=False.
+
+    Formats other than random battles need a team. A challenge that does not
+    start a battle within challenge_timeout seconds (ex. rejected by the
+    server) makes reset() / step() raise instead of waiting forever.
+    """
+
+    def __init__(
+        self,
+        num_envs: int,
+        opponent: Optional[Player] = None,
+        encoder=None,
+        battle_format: str = 'gen9randombattle',
+        team=None,
+        reward_fn: Callable[[Battle], float] = victory_reward,
+        server_configuration: Optional[ServerConfiguration] = None,
+        simulator: Optional[Simulator] = None,
+        challenge_timeout: float = 60.0,
+        **player_kwargs,
+    ):
+        if team is None and 'random' not in battle_format:
+            raise ValueError(f'{battle_format} battles need a team')
+
+        super().__init__(
+            num_envs,
+            Box(low=-np.inf, high=np.inf, shape=(ENCODING_FEATURES,), dtype=np.float32),
+            Discrete(ACTION_SPACE_SIZE),
+        )
+        self.encoder = encoder if encoder is not None else get_encoder()
+        self.reward_fn = reward_fn
+        self.loop = POKE_LOOP
+        self.simulator = simulator
+        self.challenge_timeout = challenge_timeout
+
+        self.player = VectorPlayer(
+            self, battle_format=battle_format, team=team, max_concurrent_battles=num_envs,
+            server_configuration=server_configuration, start_listening=simulator is None, **player_kwargs,
+        )
+        self.opponent = opponent or RandomPlayer(
+            battle_format=battle_format, team=team, max_concurrent_battles=num_envs,
+            server_configuration=server_configuration, start_listening=simulator is None,
+        )
+        if simulator is not None:
+            simulator.attach(self.player)
+            simulator.attach(self.opponent)
+
+        # Loop side state, only touched from poke-env's loop
+        self.battles: List[Optional[Battle]] = [None] * num_envs
+        self.slots: Dict[str, int] = {}                         # battle tag -> slot
+        self.orders: Dict[str, asyncio.Future] = {}             # battle tag -> order awaited by poke-env
+        self.waiting: List[Optional[asyncio.Future]] = [None] * num_envs
+        self.free_slots: deque = deque()
+        self.detached: set = set()                              # tags of battles forfeited by reset
+        self.challenges: Optional[asyncio.Queue] = None
+        self.tasks: List[asyncio.Task] = []
+
+        self._actions = None
+        self._obs = torch.zeros((num_envs, ENCODING_FEATURES), dtype=self.encoder.encoder.dtype)
+
+    # ----------------
+    # POKE-ENV CALLBACKS (on the loop)
+    # ----------------
+    def _on_request(self, battle: Battle) -> asyncio.Future:
+        if battle.battle_tag in self.detached:
+            order = self.loop.create_future()
+            order.set_result(ForfeitBattleOrder())
+            return order
+
+        if battle.battle_tag not in self.slots:
+            self.slots[battle.battle_tag] = self.free_slots.popleft()
+        slot = self.slots[battle.battle_tag]
+
+        self.battles[slot] = battle
+        order = self.orders[battle.battle_tag] = self.loop.create_future()
+        self._resolve(slot)
+        return order
+
+    def _on_finished(self, battle: Battle):
+        slot = self.slots.pop(battle.battle_tag, None)
+        self.detached.discard(battle.battle_tag)
+
+        # an order still awaited by poke-env will never be sent
+        order = self.orders.pop(battle.battle_tag, None)
+        if order is not None and not order.done():
+            order.cancel()
+
+        if slot is not None:
+            self.battles[slot] = battle
+            self._resolve(slot)
+
+    def _resolve(self, slot: int):
+        # battles that end while waiting on our decision (ex. forfeits) are picked up in step
+        if self.waiting[slot] is not None and not self.waiting[slot].done():
+            self.waiting[slot].set_result(None)
+
+    # ----------------
+    # BATTLES (on the loop)
+    # ----------------
+    async def _simulate_loop(self):
+        battles = set()
+        while True:
+            await self.challenges.get()
+            battle = self.loop.create_task(self.simulator._battle(self.player, self.opponent))
+            battles.add(battle)
+            battle.add_done_callback(battles.discard)
+
+    async def _challenge_loop(self):
+        # showdown only allows one pending challenge per user, so they are sent one at a time
+        opponent = to_id_str(self.opponent.username)
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(self.player.ps_client.logged_in.wait(), self.opponent.ps_client.logged_in.wait()),
+                self.challenge_timeout,
+            )
+        except asyncio.TimeoutError:
+            self._fail(RuntimeError(f'The players did not log in to {self.player.ps_client.websocket_url} within {self.challenge_timeout:.0f}s'))
+            return
+
+        while True:
+            await self.challenges.get()
+            await self.player.ps_client.challenge(opponent, self.player.format, self.player.next_team)
+            try:
+                # released by poke-env once the battle exists
+                await asyncio.wait_for(self.player._battle_semaphore.acquire(), self.challenge_timeout)
+            except asyncio.TimeoutError:
+                self._fail(RuntimeError(
+                    f'No {self.player.format} battle started {self.challenge_timeout:.0f}s after challenging '
+                    f'{opponent}, the server probably rejected the challenge (format or team)'
+                ))
+                return
+
+    def _fail(self, error: Exception):
+        # wakes up reset / step with the error, the env can not be used after
+        for waiting in self.waiting:
+            if waiting is not None and not waiting.done():
+                waiting.set_exception(error)
+
+    def _start_battle(self, slot: int):
+        self.battles[slot] = None
+        self.waiting[slot] = self.loop.create_future()
+        self.free_slots.append(slot)
+        self.challenges.put_nowait(slot)
+
+    async def _reset(self):
+        if not self.tasks and self.simulator is not None:
+            self.challenges = asyncio.Queue()
+            self.tasks = [self.loop.create_task(self._simulate_loop())]
+        elif not self.tasks:
+            self.challenges = asyncio.Queue()
+            self.tasks = [
+                self.loop.create_task(self._challenge_loop()),
+                self.loop.create_task(self.opponent.accept_challenges(to_id_str(self.player.username), 10 ** 9)),
+            ]
+
+        # battles still running are forfeited and detached from their slot
+        for slot, battle in enumerate(self.battles):
+            if battle is not None and not battle.finished:
+                self.slots.pop(battle.battle_tag, None)
+                self.detached.add(battle.battle_tag)
+                self._send(slot, ForfeitBattleOrder())
+            self._start_battle(slot)
+
+        await asyncio.gather(*self.waiting)
+
+    def _send(self, slot: int, order: BattleOrder):
+        self.waiting[slot] = self.loop.create_future()
+        future = self.orders.pop(self.battles[slot].battle_tag, None)
+        if future is not None and not future.done():
+            future.set_result(order)
+
+    async def _step(self, actions: np.ndarray):
+        for slot, battle in enumerate(self.battles):
+            if not battle.finished:
+                self._send(slot, action_to_order(self.player, int(actions[slot]), battle))
+        await asyncio.gather(*self.waiting)
+
+        finished = [battle if battle.finished else None for battle in self.battles]
+        for slot, battle in enumerate(finished):
+            if battle is not None:
+                self._start_battle(slot)
+        await asyncio.gather(*self.waiting)
+
+        return finished
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    # ----------------
+    # GYMNASIUM API
+    # ----------------
+    def _encode(self, battles: List[Battle]) -> np.ndarray:
+        # every battle is waiting on an order, so none of them changes while encoding
+        with torch.no_grad():
+            return self.encoder.forward_batch(battles, out=self._obs[:len(battles)]).float().numpy().copy()
+
+    def _infos(self) -> dict:
+        return {'action_mask': np.stack([action_mask(battle) for battle in self.battles])}
+
+    def reset_wait(self, seed=None, options=None):
+        self._run(self._reset())
+        return self._encode(self.battles), self._infos()
+
+    def step_async(self, actions):
+        self._actions = np.asarray(actions)
+
+    def step_wait(self):
+        finished = self._run(self._step(self._actions))
+
+        rewards = np.array([
+            self.reward_fn(final if final is not None else battle) for battle, final in zip(self.battles, finished)
+        ], dtype=np.float32)
+        terminated = np.array([final is not None for final in finished])
+        truncated = np.zeros(self.num_envs, dtype=bool)
+
+        infos = self._infos()
+        if terminated.any():
+            final_observations = np.full(self.num_envs, None, dtype=object)
+            encoded = self._encode([final for final in finished if final is not None])
+            for slot, observation in zip(np.flatnonzero(terminated), encoded):
+                final_observations[slot] = observation
+            infos['final_observation'] = final_observations
+            infos['_final_observation'] = terminated
+
+        return self._encode(self.battles), rewards, terminated, truncated, infos
+
+    def close_extras(self, **kwargs):
+        for task in self.tasks:
+            self.loop.call_soon_threadsafe(task.cancel)
+        self.tasks = []
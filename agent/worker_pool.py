@@ -0,0 +1,94 @@
+"""
+Process pool of battle workers, shared by the league and the evaluation.
+Each process builds one worker at start, which keeps its players and its
+battle backend (a Simulator, or one of the servers of a ServerPool) for
+the whole life of the process.
+
+    class MyWorker(BattleWorker):
+        def play(self, n):
+            return self.battle(self.player, self.opponent, n)
+
+    executor = worker_pool(MyWorker, num_workers, config)
+    executor.submit(call_worker, 'play', 32)
+
+`config` is sent to every process once, so it has to be picklable.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Type
+
+from poke_env.player import Player
+
+
+_worker: Optional['BattleWorker'] = None
+
+
+class BattleWorker:
+    """
+    Reads battle_format, concurrent_battles, server_configurations and
+    showdown_path from `config`. Players built with `player_kwargs` play on
+    this worker's backend.
+    """
+
+    def __init__(self, worker_id: int, config: dict):
+        self.id = worker_id
+        self.config = config
+
+        servers = config['server_configurations']
+        self.player_kwargs = dict(
+            battle_format=config['battle_format'],
+            max_concurrent_battles=config['concurrent_battles'],
+            log_level=logging.WARNING,
+        )
+        if servers:
+            self.player_kwargs['server_configuration'] = servers[worker_id % len(servers)]
+            self.simulator = None
+        else:
+            from agent.simulator import Simulator
+            self.player_kwargs['start_listening'] = False
+            self.simulator = Simulator(num_processes=1, path=config['showdown_path'])
+
+    def battle(self, player: Player, opponent: Player, n_battles: int) -> dict:
+        """Plays n_battles from fresh battle histories, returns the results of `player`."""
+        for p in [player, opponent]:
+            p.reset_battles()
+
+        start = time.perf_counter()
+        if self.simulator is not None:
+            coroutine = self.simulator.battle_against(player, opponent, n_battles, self.config['concurrent_battles'])
+        else:
+            coroutine = player.battle_against(opponent, n_battles)
+        asyncio.run(coroutine)
+
+        battles = list(player.battles.values())
+        return {
+            'worker': self.id,
+            'battles': len(battles),
+            'wins': player.n_won_battles,
+            'losses': player.n_lost_battles,
+            'turns': sum(battle.turn for battle in battles),
+            'seconds': time.perf_counter() - start,
+        }
+
+
+def _init_worker(ids, worker_cls: Type[BattleWorker], config: dict):
+    global _worker
+    _worker = worker_cls(ids.get(), config)
+
+
+def call_worker(method: str, *args):
+    """Runs `method` of this process' worker, submit it to a worker_pool."""
+    return getattr(_worker, method)(*args)
+
+
+def worker_pool(worker_cls: Type[BattleWorker], num_workers: int, config: dict) -> ProcessPoolExecutor:
+    """Spawned processes, each with a worker_cls(worker_id, config) with ids 0 to num_workers - 1."""
+    context = multiprocessing.get_context('spawn')
+    ids = context.Queue()
+    for i in range(num_workers):
+        ids.put(i)
+    return ProcessPoolExecutor(num_workers, mp_context=context, initializer=_init_worker, initargs=(ids, worker_cls, config))
@@ -1,4 +1,4 @@
-
+TOP_N_ABILITIES = 3
 TOP_N_ITEMS = 5
 TOP_N_TERA = 5
 TOP_N_SPREADS = 5
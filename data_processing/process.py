@@ -1,6 +1,7 @@
 from process_raw import process_raw_pokemon, process_raw_items, process_raw_abilities, process_raw_moves
 from process_final import process_final_moves, process_final_pokemon, process_final_items, process_final_abilities
-from process_tensors import process_move_tensors, process_pokemon_tensors, process_ability_tensors, process_item_tensors
+from process_tensors import process_move_tensors, process_pokemon_tensors, process_pokemon_embedding_tensors, process_ability_tensors, process_item_tensors
+from process_bundle import process_bundle
 
 
 data_dir = '../data'
@@ -24,5 +25,7 @@ print("\nPROCESSING POKEMON")
 process_raw_pokemon(data_dir)
 process_final_pokemon(data_dir)
 process_pokemon_tensors(data_dir)
+process_pokemon_embedding_tensors(data_dir)
 
-
+print("\nPROCESSING BUNDLE")
+process_bundle(data_dir)
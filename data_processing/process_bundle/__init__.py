@@ -0,0 +1 @@
+from .process import *
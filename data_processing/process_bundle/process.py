@@ -0,0 +1,13 @@
+from agent.model.packed_lookup import write_bundle
+
+
+def process_bundle(path, debug=False):
+    target = write_bundle(path)
+
+    if debug:
+        print(target)
+
+    print('processed bundle')
+
+if __name__ == '__main__':
+    process_bundle('../../data', debug=True)
@@ -3,7 +3,7 @@ import collections
 import re
 from data_processing.util import type_to_vec, nature_to_vec
 from data_processing.util import get_nested, pad
-from data_processing.consts import TOP_N_ITEMS, TOP_N_TERA, TOP_N_SPREADS, TOP_N_MOVES
+from data_processing.consts import TOP_N_ABILITIES, TOP_N_ITEMS, TOP_N_TERA, TOP_N_SPREADS, TOP_N_MOVES
 
 
 def process_final_pokemon(path):
@@ -21,7 +21,7 @@ def process_final_pokemon(path):
 
     processed_pokemon = {}
     embedding_features = {
-        'nothing': {'abilities': [0] * 3, 'items': [0] * TOP_N_ITEMS, 'moves': [0] * TOP_N_MOVES}
+        'nothing': {'abilities': [0] * TOP_N_ABILITIES, 'items': [0] * TOP_N_ITEMS, 'moves': [0] * TOP_N_MOVES}
     }
 
     for key, data in pokemon.items():
@@ -113,10 +113,11 @@ def process_final_pokemon(path):
         embedding = {
             'abilities': (
                 [ability_lookup[a['name'].lower().translate(trans)] if a else 0 for a in pad(
+                    # some species (ex. rockruff) have more than TOP_N_ABILITIES abilities
                     get_nested(data, ['stats', 'abilities'],
                         default=[{'name': ability} for ability in data['abilities']]
-                    ),
-                    length=3,
+                    )[:TOP_N_ABILITIES],
+                    length=TOP_N_ABILITIES,
                     value=None
                 )]
             ),
@@ -1,5 +1,6 @@
 from .process_moves import *
 from .process_pokemon import *
+from .process_pokemon_embeddings import *
 from .process_abilities import *
 from .process_items import *
 
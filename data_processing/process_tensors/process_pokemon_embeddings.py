@@ -0,0 +1,33 @@
+import json
+import torch
+from data_processing.consts import TOP_N_ABILITIES, TOP_N_ITEMS, TOP_N_MOVES
+
+
+def process_pokemon_embedding_tensors(path, debug=False):
+    """
+    (num pokemon, TOP_N_ABILITIES + TOP_N_ITEMS + TOP_N_MOVES) ability, item and move
+    ids of every species, with the same rows as tensors/pokemon.pt.
+    """
+    with open(f'{path}/lookup/pokemon.json', 'r') as f:
+        pokemon_lookup = json.load(f)
+
+    with open(f'{path}/final/pokemon_embeddings.json', 'r') as f:
+        embeddings = json.load(f)
+
+    num_pokemon = torch.load(f'{path}/tensors/pokemon.pt').size(0)
+    tensors = torch.zeros((num_pokemon, TOP_N_ABILITIES + TOP_N_ITEMS + TOP_N_MOVES), dtype=torch.long)
+
+    for key, num in pokemon_lookup.items():
+        if key in embeddings:
+            embedding = embeddings[key]
+            tensors[num] = torch.tensor(embedding['abilities'] + embedding['items'] + embedding['moves'])
+
+    torch.save(tensors, f'{path}/tensors/pokemon_embeddings.pt')
+
+    if debug:
+        print(tensors.shape)
+
+    print('processed pokemon embedding tensors')
+
+if __name__ == '__main__':
+    process_pokemon_embedding_tensors('../../data', debug=True)
@@ -1,5 +1,3 @@
-from sklearn.decomposition import TruncatedSVD
-import matplotlib.pyplot as plt
 import numpy as np
 
 # Example desired dot products
@@ -25,18 +23,15 @@ M = np.array([
     [1,   0.5, 1,   1,   1,   1,   2,   0.5, 1,   1,   1,   1,   1,   1,   2,   2,   0.5, 1, ], # FAIRY
 ])
 
-svd = TruncatedSVD(n_components=9)
-attack_vecs = svd.fit_transform(M)
-defense_vecs = svd.components_.T
-
-M_hat = attack_vecs @ defense_vecs.T
-
-plt.imshow(M_hat, cmap='coolwarm', vmin=-0, vmax=2)
-plt.savefig('M_hat')
-
-
-
-
+if __name__ == '__main__':
+    from sklearn.decomposition import TruncatedSVD
+    import matplotlib.pyplot as plt
 
+    svd = TruncatedSVD(n_components=9)
+    attack_vecs = svd.fit_transform(M)
+    defense_vecs = svd.components_.T
 
+    M_hat = attack_vecs @ defense_vecs.T
 
+    plt.imshow(M_hat, cmap='coolwarm', vmin=-0, vmax=2)
+    plt.savefig('M_hat')
@@ -1,5 +1,4 @@
 import numpy as np
-import torch
 
 
 def get_nested(d, keys, default=None):
@@ -103,6 +102,8 @@ def flatten_json_to_tensor(data, key_order=None):
     for k in key_order:
         flat_values.extend(collected_dict[k])
 
+    # torch is only needed by the tensors stage, importing it is most of the startup time
+    import torch
     return torch.tensor(flat_values, dtype=torch.float32)
 
 
@@ -0,0 +1,17 @@
+import pytest
+import torch
+
+from agent.benchmarks.fixtures import SCENARIOS, make_battles
+from agent.model import DATA_PATH
+from agent.model.timestep_encoder import TimestepEncoder
+
+
+@pytest.fixture(scope='session')
+def encoder():
+    torch.manual_seed(0)
+    return TimestepEncoder(DATA_PATH)
+
+
+@pytest.fixture(scope='session')
+def battles():
+    return make_battles(2 * len(SCENARIOS))
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+import pytest
+from poke_env.player.battle_order import BattleOrder
+
+from agent.async_player import AsyncPlayer
+
+
+class ScriptedPlayer(AsyncPlayer):
+    """Decides the battle's first move, after waiting on `release` (if set)."""
+
+    def __init__(self, *args, release=None, error=None, **kwargs):
+        super().__init__(*args, battle_format='gen9randombattle', start_listening=False, **kwargs)
+        self.release, self.error = release, error
+
+    def prepare(self, battle):
+        return battle.available_moves[0]
+
+    def decide(self, move):
+        if self.release is not None:
+            self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.create_order(move)
+
+
+def test_incomplete_players_fail_on_creation():
+    class NoDecide(AsyncPlayer):
+        def prepare(self, battle):
+            return None
+
+    with pytest.raises(TypeError):
+        NoDecide(battle_format='gen9randombattle', start_listening=False)
+
+
+def test_decision_is_played(battles):
+    player = ScriptedPlayer()
+    order = asyncio.run(player.choose_move(battles[0]))
+
+    assert isinstance(order, BattleOrder)
+    assert order.order == battles[0].available_moves[0]
+    assert player.fallbacks == 0
+    player.close()
+
+
+def test_timed_out_decision_falls_back(battles):
+    release = threading.Event()
+    player = ScriptedPlayer(release=release, decision_timeout=0.05, max_workers=1, max_pending=1)
+
+    async def decide_twice():
+        timed_out = await player.choose_move(battles[0])
+        # the first decision is still running, past max_pending the fallback is immediate
+        skipped = await player.choose_move(battles[0])
+        return timed_out, skipped
+
+    try:
+        timed_out, skipped = asyncio.run(decide_twice())
+    finally:
+        release.set()
+        player.close()
+
+    assert isinstance(timed_out, BattleOrder) and isinstance(skipped, BattleOrder)
+    assert player.fallbacks == 2
+    assert player.decisions == 2
+
+
+def test_failed_decision_falls_back(battles):
+    player = ScriptedPlayer(error=ValueError('broken policy'))
+    order = asyncio.run(player.choose_move(battles[0]))
+
+    assert isinstance(order, BattleOrder)
+    assert player.fallbacks == 1
+    player.close()
@@ -0,0 +1,133 @@
+"""
+DamageEngine against hand-computed reference values (the games' formula,
+as in the Showdown damage calculator) and against its own multipliers.
+"""
+
+import numpy as np
+import pytest
+
+from agent.damage import DamageEngine, NONE, STATS, STELLAR, TYPES, WEATHERS
+from agent.model import DATA_PATH
+
+
+@pytest.fixture(scope='module')
+def engine():
+    return DamageEngine(DATA_PATH)
+
+
+def single_spread(engine, species: str, evs: dict, nature: dict = None):
+    """Gives the species a single EV spread, so min and max are one matchup."""
+    i = engine.pokemon[species]
+    engine.evs[i] = [evs.get(stat, 0) for stat in STATS]
+    engine.natures[i] = [(nature or {}).get(stat, 1.0) for stat in STATS]
+    engine.spread_frequencies[i] = 0
+    engine.spread_frequencies[i, 0] = 1
+    engine.level_100_stats[i] = engine.stats(engine.base_stats[i][None], engine.evs[i], engine.natures[i], 100)
+    return i
+
+
+def damage(engine, attacker, moves, defender, level=100, **kwargs):
+    """Damage of one matchup, the keyword arguments are given for a batch of 1."""
+    kwargs = {name: np.array([value]) for name, value in kwargs.items()}
+    return engine.damage(
+        np.array([engine.pokemon[attacker]]),
+        np.array([[engine.moves[move] for move in moves]]),
+        np.array([engine.pokemon[defender]]),
+        level=level,
+        **kwargs,
+    )
+
+
+def test_standard_hit_matches_reference_rolls(engine):
+    # 252+ Atk Garchomp Earthquake vs. 252 HP / 0 Def Gholdengo: 374-444 (98.9 - 117.5%)
+    #   Atk 394, HP 378, Def 226
+    #   base = floor(floor(42 * 100 * 394 / 226) / 50) + 2 = 148
+    #   rolls floor(148 * 0.85) = 125 to 148, STAB pokeRound(x * 1.5) 187 to 222, x2 effective 374 to 444
+    attacker = single_spread(engine, 'garchomp', {'atk': 252}, {'atk': 1.1, 'spa': 0.9})
+    defender = single_spread(engine, 'gholdengo', {'hp': 252})
+    assert engine.level_100_stats[attacker, 0, 1] == 394
+    assert engine.level_100_stats[defender, 0, [0, 2]].tolist() == [378, 226]
+
+    result = damage(engine, 'garchomp', ['earthquake'], 'gholdengo')
+
+    # the engine skips the games' intermediate rounding, about 1% on a hit this size
+    assert result.min[0, 0] == pytest.approx(374 / 378, rel=0.02)
+    assert result.max[0, 0] == pytest.approx(444 / 378, rel=0.02)
+
+
+def test_immunities_deal_nothing(engine):
+    result = damage(engine, 'garchomp', ['earthquake'], 'corviknight')
+    assert result.min[0, 0] == result.max[0, 0] == result.expected[0, 0] == 0
+
+    result = damage(engine, 'blissey', ['seismictoss'], 'gengar')
+    assert result.min[0, 0] == result.max[0, 0] == result.expected[0, 0] == 0
+
+    # a defensive tera replaces the defender's types
+    result = damage(engine, 'garchomp', ['earthquake'], 'blissey', defender_tera=TYPES.index('Flying'))
+    assert result.max[0, 0] == 0
+
+
+def test_fixed_damage_is_the_user_level(engine):
+    defender = single_spread(engine, 'blissey', {'hp': 252})
+    hp = engine.level_100_stats[defender, 0, 0]
+
+    result = damage(engine, 'garchomp', ['seismictoss'], 'blissey')
+    assert result.min[0, 0] == result.max[0, 0] == result.expected[0, 0] == pytest.approx(100 / hp)
+
+    hp = engine.species_stats(np.array([defender]), level=50)[0, 0, 0]
+    result = damage(engine, 'garchomp', ['seismictoss'], 'blissey', level=50)
+    assert result.max[0, 0] == pytest.approx(50 / hp)
+
+
+# Earthquake (Ground) and Iron Tail (Steel) are both 100 power physical moves and neutral
+# on Blissey, the highest rolls scale exactly with the modifiers
+@pytest.mark.parametrize('tera, multipliers', [
+    (NONE, [1.5, 1.0]),                             # STAB on Earthquake only
+    (TYPES.index('Ground'), [2.0, 1.0]),            # tera into an original type
+    (TYPES.index('Steel'), [1.5, 1.5]),             # tera into a new type
+    (STELLAR, [2.0, 1.2]),                          # stellar boosts every type once
+])
+def test_stab_and_tera_multipliers(engine, tera, multipliers):
+    moves = ['earthquake', 'irontail']
+    plain = damage(engine, 'garchomp', moves, 'blissey', attacker_tera=NONE)
+    result = damage(engine, 'garchomp', moves, 'blissey', attacker_tera=tera)
+
+    # plain has STAB on Earthquake
+    assert result.max[0] / plain.max[0] == pytest.approx(np.array(multipliers) / [1.5, 1.0])
+
+
+@pytest.mark.parametrize('weather, multipliers', [
+    ('none', [1.0, 1.0]),
+    ('sun', [1.5, 0.5]),
+    ('rain', [0.5, 1.5]),
+    ('sand', [1.0, 1.0]),
+])
+def test_weather_multipliers(engine, weather, multipliers):
+    moves = ['flamethrower', 'surf']
+    plain = damage(engine, 'garchomp', moves, 'blissey')
+    result = damage(engine, 'garchomp', moves, 'blissey', weather=WEATHERS.index(weather))
+
+    assert result.max[0] / plain.max[0] == pytest.approx(multipliers)
+
+
+def test_expected_within_roll_range(engine):
+    # misses and crits (which ignore attack drops and defense boosts) can take the expected
+    # damage out of the no-crit roll range, so only moves that always hit, with the base crit
+    # chance, and boosts crits keep
+    rng = np.random.default_rng(0)
+    candidates = np.flatnonzero((engine.power > 0) & (engine.accuracy == 1) & (engine.crit_chance == engine.crit_chance[engine.moves['earthquake']]))
+    species = np.arange(1, len(engine.base_stats))
+
+    batch = 1024
+    result = engine.damage(
+        rng.choice(species, batch),
+        rng.choice(candidates, (batch, 4)),
+        rng.choice(species, batch),
+        attacker_boosts=rng.integers(0, 3, (batch, 6)),
+        defender_boosts=rng.integers(-2, 1, (batch, 6)),
+        weather=rng.integers(0, len(WEATHERS), batch),
+    )
+
+    assert (result.min >= 0).all()
+    assert (result.min <= result.expected + 1e-9).all()
+    assert (result.expected <= result.max + 1e-9).all()
@@ -0,0 +1,8 @@
+import pytest
+
+from agent.evaluation import evaluate
+
+
+def test_team_required_outside_random_formats():
+    with pytest.raises(ValueError, match='gen9ou battles need a team'):
+        evaluate(candidate=None, num_workers=1, team=None)
@@ -0,0 +1,32 @@
+import torch
+import torch.nn as nn
+
+from agent.model.export import export_torchscript, freeze
+from agent.model.feature_encoder import features_to_tensors, ENCODING_FEATURES
+
+
+def test_freeze_leaves_the_source_trainable(encoder):
+    head = nn.Linear(ENCODING_FEATURES, 4)
+    freeze(encoder.encoder, head)
+
+    assert all(parameter.requires_grad for parameter in encoder.encoder.parameters())
+    assert all(parameter.requires_grad for parameter in head.parameters())
+    assert encoder.encoder.training and head.training
+
+
+def test_static_encoder_matches_encoder(encoder, battles):
+    inputs = features_to_tensors(encoder.featurizer.featurize_batch(battles))
+    with torch.no_grad():
+        expected = encoder.encoder(*inputs)
+        assert torch.allclose(freeze(encoder.encoder)(*inputs), expected, atol=1e-6)
+
+
+def test_torchscript_export_matches_encoder(encoder, battles, tmp_path):
+    inputs = features_to_tensors(encoder.featurizer.featurize_batch(battles))
+    traced = export_torchscript(encoder.encoder, str(tmp_path / 'encoder.pt'))
+    loaded = torch.jit.load(str(tmp_path / 'encoder.pt'))
+
+    with torch.no_grad():
+        expected = encoder.encoder(*inputs)
+        assert torch.allclose(traced(*inputs), expected, atol=1e-6)
+        assert torch.allclose(loaded(*inputs), expected, atol=1e-6)
@@ -0,0 +1,78 @@
+import threading
+import time
+import pytest
+import torch
+import torch.nn as nn
+from concurrent.futures import wait
+
+from agent.inference_server import InferenceServer
+from agent.model.feature_encoder import ENCODING_FEATURES
+from agent.vector_env import ACTION_SPACE_SIZE
+
+
+@pytest.fixture
+def policy():
+    torch.manual_seed(0)
+    return nn.Linear(ENCODING_FEATURES, ACTION_SPACE_SIZE)
+
+
+def test_batches_fill_up_to_max_batch_size(encoder, battles, policy):
+    server = InferenceServer(policy, encoder, max_batch_size=4, max_wait=0.2)
+    features = [server.featurize(battles[i % len(battles)]) for i in range(10)]
+    futures = [server.submit(f) for f in features]
+    outputs = [future.result(timeout=5) for future in futures]
+    server.close()
+
+    assert list(server.stats.batch_sizes) == [4, 4, 2]
+    with torch.no_grad():
+        expected = policy(encoder.forward_sparse(features[0]))[0]
+    assert torch.allclose(outputs[0], expected, atol=1e-5)
+
+
+def test_partial_batch_flushes_after_max_wait(encoder, battles, policy):
+    server = InferenceServer(policy, encoder, max_batch_size=64, max_wait=0.05)
+    features = server.featurize(battles[0])
+
+    start = time.perf_counter()
+    server.submit(features).result(timeout=5)
+    elapsed = time.perf_counter() - start
+    server.close()
+
+    assert list(server.stats.batch_sizes) == [1]
+    assert 0.05 <= elapsed < 1.0
+
+
+def test_close_serves_queued_requests_and_rejects_new_ones(encoder, battles, policy):
+    server = InferenceServer(policy, encoder, max_batch_size=4, max_wait=0.5)
+    futures = [server.submit(server.featurize(battle)) for battle in battles]
+    server.close()
+
+    assert all(future.done() and future.exception() is None for future in futures)
+    with pytest.raises(RuntimeError):
+        server.submit(server.featurize(battles[0])).result(timeout=1)
+    server.close()
+
+
+def test_close_resolves_requests_submitted_while_closing(encoder, battles, policy):
+    server = InferenceServer(policy, encoder, max_batch_size=8, max_wait=0.001)
+    features = server.featurize(battles[0])
+    futures = []
+    started = threading.Barrier(5)
+
+    def submit_while_closing():
+        started.wait()
+        for _ in range(50):
+            futures.append(server.submit(features))
+
+    threads = [threading.Thread(target=submit_while_closing) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    started.wait()
+    server.close()
+    for thread in threads:
+        thread.join()
+
+    # every future is served, or failed because the server closed
+    done, not_done = wait(futures, timeout=5)
+    assert not not_done
+    assert all(future.exception() is None or isinstance(future.exception(), RuntimeError) for future in done)
@@ -0,0 +1,8 @@
+import pytest
+
+from agent.league import League
+
+
+def test_team_required_outside_random_formats():
+    with pytest.raises(ValueError, match='gen9ou battles need a team'):
+        League(policy_fn=lambda: pytest.fail('built before the format was checked'), num_workers=1, team=None)
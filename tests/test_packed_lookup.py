@@ -0,0 +1,50 @@
+import shutil
+import pytest
+import torch
+
+from agent.model import DATA_PATH
+from agent.model.feature_lookup import FeatureLookup
+from agent.model.packed_lookup import PackedLookup, attach_lookup, load_lookup, pack_lookup, publish_lookup, source_hash, write_bundle
+from agent.model.packed_lookup import BUNDLE_SOURCES, VOCABULARIES, TENSORS
+
+
+def test_packed_lookup_matches_feature_lookup():
+    lookup = FeatureLookup(DATA_PATH)
+    packed = PackedLookup(bytearray(pack_lookup(lookup)))
+
+    for name in VOCABULARIES:
+        assert dict(getattr(packed, name)) == dict(getattr(lookup, name)), name
+    for name in TENSORS:
+        assert torch.equal(getattr(packed, name), getattr(lookup, name)), name
+    assert torch.equal(packed.species_components, lookup.species_components)
+
+
+def test_published_lookup_attaches(tmp_path):
+    target = publish_lookup(DATA_PATH, str(tmp_path / 'lookup.bin'))
+    packed = attach_lookup(target)
+
+    assert packed.metadata['source_hash'] == source_hash(DATA_PATH)
+    assert torch.equal(packed.move_tensors, FeatureLookup(DATA_PATH).move_tensors)
+
+
+@pytest.fixture
+def data_copy(tmp_path):
+    for source in BUNDLE_SOURCES:
+        (tmp_path / source).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy(f'{DATA_PATH}/{source}', tmp_path / source)
+    return str(tmp_path)
+
+
+def test_current_bundle_is_loaded(data_copy):
+    write_bundle(data_copy)
+    assert isinstance(load_lookup(data_copy), PackedLookup)
+
+
+def test_stale_bundle_falls_back_to_the_data_files(data_copy):
+    write_bundle(data_copy)
+    with open(f'{data_copy}/lookup/moves.json', 'a') as f:
+        f.write(' ')
+
+    with pytest.warns(UserWarning, match='stale'):
+        assert isinstance(load_lookup(data_copy), FeatureLookup)
+    assert isinstance(load_lookup(data_copy, check=False), PackedLookup)
@@ -0,0 +1,20 @@
+import copy
+import pytest
+import torch
+
+from agent.model.quantize import accuracy, quantize_encoder
+
+
+# int8 keeps one scale per static feature, small values of wide features lose the most
+@pytest.mark.parametrize('storage, tolerance', [(torch.bfloat16, 0.01), (torch.int8, 0.25)])
+def test_reduced_encoding_is_close(encoder, battles, storage, tolerance):
+    reduced = quantize_encoder(copy.deepcopy(encoder.encoder), storage)
+    errors = accuracy(encoder.encoder, reduced, encoder.featurizer.featurize_batch(battles))
+
+    assert errors['finite']
+    assert errors['max_rel_error'] < tolerance
+
+
+def test_float16_is_rejected(encoder):
+    with pytest.raises(ValueError):
+        quantize_encoder(copy.deepcopy(encoder.encoder), torch.float16)
@@ -0,0 +1,23 @@
+import numpy as np
+
+from agent.model.sparse import SparseFeaturizer
+from agent.rollout_buffer import compact, expand, POKEMON_FLAGS, BATTLE_FLAGS
+
+
+def test_compact_round_trip(encoder, battles):
+    sparse = SparseFeaturizer(encoder.lookup).featurize_batch(battles)
+    rebuilt = expand(compact(sparse))
+
+    for name in sparse._fields:
+        expected, actual = getattr(sparse, name), getattr(rebuilt, name)
+        if np.issubdtype(expected.dtype, np.integer):
+            assert np.array_equal(expected, actual), name
+        else:
+            # only the float16 rounding of the numbers is lost
+            assert np.allclose(expected, actual, rtol=1e-3, atol=1e-3), name
+
+
+def test_flag_columns_only_hold_flags(encoder, battles):
+    sparse = SparseFeaturizer(encoder.lookup).featurize_batch(battles)
+    assert np.isin(sparse.pokemon_numeric[..., POKEMON_FLAGS], [0, 1]).all()
+    assert np.isin(sparse.battle_numeric[..., BATTLE_FLAGS], [0, 1]).all()
@@ -0,0 +1,23 @@
+import os
+import shutil
+import pytest
+
+from agent.server_pool import ShowdownServer
+
+
+@pytest.mark.skipif(shutil.which('node') is None or not os.path.isdir('/proc/self/fd'), reason='needs node and /proc')
+def test_restarts_do_not_leak_log_files(tmp_path):
+    # no showdown checkout in tmp_path, every run exits right away
+    server = ShowdownServer(0, tmp_path, log=str(tmp_path / 'showdown.log'))
+    open_files = lambda: len(os.listdir('/proc/self/fd'))
+
+    server.start()
+    server.process.wait()
+    opened = open_files()
+    for _ in range(3):
+        server.start()
+        server.process.wait()
+    assert open_files() == opened
+
+    server.stop()
+    assert server.output is None
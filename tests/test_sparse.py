@@ -0,0 +1,42 @@
+"""
+The sparse observation format, exact against the dense one.
+"""
+
+import subprocess
+import sys
+import pytest
+import torch
+from pathlib import Path
+from poke_env.environment.effect import Effect
+
+from agent.benchmarks.fixtures import make_battles
+from agent.model.feature_encoder import features_to_tensors
+from agent.model.sparse import SparseFeaturizer, MAX_EFFECTS
+
+
+def test_sparse_features_densify_exactly(encoder, battles):
+    dense = encoder.featurizer.featurize_batch(battles)
+    sparse = SparseFeaturizer(encoder.lookup).featurize_batch(battles)
+    densified = encoder.densify(features_to_tensors(sparse))
+
+    for expected, actual in zip(features_to_tensors(dense), densified):
+        assert torch.equal(expected.to(actual.dtype), actual)
+
+
+def test_sparse_encoding_matches_dense(encoder, battles):
+    sparse = SparseFeaturizer(encoder.lookup).featurize_batch(battles)
+    with torch.no_grad():
+        assert torch.allclose(encoder.forward_batch(battles), encoder.forward_sparse(sparse), atol=1e-6)
+
+
+def test_too_many_effects_fail(encoder):
+    battle = make_battles(1)[0]
+    battle.active_pokemon._effects = {effect: 1 for effect in list(Effect)[:MAX_EFFECTS + 1]}
+
+    with pytest.raises(AssertionError):
+        SparseFeaturizer(encoder.lookup).featurize_batch([battle])
+
+
+def test_sparse_featurizer_does_not_import_torch():
+    code = 'import sys, agent.model.sparse; assert "torch" not in sys.modules'
+    subprocess.run([sys.executable, '-c', code], check=True, cwd=Path(__file__).parents[1])
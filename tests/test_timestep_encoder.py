@@ -0,0 +1,132 @@
+"""
+The BattleFeaturizer + FeatureEncoder split against the original
+single-module TimestepEncoder (kept here as the reference), and the
+incremental encoding against the full one.
+"""
+
+import numpy as np
+import torch
+from typing import List, Optional
+from poke_env.environment.battle import Battle, Pokemon
+
+from agent.model.feature_encoder import features_to_tensors
+from agent.model.featurizer import POKEMON_FEATURES
+from agent.model.to_vec import gender_to_vec, effects_to_vec, pokemon_type_to_vec, status_to_vec, weathers_to_vec, fields_to_vec, side_conditions_to_vec
+from agent.util import pad, flatten_list
+
+
+# ----------------
+# REFERENCE
+# ----------------
+def vector(parts) -> torch.Tensor:
+    return torch.tensor(np.concatenate([np.atleast_1d(np.asarray(part, dtype=np.float32)) for part in parts]))
+
+
+def reference_pokemon(encoder, poke: Optional[Pokemon]) -> torch.Tensor:
+    lookup, modules = encoder.lookup, encoder.encoder
+
+    species = poke.species if poke is not None else 'nothing'
+    components = lookup.pokemon_embeddings[species]
+    species_features = torch.cat([
+        modules.pokemon_embeddings(torch.tensor(lookup.pokemon[species])),
+        modules.ability_embeddings(torch.tensor(components['abilities'])).flatten(),
+        modules.item_embeddings(torch.tensor(components['items'])).flatten(),
+        modules.move_embeddings(torch.tensor(components['moves'])).flatten(),
+    ])
+
+    if poke is None:
+        features = torch.zeros(POKEMON_FEATURES)
+    else:
+        features = vector([
+            *[pokemon_type_to_vec(type) for type in pad(poke.types, 3, None)],
+            gender_to_vec(poke.gender),
+            poke.level / 100,
+            poke.current_hp / 500,
+            poke.max_hp / 500,
+            poke.current_hp_fraction,
+            poke.active,
+            *[poke.boosts[boost] / 6 for boost in ['accuracy', 'atk', 'def', 'evasion', 'spa', 'spd', 'spe']],
+            effects_to_vec(poke.effects),
+            poke.first_turn,
+            poke.is_terastallized,
+            pokemon_type_to_vec(poke.tera_type),
+            poke.must_recharge,
+            poke.protect_counter,
+            poke.revealed,
+            *[(poke.stats[stat] or -500) / 500 for stat in ['hp', 'atk', 'def', 'spa', 'spd', 'spe']],
+            status_to_vec(poke.status),
+            poke.status_counter,
+        ])
+
+    ability = lookup.abilities[poke.ability or 'unknown' if poke else 'nothing']
+    moves = [lookup.moves[move] for move in pad(list(poke.moves.keys()) if poke else [], 4, 'unknown')]
+    item = lookup.items[(poke.item or 'unknown' if poke.item != 'unknown_item' else 'unknown') if poke else 'nothing']
+    preparing_move = lookup.moves[poke.preparing_move.id if poke and poke.preparing_move else 'nothing']
+
+    return torch.cat([
+        species_features,
+        features,
+        modules.ability_embeddings(torch.tensor(ability)),
+        modules.move_embeddings(torch.tensor(moves)).flatten(),
+        modules.item_embeddings(torch.tensor(item)),
+        modules.move_embeddings(torch.tensor(preparing_move)),
+    ])
+
+
+def reference_encoding(encoder, battle: Battle) -> torch.Tensor:
+    pokemon: List[Optional[Pokemon]] = flatten_list([
+        battle.active_pokemon,
+        battle.opponent_active_pokemon,
+        pad([poke for poke in battle.available_switches], 5, None),
+        pad([poke for key, poke in battle.opponent_team.items() if not poke.active], 5, None),
+    ])
+
+    battle_state = vector([
+        battle.turn,
+        weathers_to_vec(battle.weather, battle.turn),
+        fields_to_vec(battle.fields, battle.turn),
+        side_conditions_to_vec(battle.opponent_side_conditions, battle.turn),
+        side_conditions_to_vec(battle.side_conditions, battle.turn),
+        battle.reviving,
+        pokemon_type_to_vec(battle.can_tera),
+        battle.opponent_can_tera,
+        battle.force_switch,
+    ])
+
+    return torch.cat([*[reference_pokemon(encoder, poke) for poke in pokemon], battle_state])
+
+
+# ----------------
+# TESTS
+# ----------------
+def test_split_encoding_matches_reference(encoder, battles):
+    with torch.no_grad():
+        expected = torch.stack([reference_encoding(encoder, battle) for battle in battles])
+        split = encoder.encoder(*features_to_tensors(encoder.featurizer.featurize_batch(battles)))
+
+    assert split.shape == expected.shape
+    assert torch.allclose(split, expected, atol=1e-6)
+
+
+def test_differentiable_encoding_matches_reference(encoder, battles):
+    # with gradients the species features are computed instead of read from the species table
+    expected = reference_encoding(encoder, battles[0])
+    encoding = encoder(battles[0])
+
+    assert encoding.requires_grad
+    assert torch.allclose(encoding, expected, atol=1e-6)
+
+
+def test_incremental_encoding_matches_full(encoder, battles):
+    with torch.no_grad():
+        full = encoder.forward_batch(battles)
+        encoder.incremental = True
+        try:
+            first = encoder.forward_batch(battles)
+            cached = encoder.forward_batch(battles)                 # every pokemon row comes from the cache
+        finally:
+            encoder.incremental = False
+            encoder.cache.clear()
+
+    assert torch.allclose(full, first, atol=1e-6)
+    assert torch.allclose(full, cached, atol=1e-6)
@@ -0,0 +1,69 @@
+import json
+import threading
+import pytest
+
+from agent import tracing
+
+
+@pytest.fixture
+def tracer():
+    yield tracing.enable()
+    tracing.disable()
+
+
+def nested_spans(battle):
+    with tracing.span('outer', battle, lambda: {'battle': battle}):
+        with tracing.span('inner'):
+            pass
+
+
+def test_nested_spans_on_two_threads(tracer, tmp_path):
+    threads = [
+        threading.Thread(target=nested_spans, args=('battle-1',), name='battle-thread'),
+        threading.Thread(target=nested_spans, args=(None,), name='plain-thread'),
+    ]
+    for thread in threads:
+        thread.start()
+        thread.join()
+
+    tracing.export_chrome(str(tmp_path / 'trace.json'))
+    with open(tmp_path / 'trace.json') as f:
+        trace = json.load(f)
+
+    # every track gets a name, spans nested in a battle span go on its track, others on their thread's
+    tracks = {event['args']['name']: event['tid'] for event in trace['traceEvents'] if event['ph'] == 'M'}
+    assert set(tracks) == {'battle-1', 'plain-thread'}
+    spans = [event for event in trace['traceEvents'] if event['ph'] == 'X']
+    assert sorted((event['name'], event['tid']) for event in spans) == sorted([
+        ('inner', tracks['battle-1']), ('outer', tracks['battle-1']),
+        ('inner', tracks['plain-thread']), ('outer', tracks['plain-thread']),
+    ])
+
+    for tid in tracks.values():
+        outer, = [event for event in spans if event['tid'] == tid and event['name'] == 'outer']
+        inner, = [event for event in spans if event['tid'] == tid and event['name'] == 'inner']
+        assert outer['ts'] <= inner['ts'] and inner['ts'] + inner['dur'] <= outer['ts'] + outer['dur']
+        assert 'args' not in inner
+    assert {tuple(event['args'].items()) for event in spans if event['name'] == 'outer'} == {(('battle', 'battle-1'),), (('battle', None),)}
+    assert all(isinstance(event['pid'], int) for event in trace['traceEvents'])
+
+    assert tracing.summary()['outer']['count'] == 2
+
+
+def test_lazy_args_only_built_while_tracing(tracer):
+    calls = []
+
+    def args():
+        calls.append(1)
+        return {'built': True}
+
+    tracing.disable()
+    with tracing.span('disabled', args=args):
+        pass
+    assert calls == []
+
+    tracing.enable()
+    with tracing.span('enabled', args=args):
+        pass
+    assert calls == [1]
+    assert [event[0] for event in tracing.get_tracer().events] == ['enabled']
@@ -0,0 +1,60 @@
+import os
+import numpy as np
+import pytest
+
+from agent.model.sparse import SparseBattleFeatures, SparseFeaturizer
+from agent.rollout_buffer import compact, expand
+from agent.trajectory_store import TrajectoryDataset, TrajectoryWriter
+from agent.vector_env import ACTION_SPACE_SIZE
+
+
+def trajectory(features, start, length):
+    rows = np.arange(start, start + length) % len(features.species_ids)
+    observations = SparseBattleFeatures(*[field[rows] for field in features])
+    actions = np.arange(start, start + length) % ACTION_SPACE_SIZE
+    rewards = np.linspace(-1, 1, length).astype(np.float32)
+    masks = np.random.default_rng(start).random((length, ACTION_SPACE_SIZE)) < 0.5
+    return observations, actions, rewards, masks
+
+
+def test_written_trajectories_read_back(encoder, battles, tmp_path):
+    features = SparseFeaturizer(encoder.lookup).featurize_batch(battles)
+    lengths = [3, 4, 2, 3]
+    starts = np.concatenate([[0], np.cumsum(lengths)])[:-1]
+    trajectories = [trajectory(features, start, length) for start, length in zip(starts, lengths)]
+
+    # two trajectories fit in a shard
+    writer = TrajectoryWriter(str(tmp_path), shard_steps=7)
+    for i, t in enumerate(trajectories[:2]):
+        writer.write(*t, metadata={'episode': i})
+    writer.close()
+
+    # a reopened writer appends after the existing shards
+    writer = TrajectoryWriter(str(tmp_path), shard_steps=7)
+    assert writer.next_shard == 1
+    for i, t in enumerate(trajectories[2:], 2):
+        writer.write(*t, metadata={'episode': i})
+    writer.close()
+    assert sorted(os.listdir(tmp_path)) == ['shard-00000', 'shard-00001']
+
+    dataset = TrajectoryDataset(str(tmp_path))
+    assert len(dataset) == sum(lengths)
+    assert [(e['episode'], e['start'], e['length']) for e in dataset.episodes()] == list(zip(range(4), starts, lengths))
+
+    batch = dataset[np.arange(len(dataset))]
+    stored = expand(compact(SparseBattleFeatures(*[np.concatenate(field) for field in zip(*[t[0] for t in trajectories])])))
+    for name, expected in zip(SparseBattleFeatures._fields, stored):
+        assert np.array_equal(getattr(batch['features'], name).numpy(), expected), name
+    assert np.array_equal(batch['actions'].numpy(), np.concatenate([t[1] for t in trajectories]))
+    assert np.array_equal(batch['rewards'].numpy(), np.concatenate([t[2] for t in trajectories]))
+    assert np.array_equal(batch['action_masks'].numpy(), np.concatenate([t[3] for t in trajectories]))
+    assert np.flatnonzero(batch['terminated'].numpy()).tolist() == list(np.cumsum(lengths) - 1)
+
+
+def test_empty_trajectory_fails(encoder, battles, tmp_path):
+    features = SparseFeaturizer(encoder.lookup).featurize_batch(battles)
+    writer = TrajectoryWriter(str(tmp_path))
+    with pytest.raises(ValueError, match='at least one step'):
+        writer.write(*trajectory(features, 0, 0))
+    writer.close()
+    assert len(TrajectoryDataset(str(tmp_path))) == 0